@@ -0,0 +1,109 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Memory use and allocation time of the Cal3d element classes.
+# Builds the synthetic meshes, animations and morph animations of synthetic.py and reports
+# the build time (best of --repeat) and the memory they keep alive, measured with tracemalloc,
+# in total and per element (vertex with its maps and influences, face, keyframe, ...).
+# Meshes are built both ways: "mesh" with Vertex and Face objects and "mesh arrays" in a
+# SubMeshArrays, the way the exporter builds them.
+#
+#   python benchmarks/bench_memory.py
+#   python benchmarks/bench_memory.py --vertices 10000,100000,1000000 --output memory.json
+
+import argparse
+import gc
+import sys
+import tracemalloc
+
+import common
+common.setup_path()
+
+import synthetic
+
+MEGABYTE = 1024.0 * 1024.0
+
+
+# Memory in bytes that the result of build keeps alive
+def retained_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+# List of (name, number of elements, build function)
+def build_cases(vertex_counts, bone_count, keyframe_count):
+    cases = []
+    for vertex_count in vertex_counts:
+        cases.append(("mesh {0} vertices".format(vertex_count), vertex_count,
+                      lambda vertex_count=vertex_count: synthetic.make_mesh(vertex_count)))
+        cases.append(("mesh {0} vertices, 20 morphs".format(vertex_count), vertex_count,
+                      lambda vertex_count=vertex_count: synthetic.make_mesh(vertex_count, 20)))
+        cases.append(("mesh arrays {0} vertices".format(vertex_count), vertex_count,
+                      lambda vertex_count=vertex_count: synthetic.make_mesh_arrays(vertex_count)))
+        cases.append(("mesh arrays {0} vertices, 20 morphs".format(vertex_count), vertex_count,
+                      lambda vertex_count=vertex_count: synthetic.make_mesh_arrays(vertex_count, 20)))
+    cases.append(("animation {0} tracks x {1} keyframes".format(bone_count, keyframe_count),
+                  bone_count * keyframe_count,
+                  lambda: synthetic.make_animation(bone_count, keyframe_count)))
+    cases.append(("morph animation {0} tracks x {1} keyframes".format(bone_count, keyframe_count),
+                  bone_count * keyframe_count,
+                  lambda: synthetic.make_morph_animation(bone_count, keyframe_count)))
+    return cases
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Memory use and allocation time of the Cal3d element classes.")
+    parser.add_argument("--vertices", default="10000,100000",
+                        help="comma separated vertex counts of the meshes (default: 10000,100000)")
+    parser.add_argument("--bones", type=int, default=300, help="tracks of the animations (default: 300)")
+    parser.add_argument("--keyframes", type=int, default=300, help="keyframes per track (default: 300)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed builds, the best counts (default: 3)")
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    options = parser.parse_args(args)
+
+    vertex_counts = [int(count) for count in options.vertices.split(",") if count.strip()]
+    results = {}
+    print("{0:<46} {1:>10} {2:>10} {3:>12}".format("case", "seconds", "MB", "bytes/item"))
+    for name, count, build in build_cases(vertex_counts, options.bones, options.keyframes):
+        seconds = common.time_call(build, options.repeat)
+        memory = retained_memory(build)
+        results[name] = {"seconds": seconds, "bytes": memory, "bytes_per_item": memory / float(count)}
+        print("{0:<46} {1:>10.4f} {2:>10.1f} {3:>12.1f}".format(name, seconds, memory / MEGABYTE,
+                                                              memory / float(count)))
+
+    if options.output:
+        common.save_results(options.output, results,
+                            {"vertices": vertex_counts, "bones": options.bones,
+                             "keyframes": options.keyframes, "repeat": options.repeat})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,294 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# End-to-end scaling benchmark of the exporter.
+# Generates scenes with scene_generator.py and runs them through the same stages as the
+# ExportCal3D operator: create_cal3d_skeleton, create_cal3d_materials + create_cal3d_mesh,
+# create_cal3d_animation for every action and writing all files. Wall time and peak RSS are
+# recorded per phase. Every sweep grows one scene dimension while the others stay at the base
+# size, and the scaling exponent of the phases that depend on it (time ~ size ^ exponent) is
+# fitted over the sweep. The benchmark fails when an exponent is above --max-exponent, a sign
+# that a phase became super-linear.
+#
+#   python benchmarks/bench_pipeline.py                         quick preset, runs in a few minutes
+#   python benchmarks/bench_pipeline.py --preset full           1k to 1M vertices, needs several GB
+#   python benchmarks/bench_pipeline.py --sweeps vertices,actions --output results.json
+#
+# Every scene is exported in a separate Python process so the peak RSS of one point isn't
+# hidden by the memory an earlier (bigger) point left behind.
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import common
+common.setup_path()
+
+# Base size of the scenes, a sweep only changes its own dimension
+BASE_SIZE = {"vertices": 2000, "bones": 20, "shape_keys": 0, "actions": 1, "keyframes": 10}
+
+PRESETS = {
+    "quick": {"vertices":   [1000, 4000, 16000],
+              "bones":      [20, 80, 300],
+              "shape_keys": [10, 40, 150],
+              "actions":    [1, 10, 40]},
+    "full":  {"vertices":   [1000, 10000, 100000, 1000000],
+              "bones":      [20, 50, 100, 300],
+              "shape_keys": [10, 50, 150],
+              "actions":    [1, 10, 100]},
+}
+
+# Phases whose work grows linearly with the swept dimension
+SWEEP_PHASES = {
+    "vertices":   ("mesh", "write"),
+    "bones":      ("skeleton", "animation"),
+    "shape_keys": ("mesh",),
+    "actions":    ("animation", "write"),
+}
+
+XML_VERSION = 919
+
+# Start of the line a point process prints with its result
+RESULT_MARKER = "PIPELINE_RESULT "
+
+
+# Resident set size of this process in bytes, None when the platform can't tell
+def current_rss():
+    try:
+        with open("/proc/self/statm", "rt") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# Highest RSS since the process started, ru_maxrss is in kilobytes on Linux and bytes on macOS
+def max_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss
+    return rss * 1024
+
+
+# Peak RSS during a phase, sampled by a background thread.
+# Without /proc the process wide maximum at the end of the phase is used instead.
+class PeakMemory:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+        self.thread = None
+
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, current_rss())
+            time.sleep(self.interval)
+
+
+    def start(self):
+        rss = current_rss()
+        if rss is None:
+            return
+        self.peak = rss
+        self.running = True
+        self.thread = threading.Thread(target=self.sample)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self):
+        if self.thread:
+            self.running = False
+            self.thread.join()
+            return max(self.peak, current_rss())
+        return max_rss()
+
+
+# Run function and return (its result, {"seconds": ..., "peak_rss_mb": ...})
+def measure(function):
+    memory = PeakMemory()
+    memory.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = memory.stop()
+    return result, {"seconds": seconds, "peak_rss_mb": peak / (1024.0 * 1024.0)}
+
+
+# Generate and export one scene in this process, returns the measurements per phase
+def run_point(size):
+    import bpy
+    from mathutils import Matrix, Vector
+    import scene_generator
+    from io_export_cal3d_IMVU import logger_class
+    from io_export_cal3d_IMVU.logger_class import Logger
+    from io_export_cal3d_IMVU.export_armature import create_cal3d_skeleton
+    from io_export_cal3d_IMVU.export_mesh import create_cal3d_materials, create_cal3d_mesh
+    from io_export_cal3d_IMVU.export_action import create_cal3d_animation
+
+    output_dir = tempfile.mkdtemp(prefix="cal3d_pipeline_")
+    logger = Logger("PipelineBenchmark", type="file", file=os.path.join(output_dir, "export.log"))
+    logger_class.LogMessage = logger
+
+    phases = {}
+    scene_size = scene_generator.SceneSize(**size)
+    (armature_obj, mesh_obj), phases["generate"] = measure(lambda: scene_generator.generate_scene(scene_size))
+    scene = bpy.context.scene
+    base_rotation = Matrix.Identity(3)
+    base_translation = Vector((0.0, 0.0, 0.0))
+    fps = scene.render.fps
+
+    skeleton, phases["skeleton"] = measure(lambda: create_cal3d_skeleton(
+        armature_obj, armature_obj.data, base_rotation.copy(), base_translation.copy(),
+        1.0, XML_VERSION, False, bpy.data.lamps))
+
+    # use_groups=True: the vertex groups become influences, the weight path is part of the timing
+    def build_mesh():
+        materials = create_cal3d_materials(output_dir, "", XML_VERSION, False)
+        used_materials = []
+        return create_cal3d_mesh(scene, mesh_obj, skeleton, materials, used_materials,
+                                 base_rotation, base_translation, 1.0, XML_VERSION,
+                                 True, False, armature_obj)
+    mesh, phases["mesh"] = measure(build_mesh)
+
+    animations, phases["animation"] = measure(lambda: [
+        create_cal3d_animation(skeleton, action, fps, XML_VERSION) for action in bpy.data.actions])
+
+    def write_files():
+        with open(os.path.join(output_dir, "skeleton.xsf"), "wt") as skeleton_file:
+            skeleton.write_cal3d_xml(skeleton_file)
+        with open(os.path.join(output_dir, "mesh.xmf"), "wt") as mesh_file:
+            mesh.write_cal3d_xml(mesh_file)
+        for index, animation in enumerate(animations):
+            with open(os.path.join(output_dir, "animation{0}.xaf".format(index)), "wt") as animation_file:
+                animation.write_cal3d_xml(animation_file)
+    unused, phases["write"] = measure(write_files)
+
+    logger.close_log()
+    for filename in os.listdir(output_dir):
+        os.remove(os.path.join(output_dir, filename))
+    os.rmdir(output_dir)
+    if logger.errors:
+        raise RuntimeError("{0} error(s) during the export".format(logger.errors))
+    return phases
+
+
+# Run one point in a new Python process
+def run_point_process(size, timeout):
+    command = [sys.executable, os.path.abspath(__file__), "--point", json.dumps(size)]
+    output = subprocess.check_output(command, universal_newlines=True, timeout=timeout)
+    for line in output.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError("No result from the benchmark process:\n" + output)
+
+
+# Least squares slope of log(seconds) against log(size), None with less than two usable points.
+# Points faster than min_seconds are mostly noise and left out.
+def scaling_exponent(sizes, seconds, min_seconds):
+    points = [(math.log(size), math.log(time_taken))
+              for size, time_taken in zip(sizes, seconds) if size > 0 and time_taken >= min_seconds]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, y in points)
+    if variance == 0.0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="End-to-end scaling benchmark of the Cal3d exporter.")
+    parser.add_argument("--preset", default="quick", choices=sorted(PRESETS),
+                        help="sizes of the sweeps (default: quick)")
+    parser.add_argument("--sweeps", default=",".join(sorted(SWEEP_PHASES)),
+                        help="comma separated dimensions to sweep (default: all)")
+    parser.add_argument("--max-exponent", type=float, default=1.2,
+                        help="fail when a phase scales worse than size ^ max-exponent (default: 1.2)")
+    parser.add_argument("--min-time", type=float, default=0.01,
+                        help="leave out phases faster than this many seconds when fitting (default: 0.01)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="maximum number of seconds for one point")
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    parser.add_argument("--point", default=None, help=argparse.SUPPRESS)
+    options = parser.parse_args(args)
+
+    if options.point:
+        print(RESULT_MARKER + json.dumps(run_point(json.loads(options.point))))
+        return 0
+
+    sweeps = [name.strip() for name in options.sweeps.split(",") if name.strip()]
+    for sweep in sweeps:
+        if sweep not in SWEEP_PHASES:
+            parser.error("unknown sweep '{0}', choose from {1}".format(sweep, ", ".join(sorted(SWEEP_PHASES))))
+
+    results = {}
+    scaling = {}
+    failed = 0
+    for sweep in sweeps:
+        print("\nSweep over {0} ({1})".format(sweep, options.preset))
+        print("{0:>10} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10}   peak RSS MB per phase".format(
+            sweep, "generate", "skeleton", "mesh", "animation", "write"))
+        sizes = PRESETS[options.preset][sweep]
+        points = []
+        for value in sizes:
+            size = dict(BASE_SIZE)
+            size[sweep] = value
+            phases = run_point_process(size, options.timeout)
+            points.append(phases)
+            results["{0}={1}".format(sweep, value)] = {"size": size, "phases": phases}
+            order = ("generate", "skeleton", "mesh", "animation", "write")
+            print("{0:>10} {1}   {2}".format(
+                value, " ".join("{0:>10.4f}".format(phases[phase]["seconds"]) for phase in order),
+                " ".join("{0:.0f}".format(phases[phase]["peak_rss_mb"]) for phase in order)))
+
+        for phase in SWEEP_PHASES[sweep]:
+            exponent = scaling_exponent(sizes, [phases[phase]["seconds"] for phases in points], options.min_time)
+            passed = exponent is None or exponent <= options.max_exponent
+            scaling["{0}/{1}".format(sweep, phase)] = {"exponent": exponent, "passed": passed}
+            if exponent is None:
+                print("  {0}: too fast to fit a scaling exponent".format(phase))
+            else:
+                print("  {0}: time ~ {1} ^ {2:.2f}{3}".format(phase, sweep, exponent,
+                                                             "" if passed else "  SUPER-LINEAR"))
+            if not passed:
+                failed += 1
+
+    if options.output:
+        common.save_results(options.output, {"points": results, "scaling": scaling},
+                            {"preset": options.preset, "sweeps": sweeps, "base_size": BASE_SIZE,
+                             "max_exponent": options.max_exponent, "min_time": options.min_time})
+    print("\n{0} of {1} phases scale worse than size ^ {2}".format(failed, len(scaling), options.max_exponent))
+    if failed:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,167 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Microbenchmarks for the xml and binary serializers of all Cal3d classes.
+# Builds synthetic meshes, skeletons, animations and morph animations at several sizes, times
+# every serializer (best of --repeat runs) and compares the results against a stored baseline.
+#
+#   python benchmarks/bench_serializers.py                       run and compare with the baseline
+#   python benchmarks/bench_serializers.py --sizes small,large   choose the sizes
+#   python benchmarks/bench_serializers.py --output results.json --threshold 0.1
+#   python benchmarks/bench_serializers.py --save-baseline       store the results as new baseline
+#
+# Timings depend on the machine: create a baseline on the machine you compare on.
+# The exit code is 1 when a benchmark is more than --threshold slower than the baseline.
+
+import argparse
+import io
+import os
+import sys
+
+import common
+common.setup_path()
+
+import synthetic
+
+SIZES = {
+    "small":  {"vertices": 1000,   "morphs": 5,  "bones": 20,  "keyframes": 30,  "materials": 10},
+    "medium": {"vertices": 10000,  "morphs": 20, "bones": 100, "keyframes": 100, "materials": 50},
+    "large":  {"vertices": 100000, "morphs": 50, "bones": 300, "keyframes": 300, "materials": 200},
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_serializers.json")
+
+
+# List of (name, number of items, function) for one size
+def build_cases(size):
+    # The element serializers need the Vertex and Face objects, the submesh and mesh serializers
+    # write the arrays the exporter builds
+    object_submesh = synthetic.make_mesh(size["vertices"], size["morphs"], bone_count=size["bones"]).submeshes[0]
+    mesh = synthetic.make_mesh_arrays(size["vertices"], size["morphs"], bone_count=size["bones"])
+    submesh = mesh.submeshes[0]
+    vertices = object_submesh.vertices
+    faces = object_submesh.faces
+    maps = [mp for vertex in vertices for mp in vertex.maps]
+    influences = [ic for vertex in vertices for ic in vertex.influences]
+    morphs = submesh.morphs
+    blend_vertices = [bv for morph in morphs for bv in morph.blend_vertices]
+    materials = [synthetic.make_material(index) for index in range(size["materials"])]
+
+    skeleton = synthetic.make_skeleton(size["bones"])
+    bones = skeleton.bones
+    animation = synthetic.make_animation(size["bones"], size["keyframes"])
+    tracks = animation.tracks
+    keyframes = [keyframe for track in tracks for keyframe in track.keyframes]
+    morph_animation = synthetic.make_morph_animation(max(size["morphs"], 1), size["keyframes"])
+    morph_tracks = morph_animation.morph_tracks
+    morph_keyframes = [keyframe for track in morph_tracks for keyframe in track.keyframes]
+
+    return [
+        ("Map.to_cal3d_xml", len(maps), lambda: [mp.to_cal3d_xml() for mp in maps]),
+        ("Map.to_cal3d_binary_data", len(maps), lambda: [mp.to_cal3d_binary_data() for mp in maps]),
+        ("Influence.to_cal3d_xml", len(influences), lambda: [ic.to_cal3d_xml() for ic in influences]),
+        ("Influence.to_cal3d_binary_data", len(influences), lambda: [ic.to_cal3d_binary_data() for ic in influences]),
+        ("Vertex.to_cal3d_xml", len(vertices), lambda: [vertex.to_cal3d_xml() for vertex in vertices]),
+        ("Vertex.to_cal3d_binary_data", len(vertices), lambda: [vertex.to_cal3d_binary_data() for vertex in vertices]),
+        ("Face.to_cal3d_xml", len(faces), lambda: [face.to_cal3d_xml() for face in faces]),
+        ("Face.to_cal3d_binary_data", len(faces), lambda: [face.to_cal3d_binary_data() for face in faces]),
+        ("BlendVertex.to_cal3d_xml", len(blend_vertices), lambda: [bv.to_cal3d_xml() for bv in blend_vertices]),
+        ("Morph.to_cal3d_xml", len(blend_vertices), lambda: [morph.to_cal3d_xml() for morph in morphs]),
+        ("SubMesh.to_cal3d_xml", len(vertices), lambda: submesh.to_cal3d_xml()),
+        ("SubMesh.to_cal3d_binary", len(vertices), lambda: submesh.to_cal3d_binary(io.BytesIO())),
+        ("Mesh.write_cal3d_xml", len(vertices), lambda: mesh.write_cal3d_xml(io.StringIO())),
+        ("Mesh.to_cal3d_binary", len(vertices), lambda: mesh.to_cal3d_binary(io.BytesIO())),
+        ("Material.to_cal3d_xml", len(materials), lambda: [material.to_cal3d_xml() for material in materials]),
+        ("Material.to_cal3d_binary", len(materials), lambda: [material.to_cal3d_binary(io.BytesIO()) for material in materials]),
+        ("Bone.to_cal3d_xml", len(bones), lambda: [bone.to_cal3d_xml() for bone in bones]),
+        ("Bone.to_cal3d_binary_data", len(bones), lambda: [bone.to_cal3d_binary_data() for bone in bones]),
+        ("Skeleton.to_cal3d_xml", len(bones), lambda: skeleton.to_cal3d_xml()),
+        ("Skeleton.to_cal3d_binary", len(bones), lambda: skeleton.to_cal3d_binary(io.BytesIO())),
+        ("KeyFrame.to_cal3d_xml", len(keyframes), lambda: [keyframe.to_cal3d_xml() for keyframe in keyframes]),
+        ("KeyFrame.to_cal3d_binary_data", len(keyframes), lambda: [keyframe.to_cal3d_binary_data() for keyframe in keyframes]),
+        ("Track.to_cal3d_xml", len(keyframes), lambda: [track.to_cal3d_xml() for track in tracks]),
+        ("Track.to_cal3d_binary_data", len(keyframes), lambda: [track.to_cal3d_binary_data() for track in tracks]),
+        ("Animation.to_cal3d_xml", len(keyframes), lambda: animation.to_cal3d_xml()),
+        ("Animation.to_cal3d_binary", len(keyframes), lambda: animation.to_cal3d_binary(io.BytesIO())),
+        ("MorphKeyFrame.to_cal3d_xml", len(morph_keyframes), lambda: [keyframe.to_cal3d_xml() for keyframe in morph_keyframes]),
+        ("MorphTrack.to_cal3d_xml", len(morph_keyframes), lambda: [track.to_cal3d_xml() for track in morph_tracks]),
+        ("MorphAnimation.to_cal3d_xml", len(morph_keyframes), lambda: morph_animation.to_cal3d_xml()),
+    ]
+
+
+def run_benchmarks(size_names, repeat, name_filter):
+    results = {}
+    for size_name in size_names:
+        print("Building {0} objects: {1}".format(size_name, SIZES[size_name]))
+        for name, items, function in build_cases(SIZES[size_name]):
+            if name_filter and name_filter not in name:
+                continue
+            seconds = common.time_call(function, repeat)
+            key = "{0}/{1}".format(name, size_name)
+            results[key] = {"seconds": seconds,
+                            "items": items,
+                            "us_per_item": seconds * 1e6 / max(items, 1)}
+            print("  {0:<50} {1:>10.6f}s {2:>9.3f}us/item".format(key, seconds, results[key]["us_per_item"]))
+    return results
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the Cal3d serializers.")
+    parser.add_argument("--sizes", default="small,medium",
+                        help="comma separated sizes to run: " + ", ".join(sorted(SIZES)))
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the best one counts")
+    parser.add_argument("--filter", default="", help="only run benchmarks with this text in their name")
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="json file with the baseline results")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative slowdown that counts as regression (0.25 = 25%%)")
+    parser.add_argument("--min-time", type=float, default=0.001,
+                        help="don't flag benchmarks faster than this many seconds, they are too noisy")
+    options = parser.parse_args(args)
+
+    size_names = [name.strip() for name in options.sizes.split(",") if name.strip()]
+    for size_name in size_names:
+        if size_name not in SIZES:
+            parser.error("unknown size " + size_name)
+
+    results = run_benchmarks(size_names, options.repeat, options.filter)
+    settings = {"sizes": size_names, "repeat": options.repeat}
+
+    if options.output:
+        common.save_results(options.output, results, settings)
+    if options.save_baseline:
+        common.save_results(options.baseline, results, settings)
+        print("Baseline written to " + options.baseline)
+        return 0
+
+    if os.path.exists(options.baseline):
+        comparison = common.compare_results(results, common.load_results(options.baseline),
+                                            options.threshold, options.min_time)
+        if common.print_comparison(comparison, options.threshold) > 0:
+            return 1
+    else:
+        print("No baseline found at " + options.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,112 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Shared helpers for the benchmarks: make the exporter importable without Blender,
+# time functions and write, read and compare json result files.
+
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STANDIN_DIR = os.path.join(REPO_DIR, "bpy_standin")
+
+
+# Make io_export_cal3d_IMVU importable, with the bpy stand-in when we are not running in Blender
+def setup_path():
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    try:
+        import bpy
+    except ImportError:
+        sys.path.insert(0, STANDIN_DIR)
+
+
+# Best (lowest) wall time in seconds of repeat calls of function.
+# The garbage collector is switched off while timing, like timeit does, it adds a lot of noise.
+def time_call(function, repeat):
+    best = None
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def environment_info():
+    return {"python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def save_results(filepath, results, settings):
+    with open(filepath, "wt") as results_file:
+        json.dump({"environment": environment_info(), "settings": settings, "results": results},
+                  results_file, indent=1, sort_keys=True)
+
+
+def load_results(filepath):
+    with open(filepath, "rt") as results_file:
+        return json.load(results_file)["results"]
+
+
+# Compare the "seconds" of every result that is also in the baseline.
+# Returns a list of (name, seconds, baseline seconds, ratio, regressed) sorted by name.
+# Results faster than min_seconds in both runs are too noisy to flag as regression.
+def compare_results(results, baseline, threshold, min_seconds):
+    comparison = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        seconds = results[name]["seconds"]
+        baseline_seconds = baseline[name]["seconds"]
+        if baseline_seconds > 0.0:
+            ratio = seconds / baseline_seconds
+        else:
+            ratio = 1.0
+        regressed = ratio > 1.0 + threshold and max(seconds, baseline_seconds) >= min_seconds
+        comparison.append((name, seconds, baseline_seconds, ratio, regressed))
+    return comparison
+
+
+def print_comparison(comparison, threshold):
+    print("\n{0:<52} {1:>11} {2:>11} {3:>7}".format("benchmark", "seconds", "baseline", "ratio"))
+    for name, seconds, baseline_seconds, ratio, regressed in comparison:
+        print("{0:<52} {1:>11.6f} {2:>11.6f} {3:>7.2f}{4}".format(name, seconds, baseline_seconds, ratio,
+                                                                  "  REGRESSION" if regressed else ""))
+    regressions = len([entry for entry in comparison if entry[4]])
+    print("\n{0} of {1} benchmarks more than {2:.0f}% slower than the baseline".format(
+        regressions, len(comparison), threshold * 100.0))
+    return regressions
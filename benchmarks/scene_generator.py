@@ -0,0 +1,162 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Generates reproducible test scenes of a given size with the regular bpy calls, so it works
+# with the bpy stand-in (see bpy_standin) and, for comparison, inside Blender 2.6x:
+# an armature with a chain of bones and branches, a grid mesh skinned to those bones with a uv
+# layer, a textured material and shape keys, and actions animating every bone.
+# Call common.setup_path() before importing this module.
+
+import random
+from math import cos, sin, sqrt
+
+import bpy
+from mathutils import Matrix, Vector
+
+
+class SceneSize:
+    def __init__(self, vertices=1000, bones=20, shape_keys=0, actions=1, keyframes=10,
+                 shape_key_fraction=0.05):
+        self.vertices = vertices
+        self.bones = bones
+        self.shape_keys = shape_keys
+        self.actions = actions
+        # keyframes per fcurve
+        self.keyframes = keyframes
+        # fraction of the vertices that every shape key moves
+        self.shape_key_fraction = shape_key_fraction
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def bone_name(index):
+    return "Bone{0:03d}".format(index)
+
+
+# Chain of bones going up along z, every fourth bone starts a branch to the side
+def generate_armature(scene, bone_count):
+    armature = bpy.data.armatures.new("SyntheticArmature")
+    bones = []
+    for index in range(bone_count):
+        if index == 0:
+            parent = None
+            head = Vector((0.0, 0.0, 0.0))
+        elif index % 4 == 1:
+            parent = bones[max(index - 5, 0)]
+            head = parent.head + Vector((0.25, 0.0, 0.0))
+        else:
+            parent = bones[index - 1]
+            head = parent.head + Vector((0.0, 0.0, 0.25))
+        bones.append(armature.bones.new(bone_name(index), parent, Matrix.Translation(head)))
+    armature_obj = bpy.data.objects.new("SyntheticArmature", armature)
+    scene.objects.link(armature_obj)
+    armature_obj.select = True
+    return armature_obj
+
+
+def generate_material():
+    image = bpy.data.images.new("synthetic.png", "//synthetic.png")
+    material = bpy.data.materials.new("SyntheticMaterial")
+    texture_slot = material.texture_slots.add()
+    texture_slot.texture.image = image
+    return material
+
+
+# Square grid of about vertex_count vertices made of quads, with one uv layer,
+# two bone weights per vertex and shape keys that each move some of the vertices
+def generate_mesh(scene, size, armature_obj, material, rnd):
+    side = max(int(sqrt(size.vertices)), 2)
+    vertices = [(x / (side - 1.0), 0.0, z * 2.0 / (side - 1.0)) for z in range(side) for x in range(side)]
+    faces = []
+    for z in range(side - 1):
+        for x in range(side - 1):
+            first = z * side + x
+            faces.append((first, first + 1, first + side + 1, first + side))
+
+    mesh = bpy.data.meshes.new("SyntheticMesh")
+    mesh.from_pydata(vertices, [], faces)
+    mesh.materials.append(material)
+    uv_layer = mesh.tessface_uv_textures.new("UVMap")
+    for face, face_uvs in zip(mesh.tessfaces, uv_layer.data):
+        uvs = []
+        for vertex_index in face.vertices_raw:
+            co = mesh.vertices[vertex_index].co
+            uvs.extend((co[0], co[2] / 2.0))
+        face_uvs.uv_raw = uvs
+
+    mesh_obj = bpy.data.objects.new("SyntheticMesh", mesh)
+    mesh_obj.parent = armature_obj
+    scene.objects.link(mesh_obj)
+    mesh_obj.select = True
+
+    # Every vertex is weighted to the two bones nearest to its height
+    groups = [mesh_obj.vertex_groups.new(bone_name(index)) for index in range(size.bones)]
+    for vertex in mesh.vertices:
+        position = vertex.co[2] / 2.0 * (size.bones - 1)
+        bone_index = min(int(position), size.bones - 1)
+        weight = position - bone_index
+        groups[bone_index].add([vertex.index], 1.0 - weight, 'REPLACE')
+        if weight > 0.0 and bone_index + 1 < size.bones:
+            groups[bone_index + 1].add([vertex.index], weight, 'REPLACE')
+
+    if size.shape_keys > 0:
+        mesh_obj.shape_key_add("Basis")
+        moved_count = max(int(len(mesh.vertices) * size.shape_key_fraction), 1)
+        for index in range(size.shape_keys):
+            shape_key = mesh_obj.shape_key_add("Key{0:03d}.Clamped".format(index))
+            for vertex_index in rnd.sample(range(len(mesh.vertices)), moved_count):
+                point = shape_key.data[vertex_index]
+                point.co = point.co + Vector((0.0, 0.5, 0.0))
+    return mesh_obj
+
+
+def generate_action(index, size, rnd):
+    action = bpy.data.actions.new("SyntheticAction{0:03d}".format(index))
+    for bone_index in range(size.bones):
+        name = bone_name(bone_index)
+        data_path = 'pose.bones["{0}"]'.format(name)
+        location_curves = [action.fcurves.new(data_path + ".location", axis, name) for axis in range(3)]
+        rotation_curves = [action.fcurves.new(data_path + ".rotation_quaternion", axis, name) for axis in range(4)]
+        for key in range(size.keyframes):
+            frame = 1.0 + key * 3.0
+            for fcurve in location_curves:
+                fcurve.keyframe_points.insert(frame, rnd.uniform(-0.1, 0.1))
+            angle = rnd.uniform(-0.5, 0.5)
+            for fcurve, value in zip(rotation_curves, (cos(angle), sin(angle), 0.0, 0.0)):
+                fcurve.keyframe_points.insert(frame, value)
+    return action
+
+
+# Replace the current bpy data by a new scene of the given size.
+# Returns (armature object, mesh object).
+def generate_scene(size, seed=0):
+    rnd = random.Random(seed)
+    if hasattr(bpy, "reset"):
+        bpy.reset()
+    scene = bpy.context.scene
+    scene.render.fps = 30
+    armature_obj = generate_armature(scene, size.bones)
+    material = generate_material()
+    mesh_obj = generate_mesh(scene, size, armature_obj, material, rnd)
+    for index in range(size.actions):
+        generate_action(index, size, rnd)
+    return armature_obj, mesh_obj
@@ -0,0 +1,186 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Synthetic Cal3d objects (Mesh, Skeleton, Animation, MorphAnimation) of a given size, built
+# directly from the exporter classes without Blender. The data is random but reproducible:
+# every builder seeds its own random generator with its arguments.
+# Call common.setup_path() before importing this module.
+
+import random
+from math import cos, sin
+
+from io_export_cal3d_IMVU.mesh_classes import Mesh, SubMesh, Vertex, Map, Influence, Face, Morph, BlendVertex, Material, \
+    SubMeshArrays
+from io_export_cal3d_IMVU.armature_classes import Skeleton, Bone
+from io_export_cal3d_IMVU.action_classes import Animation, Track, KeyFrame, MorphAnimation, MorphTrack, MorphKeyFrame
+
+XML_VERSION = 919
+
+
+def random_unit_quaternion(rnd):
+    angle = rnd.uniform(0.0, 3.0)
+    axis = (rnd.uniform(-1.0, 1.0), rnd.uniform(-1.0, 1.0), rnd.uniform(-1.0, 1.0))
+    length = sum(a * a for a in axis) ** 0.5 or 1.0
+    s = sin(angle / 2.0) / length
+    return (cos(angle / 2.0), axis[0] * s, axis[1] * s, axis[2] * s)
+
+
+# Random vertex data for make_mesh and make_mesh_arrays, yields (loc, normal, color, uvs,
+# influences) with uvs a list of (u, v) and influences a list of (bone index, weight)
+def synthetic_vertices(rnd, vertex_count, maps, influences, bone_count):
+    for index in range(vertex_count):
+        loc = (rnd.uniform(-1.0, 1.0), rnd.uniform(-1.0, 1.0), rnd.uniform(0.0, 2.0))
+        color = (1.0, 1.0, 1.0) if index % 4 else (rnd.random(), rnd.random(), rnd.random())
+        uvs = [(rnd.random(), rnd.random()) for layer in range(maps)]
+        weights = [rnd.random() + 0.01 for influence in range(influences)]
+        yield loc, (0.0, 0.0, 1.0), color, uvs, list(zip(rnd.sample(range(bone_count), influences), weights))
+
+
+# The faces of make_mesh and make_mesh_arrays: (vertex indices, is a quad), a third of them quads
+def synthetic_faces(vertex_count):
+    index = 0
+    while index + 3 < vertex_count:
+        yield index, index % 3 == 0
+        index += 1
+
+
+# Morph morph_id of make_mesh and make_mesh_arrays: moves the vertices it selects 0.5 up.
+# loc_of and uvs_of return the position and uvs of a vertex index.
+def synthetic_morph(rnd, morph_id, vertex_count, moved_count, loc_of, uvs_of):
+    morph = Morph("Morph{0:03d}.Clamped".format(morph_id), morph_id)
+    for index in sorted(rnd.sample(range(vertex_count), min(moved_count, vertex_count))):
+        loc = loc_of(index)
+        blend_vertex = BlendVertex(index, (loc[0], loc[1], loc[2] + 0.5), (0.0, 0.0, 1.0), 0.5)
+        for u, v in uvs_of(index):
+            blend_vertex.maps.append(Map(u, v))
+        morph.blend_vertices.append(blend_vertex)
+    return morph
+
+
+# Mesh with one submesh of vertex_count vertices with maps uv layers and influences bones each,
+# about as many faces as vertices (a third of them quads) and morph_count morphs that each move
+# morph_fraction of the vertices.
+# The submesh holds Vertex and Face objects, for the benchmarks of their own serializers.
+def make_mesh(vertex_count, morph_count=0, maps=1, influences=2, bone_count=20, morph_fraction=0.05):
+    rnd = random.Random(vertex_count * 1000 + morph_count)
+    mesh = Mesh("Synthetic", XML_VERSION)
+    submesh = SubMesh(mesh, 0, 0, 0)
+    mesh.add_submesh(submesh)
+
+    for index, (loc, normal, color, uvs, vertex_influences) in enumerate(
+            synthetic_vertices(rnd, vertex_count, maps, influences, bone_count)):
+        vertex = Vertex(submesh, index, loc, normal, color)
+        for u, v in uvs:
+            vertex.maps.append(Map(u, v))
+        for bone_index, weight in vertex_influences:
+            vertex.influences.append(Influence(bone_index, weight))
+        vertex.normalize_influences()
+        submesh.vertices.append(vertex)
+
+    vertices = submesh.vertices
+    for index, quad in synthetic_faces(vertex_count):
+        submesh.faces.append(Face(submesh, vertices[index], vertices[index + 1], vertices[index + 2],
+                                  vertices[index + 3] if quad else None))
+
+    moved_count = max(int(vertex_count * morph_fraction), 1)
+    for morph_id in range(morph_count):
+        submesh.morphs.append(synthetic_morph(rnd, morph_id, vertex_count, moved_count,
+                                              lambda index: vertices[index].loc,
+                                              lambda index: [(mp.u, mp.v) for mp in vertices[index].maps]))
+    return mesh
+
+
+# The same mesh as make_mesh, with the submesh built in a SubMeshArrays the way create_cal3d_mesh
+# does it: no Vertex and Face objects.
+def make_mesh_arrays(vertex_count, morph_count=0, maps=1, influences=2, bone_count=20, morph_fraction=0.05):
+    rnd = random.Random(vertex_count * 1000 + morph_count)
+    mesh = Mesh("Synthetic", XML_VERSION)
+    submesh = SubMesh(mesh, 0, 0, 0)
+    mesh.add_submesh(submesh)
+
+    arrays = SubMeshArrays(maps)
+    for index, (loc, normal, color, uvs, vertex_influences) in enumerate(
+            synthetic_vertices(rnd, vertex_count, maps, influences, bone_count)):
+        arrays.add_vertex(index, loc, normal, color, uvs, vertex_influences)
+    for index, quad in synthetic_faces(vertex_count):
+        arrays.add_face(index, index + 1, index + 2, index + 3 if quad else None)
+    submesh.arrays = arrays
+
+    moved_count = max(int(vertex_count * morph_fraction), 1)
+    for morph_id in range(morph_count):
+        submesh.morphs.append(synthetic_morph(rnd, morph_id, vertex_count, moved_count,
+                                              lambda index: arrays.positions[3*index:3*index + 3],
+                                              arrays.vertex_uvs))
+    return mesh
+
+
+def make_material(index, map_count=2):
+    material = Material("Material{0:03d}".format(index), index, XML_VERSION)
+    material.maps_filenames = ["texture{0:03d}_{1}.png".format(index, i) for i in range(map_count)]
+    return material
+
+
+# Skeleton with bone_count bones: a spine chain with branches of 4 bones each
+def make_skeleton(bone_count):
+    rnd = random.Random(bone_count)
+    skeleton = Skeleton("Synthetic", ((1.0, 0.0, 0.0, 0.0), (0.0, 1.0, 0.0, 0.0),
+                                      (0.0, 0.0, 1.0, 0.0), (0.0, 0.0, 0.0, 1.0)),
+                        (1.0, 1.0, 1.0), XML_VERSION, True)
+    for index in range(bone_count):
+        if index == 0:
+            parent = None
+        elif index % 4 == 1:
+            parent = skeleton.bones[max(index - 5, 0)]
+        else:
+            parent = skeleton.bones[index - 1]
+        Bone(skeleton, parent, "Bone{0:03d}".format(index),
+             (rnd.uniform(-0.5, 0.5), rnd.uniform(0.0, 1.0), rnd.uniform(-0.5, 0.5)),
+             random_unit_quaternion(rnd),
+             (rnd.uniform(-2.0, 2.0), rnd.uniform(-2.0, 2.0), rnd.uniform(-2.0, 2.0)),
+             random_unit_quaternion(rnd), {})
+    return skeleton
+
+
+# Animation with a track of keyframe_count keyframes for each of track_count bones
+def make_animation(track_count, keyframe_count, fps=30.0):
+    rnd = random.Random(track_count * 1000 + keyframe_count)
+    animation = Animation("Synthetic", XML_VERSION)
+    for bone_index in range(track_count):
+        track = Track(bone_index)
+        for frame in range(keyframe_count):
+            track.keyframes.append(KeyFrame(frame / fps,
+                                            (rnd.uniform(-1.0, 1.0), rnd.uniform(-1.0, 1.0), rnd.uniform(-1.0, 1.0)),
+                                            random_unit_quaternion(rnd)))
+        animation.tracks.append(track)
+    animation.duration = (keyframe_count - 1) / fps
+    return animation
+
+
+def make_morph_animation(track_count, keyframe_count, fps=30.0):
+    rnd = random.Random(track_count * 1000 + keyframe_count)
+    morph_animation = MorphAnimation("Synthetic", XML_VERSION)
+    for track_index in range(track_count):
+        morph_track = MorphTrack("Morph{0:03d}.Clamped".format(track_index))
+        for frame in range(keyframe_count):
+            morph_track.keyframes.append(MorphKeyFrame(frame / fps, rnd.random()))
+        morph_animation.morph_tracks.append(morph_track)
+    morph_animation.duration = (keyframe_count - 1) / fps
+    return morph_animation
@@ -0,0 +1,96 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Stand-in for the part of the Blender 2.6x Python API the exporter uses, so the exporter
+# can be imported, run, profiled and benchmarked with a regular Python interpreter.
+# Put the bpy_standin folder in front of the module search path, for example:
+#   PYTHONPATH=bpy_standin:. python -c "import io_export_cal3d_IMVU"
+# Never install this folder in Blender: it would hide the real bpy and mathutils modules.
+#
+# bpy.data starts with one scene, which is also bpy.context.scene. Call reset() to start over
+# with empty data.
+
+from . import types
+from . import props
+from . import utils
+from . import path
+
+
+class BlendDataCollection(types.bpy_prop_collection):
+    def __init__(self, data_type):
+        types.bpy_prop_collection.__init__(self)
+        self.data_type = data_type
+
+    def new(self, name, *args):
+        item = self.data_type(name, *args)
+        self.append(item)
+        return item
+
+    def remove(self, item):
+        if item in self:
+            types.bpy_prop_collection.remove(self, item)
+
+
+class BlendData:
+    def __init__(self):
+        self.filepath = ""
+        self.actions = BlendDataCollection(types.Action)
+        self.armatures = BlendDataCollection(types.Armature)
+        self.images = BlendDataCollection(types.Image)
+        self.lamps = BlendDataCollection(types.Lamp)
+        self.materials = BlendDataCollection(types.Material)
+        self.meshes = BlendDataCollection(types.Mesh)
+        self.objects = BlendDataCollection(types.Object)
+        self.scenes = BlendDataCollection(types.Scene)
+        self.shape_keys = BlendDataCollection(types.Key)
+        self.textures = BlendDataCollection(types.Texture)
+        self.worlds = BlendDataCollection(types.World)
+        self.scenes.new("Scene")
+
+
+class Context:
+    def __init__(self, blend_data):
+        self.blend_data = blend_data
+        self.scene = blend_data.scenes[0]
+        self.active_object = None
+
+    @property
+    def selected_objects(self):
+        return [obj for obj in self.scene.objects if obj.select]
+
+
+# Operators are not available outside Blender
+class Operators:
+    pass
+
+
+data = BlendData()
+context = Context(data)
+ops = Operators()
+app = types.ID("Blender")
+app.version = (2, 63, 0)
+app.background = True
+
+
+# Throw away all data and start again with a single empty scene
+def reset():
+    data.__init__()
+    context.__init__(data)
@@ -0,0 +1,53 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Stand-in for bpy.props: a property definition simply evaluates to its default value, so operator
+# classes can be instantiated and used outside Blender with their default settings.
+
+
+def BoolProperty(**options):
+    return options.get("default", False)
+
+
+def IntProperty(**options):
+    return options.get("default", 0)
+
+
+def FloatProperty(**options):
+    return options.get("default", 0.0)
+
+
+def StringProperty(**options):
+    return options.get("default", "")
+
+
+def EnumProperty(**options):
+    if "default" in options:
+        return options["default"]
+    return options["items"][0][0]
+
+
+def FloatVectorProperty(**options):
+    return tuple(options.get("default", (0.0, 0.0, 0.0)))
+
+
+def CollectionProperty(**options):
+    return []
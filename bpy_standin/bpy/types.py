@@ -0,0 +1,704 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Stand-in for the bpy.types the exporter reads. Only the attributes and methods the exporter,
+# the batch driver and the benchmarks use are there, with the same names as the Blender 2.6x API
+# (tessfaces, vertices_raw, uv_raw, ...), so scenes can be built with the regular bpy calls:
+#   mesh = bpy.data.meshes.new("Body")
+#   mesh.from_pydata(vertices, [], faces)
+#   obj = bpy.data.objects.new("Body", mesh)
+#   obj.vertex_groups.new("Bone").add([0, 1, 2], 1.0, 'REPLACE')
+# Differences with Blender: meshes are stored as tessfaces (polygons, loops and their layers are
+# read-only views on those), fcurves always interpolate linearly and to_mesh only applies shape
+# keys, not modifiers.
+
+from array import array
+
+from mathutils import Vector, Matrix, Color
+
+
+# Collection of named items, like bpy_prop_collection
+class bpy_prop_collection(list):
+    def __init__(self, items=()):
+        list.__init__(self, items)
+        self.active = None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for item in self:
+                if item.name == key:
+                    return item
+            raise KeyError("bpy_prop_collection[key]: key \"{0}\" not found".format(key))
+        if isinstance(key, slice):
+            return bpy_prop_collection(list.__getitem__(self, key))
+        return list.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return self.find(key) != -1
+        return list.__contains__(self, key)
+
+    def find(self, name):
+        for index, item in enumerate(self):
+            if item.name == name:
+                return index
+        return -1
+
+    def get(self, name, default=None):
+        index = self.find(name)
+        if index == -1:
+            return default
+        return list.__getitem__(self, index)
+
+    def keys(self):
+        return [item.name for item in self]
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return [(item.name, item) for item in self]
+
+    # Copy attr of all items into seq (a list, array or numpy array), flattening vectors
+    def foreach_get(self, attr, seq):
+        flat = []
+        for item in self:
+            value = getattr(item, attr)
+            if isinstance(value, (int, float, bool)):
+                flat.append(value)
+            else:
+                flat.extend(value)
+        if len(flat) != len(seq):
+            raise RuntimeError("foreach_get: size mismatch, expected {0} items, got {1}".format(len(flat), len(seq)))
+        if hasattr(seq, "typecode"):
+            seq[:] = array(seq.typecode, flat)
+        else:
+            seq[:] = flat
+
+
+class ID:
+    def __init__(self, name):
+        self.name = name
+        self.users = 0
+
+
+# ====================================
+# ========== Meshes ==========
+# ====================================
+
+class VertexGroupElement:
+    def __init__(self, group, weight):
+        self.group = group
+        self.weight = weight
+
+
+class MeshVertex:
+    def __init__(self, index, co):
+        self.index = index
+        self.co = Vector(co)
+        self.normal = Vector((0.0, 0.0, 1.0))
+        self.groups = []
+        self.select = False
+
+
+class MeshTessFace:
+    def __init__(self, index, vertices, material_index=0):
+        self.index = index
+        self.material_index = material_index
+        # Triangles have a fourth vertex index of 0, just like in Blender
+        self.vertices_raw = list(vertices) + [0] * (4 - len(vertices))
+        self.use_smooth = True
+
+    @property
+    def vertices(self):
+        if self.vertices_raw[3] == 0:
+            return self.vertices_raw[:3]
+        return list(self.vertices_raw)
+
+
+class MeshTextureFace:
+    def __init__(self):
+        self.uv_raw = [0.0] * 8
+
+
+class MeshColor:
+    def __init__(self):
+        self.color1 = Color((1.0, 1.0, 1.0))
+        self.color2 = Color((1.0, 1.0, 1.0))
+        self.color3 = Color((1.0, 1.0, 1.0))
+        self.color4 = Color((1.0, 1.0, 1.0))
+
+
+# Read-only loop based views on the tessfaces
+class MeshLoop:
+    def __init__(self, vertex_index):
+        self.vertex_index = vertex_index
+
+
+class MeshPolygon:
+    def __init__(self, index, loop_start, loop_total, material_index):
+        self.index = index
+        self.loop_start = loop_start
+        self.loop_total = loop_total
+        self.material_index = material_index
+
+
+class MeshLoopValue:
+    def __init__(self, name, value):
+        setattr(self, name, value)
+
+
+class MeshLoopLayer:
+    def __init__(self, name, active, data):
+        self.name = name
+        self.active = active
+        self.data = data
+
+
+class MeshTextureFaceLayer:
+    def __init__(self, name, face_count):
+        self.name = name
+        self.active = True
+        self.data = bpy_prop_collection(MeshTextureFace() for face in range(face_count))
+
+
+class MeshColorLayer:
+    def __init__(self, name, face_count):
+        self.name = name
+        self.active = True
+        self.data = bpy_prop_collection(MeshColor() for face in range(face_count))
+
+
+class TessfaceLayers(bpy_prop_collection):
+    def __init__(self, mesh, layer_type):
+        bpy_prop_collection.__init__(self)
+        self.mesh = mesh
+        self.layer_type = layer_type
+
+    def new(self, name=""):
+        layer = self.layer_type(name, len(self.mesh.tessfaces))
+        self.append(layer)
+        if self.active is None:
+            self.active = layer
+        return layer
+
+
+class ShapeKeyPoint:
+    def __init__(self, co):
+        self.co = Vector(co)
+
+
+class ShapeKey:
+    def __init__(self, name, vertices):
+        self.name = name
+        self.value = 0.0
+        self.slider_min = 0.0
+        self.slider_max = 1.0
+        self.mute = False
+        self.data = bpy_prop_collection(ShapeKeyPoint(vertex.co) for vertex in vertices)
+
+
+class Key(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.use_relative = True
+        self.key_blocks = bpy_prop_collection()
+
+
+class Mesh(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.vertices = bpy_prop_collection()
+        self.tessfaces = bpy_prop_collection()
+        self.tessface_uv_textures = TessfaceLayers(self, MeshTextureFaceLayer)
+        self.tessface_vertex_colors = TessfaceLayers(self, MeshColorLayer)
+        self.materials = bpy_prop_collection()
+        self.shape_keys = None
+
+    # faces are lists of 3 or 4 vertex indices; edges are ignored
+    def from_pydata(self, vertices, edges, faces):
+        self.vertices = bpy_prop_collection(MeshVertex(index, co) for index, co in enumerate(vertices))
+        self.tessfaces = bpy_prop_collection(MeshTessFace(index, face) for index, face in enumerate(faces))
+        # Blender rotates faces that have vertex index 0 last, so the fourth index can mean "no vertex"
+        for face in self.tessfaces:
+            vertices_raw = face.vertices_raw
+            count = 4 if len(faces[face.index]) == 4 else 3
+            while vertices_raw[count - 1] == 0:
+                vertices_raw[:count] = vertices_raw[count - 1:count] + vertices_raw[:count - 1]
+        self.calc_normals()
+
+    def update(self, calc_edges=False, calc_tessface=False):
+        pass
+
+    @property
+    def loops(self):
+        return bpy_prop_collection(MeshLoop(vertex_index) for face in self.tessfaces for vertex_index in face.vertices)
+
+    @property
+    def polygons(self):
+        polygons = bpy_prop_collection()
+        loop_start = 0
+        for face in self.tessfaces:
+            polygons.append(MeshPolygon(face.index, loop_start, len(face.vertices), face.material_index))
+            loop_start += len(face.vertices)
+        return polygons
+
+    @property
+    def uv_layers(self):
+        layers = bpy_prop_collection()
+        for layer in self.tessface_uv_textures:
+            data = bpy_prop_collection()
+            for face, face_uvs in zip(self.tessfaces, layer.data):
+                for corner in range(len(face.vertices)):
+                    data.append(MeshLoopValue("uv", face_uvs.uv_raw[2*corner:2*corner+2]))
+            layers.append(MeshLoopLayer(layer.name, layer.active, data))
+        return layers
+
+    @property
+    def vertex_colors(self):
+        layers = bpy_prop_collection()
+        for layer in self.tessface_vertex_colors:
+            data = bpy_prop_collection()
+            for face, face_colors in zip(self.tessfaces, layer.data):
+                for corner in range(len(face.vertices)):
+                    data.append(MeshLoopValue("color", getattr(face_colors, "color" + str(corner + 1))))
+            layers.append(MeshLoopLayer(layer.name, layer is self.tessface_vertex_colors.active, data))
+        return layers
+
+    # Area weighted vertex normals
+    def calc_normals(self):
+        normals = [[0.0, 0.0, 0.0] for vertex in self.vertices]
+        for face in self.tessfaces:
+            corners = face.vertices
+            for triangle in ((corners[0], corners[1], corners[2]), (corners[0], corners[2], corners[-1])):
+                if triangle[1] == triangle[2]:
+                    continue
+                v1 = self.vertices[triangle[0]].co
+                face_normal = (self.vertices[triangle[1]].co - v1).cross(self.vertices[triangle[2]].co - v1)
+                for vertex_index in triangle:
+                    normal = normals[vertex_index]
+                    normal[0] += face_normal[0]
+                    normal[1] += face_normal[1]
+                    normal[2] += face_normal[2]
+        for vertex, normal in zip(self.vertices, normals):
+            vertex.normal = Vector(normal).normalized()
+
+    def transform(self, matrix):
+        rotation = matrix.to_3x3()
+        for vertex in self.vertices:
+            vertex.co = matrix * vertex.co
+            vertex.normal = (rotation * vertex.normal).normalized()
+
+    def copy(self):
+        mesh = Mesh(self.name)
+        mesh.from_pydata([vertex.co for vertex in self.vertices], [],
+                         [face.vertices for face in self.tessfaces])
+        for vertex, source in zip(mesh.vertices, self.vertices):
+            vertex.normal = source.normal.copy()
+            vertex.groups = list(source.groups)
+        for face, source in zip(mesh.tessfaces, self.tessfaces):
+            face.vertices_raw = list(source.vertices_raw)
+            face.material_index = source.material_index
+        for layers, source_layers in ((mesh.tessface_uv_textures, self.tessface_uv_textures),
+                                      (mesh.tessface_vertex_colors, self.tessface_vertex_colors)):
+            for source_layer in source_layers:
+                layer = layers.new(source_layer.name)
+                layer.data = source_layer.data
+            if source_layers.active is not None:
+                layers.active = layers[source_layers.active.name]
+        mesh.materials = bpy_prop_collection(self.materials)
+        mesh.shape_keys = self.shape_keys
+        return mesh
+
+
+# ====================================
+# ========== Materials ==========
+# ====================================
+
+class Image(ID):
+    def __init__(self, name, filepath=""):
+        ID.__init__(self, name)
+        self.filepath = filepath
+
+
+class Texture(ID):
+    def __init__(self, name, type='IMAGE'):
+        ID.__init__(self, name)
+        self.type = type
+        self.image = None
+
+
+class MaterialTextureSlot:
+    def __init__(self, texture):
+        self.texture = texture
+        self.name = texture.name
+
+
+class MaterialTextureSlots(bpy_prop_collection):
+    def add(self):
+        for index, slot in enumerate(self):
+            if slot is None:
+                self[index] = MaterialTextureSlot(Texture(""))
+                return self[index]
+        return None
+
+
+class Material(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        # Blender materials have 18 texture slots, unused slots are None
+        self.texture_slots = MaterialTextureSlots([None] * 18)
+        self.diffuse_color = Color((0.8, 0.8, 0.8))
+
+
+class MaterialSlot:
+    def __init__(self, material):
+        self.material = material
+
+    @property
+    def name(self):
+        if self.material:
+            return self.material.name
+        return ""
+
+
+# ====================================
+# ========== Armatures ==========
+# ====================================
+
+class Bone:
+    def __init__(self, name, parent, matrix_local):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.matrix_local = matrix_local.copy()
+        if parent:
+            parent.children.append(self)
+            self.matrix = parent.matrix_local.to_3x3().inverted() * matrix_local.to_3x3()
+        else:
+            self.matrix = matrix_local.to_3x3()
+        self.head = matrix_local.to_translation()
+        self.head_local = self.head.copy()
+        self.tail = self.head + Vector((matrix_local[0][1], matrix_local[1][1], matrix_local[2][1]))
+        self.tail_local = self.tail.copy()
+
+    def evaluate_envelope(self, point):
+        return 0.0
+
+
+class ArmatureBones(bpy_prop_collection):
+    # Not in the Blender API (bones are created as edit bones there)
+    def new(self, name, parent=None, matrix_local=None):
+        if matrix_local is None:
+            matrix_local = Matrix()
+        bone = Bone(name, parent, matrix_local)
+        self.append(bone)
+        return bone
+
+
+class Armature(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.bones = ArmatureBones()
+
+
+# ====================================
+# ========== Objects ==========
+# ====================================
+
+class VertexGroup:
+    def __init__(self, obj, name, index):
+        self.id_data = obj
+        self.name = name
+        self.index = index
+
+    def add(self, index, weight, type):
+        for vertex_index in index:
+            vertex = self.id_data.data.vertices[vertex_index]
+            groups = [group for group in vertex.groups if group.group != self.index]
+            if type == 'ADD':
+                for group in vertex.groups:
+                    if group.group == self.index:
+                        weight = weight + group.weight
+            groups.append(VertexGroupElement(self.index, weight))
+            vertex.groups = groups
+
+
+class VertexGroups(bpy_prop_collection):
+    def __init__(self, obj):
+        bpy_prop_collection.__init__(self)
+        self.id_data = obj
+
+    def new(self, name="Group"):
+        group = VertexGroup(self.id_data, name, len(self))
+        self.append(group)
+        return group
+
+
+class Object(ID):
+    def __init__(self, name, object_data):
+        ID.__init__(self, name)
+        self.data = object_data
+        if isinstance(object_data, Mesh):
+            self.type = 'MESH'
+        elif isinstance(object_data, Armature):
+            self.type = 'ARMATURE'
+        elif object_data is None:
+            self.type = 'EMPTY'
+        else:
+            self.type = type(object_data).__name__.upper()
+        self.matrix_world = Matrix()
+        self.parent = None
+        self.modifiers = bpy_prop_collection()
+        self.vertex_groups = VertexGroups(self)
+        self.select = False
+        self.hide = False
+        self.show_only_shape_key = False
+        self.active_shape_key_index = 0
+
+    @property
+    def material_slots(self):
+        if isinstance(self.data, Mesh):
+            return bpy_prop_collection(MaterialSlot(material) for material in self.data.materials)
+        return bpy_prop_collection()
+
+    @property
+    def active_shape_key(self):
+        if isinstance(self.data, Mesh) and self.data.shape_keys:
+            return self.data.shape_keys.key_blocks[self.active_shape_key_index]
+        return None
+
+    def is_visible(self, scene):
+        return not self.hide
+
+    def shape_key_add(self, name="Key", from_mix=True):
+        from . import data
+        mesh = self.data
+        if mesh.shape_keys is None:
+            mesh.shape_keys = Key("Key")
+            data.shape_keys.append(mesh.shape_keys)
+        shape_key = ShapeKey(name, mesh.vertices)
+        mesh.shape_keys.key_blocks.append(shape_key)
+        return shape_key
+
+    # Only shape keys are applied, modifiers are ignored
+    def to_mesh(self, scene, apply_modifiers, settings):
+        from . import data
+        mesh = self.data.copy()
+        shape_keys = self.data.shape_keys
+        if shape_keys and len(shape_keys.key_blocks) > 1:
+            basis = shape_keys.key_blocks[0]
+            if self.show_only_shape_key:
+                for vertex, point in zip(mesh.vertices, self.active_shape_key.data):
+                    vertex.co = point.co.copy()
+            else:
+                for index, vertex in enumerate(mesh.vertices):
+                    co = basis.data[index].co.copy()
+                    for shape_key in shape_keys.key_blocks[1:]:
+                        if shape_key.value != 0.0 and not shape_key.mute:
+                            co = co + (shape_key.data[index].co - basis.data[index].co) * shape_key.value
+                    vertex.co = co
+            mesh.calc_normals()
+        data.meshes.append(mesh)
+        return mesh
+
+
+# ====================================
+# ========== Animation ==========
+# ====================================
+
+class Keyframe:
+    def __init__(self, frame, value):
+        self.co = Vector((frame, value))
+        self.handle_left = Vector((frame, value))
+        self.handle_right = Vector((frame, value))
+        self.interpolation = 'LINEAR'
+
+
+class FCurveKeyframePoints(bpy_prop_collection):
+    def insert(self, frame, value, options=set()):
+        keyframe = Keyframe(frame, value)
+        for index, existing in enumerate(self):
+            if existing.co[0] == frame:
+                self[index] = keyframe
+                return keyframe
+            if existing.co[0] > frame:
+                self.insert_at(index, keyframe)
+                return keyframe
+        self.append(keyframe)
+        return keyframe
+
+    def insert_at(self, index, keyframe):
+        list.insert(self, index, keyframe)
+
+
+class FCurve:
+    def __init__(self, data_path, array_index, group):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.group = group
+        self.extrapolation = 'CONSTANT'
+        self.modifiers = bpy_prop_collection()
+        self.keyframe_points = FCurveKeyframePoints()
+
+    # Linear interpolation between the keyframes, constant extrapolation
+    def evaluate(self, frame):
+        points = self.keyframe_points
+        if len(points) == 0:
+            return 0.0
+        if frame <= points[0].co[0]:
+            return points[0].co[1]
+        if frame >= points[-1].co[0]:
+            return points[-1].co[1]
+        low = 0
+        high = len(points) - 1
+        while high - low > 1:
+            middle = (low + high) // 2
+            if points[middle].co[0] <= frame:
+                low = middle
+            else:
+                high = middle
+        frame1, value1 = points[low].co
+        frame2, value2 = points[high].co
+        return value1 + (value2 - value1) * (frame - frame1) / (frame2 - frame1)
+
+
+class ActionGroup:
+    def __init__(self, name):
+        self.name = name
+        self.channels = bpy_prop_collection()
+
+
+class ActionGroups(bpy_prop_collection):
+    def new(self, name):
+        group = ActionGroup(name)
+        self.append(group)
+        return group
+
+
+class ActionFCurves(bpy_prop_collection):
+    def __init__(self, action):
+        bpy_prop_collection.__init__(self)
+        self.action = action
+
+    def new(self, data_path, index=0, action_group=""):
+        group = None
+        if action_group:
+            group = self.action.groups.get(action_group)
+            if group is None:
+                group = self.action.groups.new(action_group)
+        fcurve = FCurve(data_path, index, group)
+        if group:
+            group.channels.append(fcurve)
+        self.append(fcurve)
+        return fcurve
+
+
+class Action(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.id_root = 'OBJECT'
+        self.groups = ActionGroups()
+        self.fcurves = ActionFCurves(self)
+
+    @property
+    def frame_range(self):
+        frames = [keyframe.co[0] for fcurve in self.fcurves for keyframe in fcurve.keyframe_points]
+        if not frames:
+            return Vector((0.0, 0.0))
+        return Vector((min(frames), max(frames)))
+
+
+# ====================================
+# ========== Scenes ==========
+# ====================================
+
+class Lamp(ID):
+    def __init__(self, name, type='POINT'):
+        ID.__init__(self, name)
+        self.type = type
+        self.color = Color((1.0, 1.0, 1.0))
+
+
+class World(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.ambient_color = Color((0.0, 0.0, 0.0))
+
+
+class RenderSettings:
+    def __init__(self):
+        self.fps = 24
+        self.fps_base = 1.0
+
+
+class SceneObjects(bpy_prop_collection):
+    def link(self, obj):
+        self.append(obj)
+
+    def unlink(self, obj):
+        self.remove(obj)
+
+
+class Scene(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.objects = SceneObjects()
+        self.world = None
+        self.render = RenderSettings()
+        self.frame_start = 1
+        self.frame_end = 250
+        self.frame_current = 1
+
+    def frame_set(self, frame, subframe=0.0):
+        self.frame_current = frame
+
+    def update(self):
+        pass
+
+
+# ====================================
+# ========== User interface ==========
+# ====================================
+
+class Operator:
+    bl_idname = ""
+    bl_label = ""
+    bl_options = set()
+
+    def report(self, type, message):
+        print("{0}: {1}".format("/".join(sorted(type)), message))
+
+
+class Menu:
+    draw_functions = []
+
+    @classmethod
+    def append(cls, draw_function):
+        cls.draw_functions.append(draw_function)
+
+    @classmethod
+    def remove(cls, draw_function):
+        cls.draw_functions.remove(draw_function)
+
+
+class INFO_MT_file_export(Menu):
+    draw_functions = []
@@ -0,0 +1,431 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Pure Python stand-in for the part of Blender 2.6x mathutils the exporter uses.
+# Same conventions as Blender 2.6x: matrices are indexed by row (matrix[0][3] is the x translation),
+# "matrix * vector" transforms a column vector, "vector * matrix" a row vector, "vector * vector"
+# is the dot product and quaternions are constructed and iterated in (w, x, y, z) order.
+# Values are Python floats (doubles), Blender uses single precision floats.
+
+from math import sqrt, sin, cos, acos
+
+
+class Vector:
+    def __init__(self, seq=(0.0, 0.0, 0.0)):
+        self._values = [float(value) for value in seq]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Vector(self._values[index])
+        return self._values[index]
+
+    def __setitem__(self, index, value):
+        self._values[index] = float(value)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector) and self._values == other._values
+
+    def __repr__(self):
+        return "Vector(({0}))".format(", ".join("{0:.4f}".format(value) for value in self._values))
+
+    def _get_axis(index):
+        return property(lambda self: self._values[index],
+                        lambda self, value: self.__setitem__(index, value))
+
+    x = _get_axis(0)
+    y = _get_axis(1)
+    z = _get_axis(2)
+    w = _get_axis(3)
+    del _get_axis
+
+    def copy(self):
+        return Vector(self._values)
+
+    def to_tuple(self):
+        return tuple(self._values)
+
+    def __add__(self, other):
+        return Vector([a + b for a, b in zip(self._values, other)])
+
+    def __sub__(self, other):
+        return Vector([a - b for a, b in zip(self._values, other)])
+
+    def __neg__(self):
+        return Vector([-a for a in self._values])
+
+    def __mul__(self, other):
+        if isinstance(other, Vector):
+            return self.dot(other)
+        if isinstance(other, Matrix):
+            # Row vector times matrix
+            return Vector([sum(self._values[i] * other[i][j] for i in range(len(self._values)))
+                           for j in range(other.col_size)])
+        return Vector([a * other for a in self._values])
+
+    def __rmul__(self, other):
+        return Vector([a * other for a in self._values])
+
+    def __imul__(self, other):
+        result = self * other
+        self._values = list(result)
+        return self
+
+    def __truediv__(self, other):
+        return Vector([a / other for a in self._values])
+
+    @property
+    def length(self):
+        return sqrt(sum(a * a for a in self._values))
+
+    def dot(self, other):
+        return sum(a * b for a, b in zip(self._values, other))
+
+    def cross(self, other):
+        ax, ay, az = self._values[:3]
+        bx, by, bz = list(other)[:3]
+        return Vector((ay*bz - az*by, az*bx - ax*bz, ax*by - ay*bx))
+
+    def normalize(self):
+        length = self.length
+        if length != 0.0:
+            self._values = [a / length for a in self._values]
+
+    def normalized(self):
+        vector = self.copy()
+        vector.normalize()
+        return vector
+
+    # Rotate by a Quaternion, Euler or (3x3 or 4x4) Matrix
+    def rotate(self, other):
+        if isinstance(other, Quaternion) or isinstance(other, Euler):
+            other = other.to_matrix()
+        rotated = other.to_3x3() * self
+        self._values = list(rotated)
+
+
+class Matrix:
+    def __init__(self, rows=None):
+        if rows is None:
+            rows = [[1.0 if i == j else 0.0 for j in range(4)] for i in range(4)]
+        self._rows = [Vector(row) for row in rows]
+
+    @classmethod
+    def Identity(cls, size):
+        return cls([[1.0 if i == j else 0.0 for j in range(size)] for i in range(size)])
+
+    @classmethod
+    def Translation(cls, vector):
+        matrix = cls.Identity(4)
+        for i in range(3):
+            matrix[i][3] = vector[i]
+        return matrix
+
+    @classmethod
+    def Scale(cls, factor, size, axis=None):
+        matrix = cls.Identity(size)
+        if axis is None:
+            for i in range(min(size, 3)):
+                matrix[i][i] = factor
+        else:
+            axis = Vector(axis).normalized()
+            for i in range(len(axis)):
+                for j in range(len(axis)):
+                    matrix[i][j] += (factor - 1.0) * axis[i] * axis[j]
+        return matrix
+
+    @property
+    def row_size(self):
+        return len(self._rows)
+
+    @property
+    def col_size(self):
+        return len(self._rows[0])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __getitem__(self, index):
+        return self._rows[index]
+
+    def __repr__(self):
+        return "Matrix(({0}))".format(",\n        ".join(repr(tuple(row)) for row in self._rows))
+
+    def copy(self):
+        return Matrix(self._rows)
+
+    def __mul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix([[sum(self._rows[i][k] * other[k][j] for k in range(self.col_size))
+                            for j in range(other.col_size)] for i in range(self.row_size)])
+        if isinstance(other, Vector):
+            values = list(other)
+            # A 3D vector is transformed as a point by a 4x4 matrix
+            if len(values) == 3 and self.col_size == 4:
+                values.append(1.0)
+                return Vector([sum(self._rows[i][k] * values[k] for k in range(4)) for i in range(3)])
+            return Vector([sum(self._rows[i][k] * values[k] for k in range(len(values)))
+                           for i in range(self.row_size)])
+        return Matrix([[value * other for value in row] for row in self._rows])
+
+    def transposed(self):
+        return Matrix([[self._rows[i][j] for i in range(self.row_size)] for j in range(self.col_size)])
+
+    def determinant(self):
+        rows = [list(row) for row in self._rows]
+        size = len(rows)
+        determinant = 1.0
+        for col in range(size):
+            pivot = max(range(col, size), key=lambda row: abs(rows[row][col]))
+            if rows[pivot][col] == 0.0:
+                return 0.0
+            if pivot != col:
+                rows[col], rows[pivot] = rows[pivot], rows[col]
+                determinant = -determinant
+            determinant *= rows[col][col]
+            for row in range(col + 1, size):
+                factor = rows[row][col] / rows[col][col]
+                for k in range(col, size):
+                    rows[row][k] -= factor * rows[col][k]
+        return determinant
+
+    # Gauss-Jordan elimination with partial pivoting
+    def inverted(self):
+        size = self.row_size
+        rows = [list(row) + [1.0 if i == j else 0.0 for j in range(size)] for i, row in enumerate(self._rows)]
+        for col in range(size):
+            pivot = max(range(col, size), key=lambda row: abs(rows[row][col]))
+            if rows[pivot][col] == 0.0:
+                raise ValueError("Matrix.inverted(): matrix does not have an inverse")
+            rows[col], rows[pivot] = rows[pivot], rows[col]
+            factor = rows[col][col]
+            rows[col] = [value / factor for value in rows[col]]
+            for row in range(size):
+                if row != col and rows[row][col] != 0.0:
+                    factor = rows[row][col]
+                    rows[row] = [a - factor * b for a, b in zip(rows[row], rows[col])]
+        return Matrix([row[size:] for row in rows])
+
+    def to_3x3(self):
+        return Matrix([list(self._rows[i])[:3] for i in range(3)])
+
+    def to_4x4(self):
+        matrix = Matrix.Identity(4)
+        for i in range(min(self.row_size, 4)):
+            for j in range(min(self.col_size, 4)):
+                matrix[i][j] = self._rows[i][j]
+        return matrix
+
+    def to_translation(self):
+        return Vector((self._rows[0][3], self._rows[1][3], self._rows[2][3]))
+
+    def to_scale(self):
+        scale = Vector([Vector([self._rows[i][j] for i in range(3)]).length for j in range(3)])
+        if self.to_3x3().determinant() < 0.0:
+            scale = -scale
+        return scale
+
+    def to_quaternion(self):
+        # Remove the scale first, same as Blender does
+        scale = self.to_scale()
+        m = [[self._rows[i][j] / scale[j] if scale[j] != 0.0 else 0.0 for j in range(3)] for i in range(3)]
+        trace = m[0][0] + m[1][1] + m[2][2]
+        if trace > 0.0:
+            s = 2.0 * sqrt(trace + 1.0)
+            quat = (0.25 * s, (m[2][1] - m[1][2]) / s, (m[0][2] - m[2][0]) / s, (m[1][0] - m[0][1]) / s)
+        elif m[0][0] > m[1][1] and m[0][0] > m[2][2]:
+            s = 2.0 * sqrt(1.0 + m[0][0] - m[1][1] - m[2][2])
+            quat = ((m[2][1] - m[1][2]) / s, 0.25 * s, (m[0][1] + m[1][0]) / s, (m[0][2] + m[2][0]) / s)
+        elif m[1][1] > m[2][2]:
+            s = 2.0 * sqrt(1.0 + m[1][1] - m[0][0] - m[2][2])
+            quat = ((m[0][2] - m[2][0]) / s, (m[0][1] + m[1][0]) / s, 0.25 * s, (m[1][2] + m[2][1]) / s)
+        else:
+            s = 2.0 * sqrt(1.0 + m[2][2] - m[0][0] - m[1][1])
+            quat = ((m[1][0] - m[0][1]) / s, (m[0][2] + m[2][0]) / s, (m[1][2] + m[2][1]) / s, 0.25 * s)
+        quaternion = Quaternion(quat)
+        quaternion.normalize()
+        return quaternion
+
+    def decompose(self):
+        return self.to_translation(), self.to_quaternion(), self.to_scale()
+
+
+class Quaternion:
+    def __init__(self, seq=(1.0, 0.0, 0.0, 0.0)):
+        self._values = [float(value) for value in seq]
+
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __setitem__(self, index, value):
+        self._values[index] = float(value)
+
+    def __repr__(self):
+        return "Quaternion(({0}))".format(", ".join("{0:.4f}".format(value) for value in self._values))
+
+    def _get_axis(index):
+        return property(lambda self: self._values[index],
+                        lambda self, value: self.__setitem__(index, value))
+
+    w = _get_axis(0)
+    x = _get_axis(1)
+    y = _get_axis(2)
+    z = _get_axis(3)
+    del _get_axis
+
+    def copy(self):
+        return Quaternion(self._values)
+
+    @property
+    def magnitude(self):
+        return sqrt(sum(a * a for a in self._values))
+
+    def normalize(self):
+        magnitude = self.magnitude
+        if magnitude != 0.0:
+            self._values = [a / magnitude for a in self._values]
+
+    def normalized(self):
+        quat = self.copy()
+        quat.normalize()
+        return quat
+
+    def conjugated(self):
+        w, x, y, z = self._values
+        return Quaternion((w, -x, -y, -z))
+
+    def inverted(self):
+        length_squared = sum(a * a for a in self._values)
+        w, x, y, z = self._values
+        return Quaternion((w / length_squared, -x / length_squared, -y / length_squared, -z / length_squared))
+
+    def __mul__(self, other):
+        if isinstance(other, Quaternion):
+            w1, x1, y1, z1 = self._values
+            w2, x2, y2, z2 = other._values
+            return Quaternion((w1*w2 - x1*x2 - y1*y2 - z1*z2,
+                               w1*x2 + x1*w2 + y1*z2 - z1*y2,
+                               w1*y2 - x1*z2 + y1*w2 + z1*x2,
+                               w1*z2 + x1*y2 - y1*x2 + z1*w2))
+        if isinstance(other, Vector):
+            return self.to_matrix() * other
+        return Quaternion([a * other for a in self._values])
+
+    # Rotate by another rotation: self becomes other * self
+    def rotate(self, other):
+        if not isinstance(other, Quaternion):
+            other = other.to_quaternion()
+        magnitude = self.magnitude
+        rotated = other.normalized() * self.normalized()
+        self._values = [a * magnitude for a in rotated._values]
+
+    def to_matrix(self):
+        w, x, y, z = self.normalized()._values
+        return Matrix(((1.0 - 2.0*(y*y + z*z), 2.0*(x*y - w*z), 2.0*(x*z + w*y)),
+                       (2.0*(x*y + w*z), 1.0 - 2.0*(x*x + z*z), 2.0*(y*z - w*x)),
+                       (2.0*(x*z - w*y), 2.0*(y*z + w*x), 1.0 - 2.0*(x*x + y*y))))
+
+    def slerp(self, other, factor):
+        dot = sum(a * b for a, b in zip(self._values, other._values))
+        target = list(other._values)
+        if dot < 0.0:
+            dot = -dot
+            target = [-a for a in target]
+        if dot > 0.9995:
+            return Quaternion([a + (b - a) * factor for a, b in zip(self._values, target)]).normalized()
+        angle = acos(dot)
+        s1 = sin((1.0 - factor) * angle) / sin(angle)
+        s2 = sin(factor * angle) / sin(angle)
+        return Quaternion([s1 * a + s2 * b for a, b in zip(self._values, target)])
+
+
+class Euler:
+    def __init__(self, angles=(0.0, 0.0, 0.0), order='XYZ'):
+        self._values = [float(value) for value in angles]
+        self.order = order
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    x = property(lambda self: self._values[0])
+    y = property(lambda self: self._values[1])
+    z = property(lambda self: self._values[2])
+
+    def to_matrix(self):
+        axis_matrices = {}
+        for axis, angle in zip("XYZ", self._values):
+            c = cos(angle)
+            s = sin(angle)
+            if axis == 'X':
+                axis_matrices[axis] = Matrix(((1.0, 0.0, 0.0), (0.0, c, -s), (0.0, s, c)))
+            elif axis == 'Y':
+                axis_matrices[axis] = Matrix(((c, 0.0, s), (0.0, 1.0, 0.0), (-s, 0.0, c)))
+            else:
+                axis_matrices[axis] = Matrix(((c, -s, 0.0), (s, c, 0.0), (0.0, 0.0, 1.0)))
+        # The first axis of the order is applied first
+        matrix = Matrix.Identity(3)
+        for axis in self.order:
+            matrix = axis_matrices[axis] * matrix
+        return matrix
+
+    def to_quaternion(self):
+        return self.to_matrix().to_quaternion()
+
+
+class Color:
+    def __init__(self, rgb=(0.0, 0.0, 0.0)):
+        self._values = [float(value) for value in rgb]
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    r = property(lambda self: self._values[0])
+    g = property(lambda self: self._values[1])
+    b = property(lambda self: self._values[2])
+
+    def copy(self):
+        return Color(self._values)
@@ -76,6 +76,14 @@ if "bpy" in locals():
         #print("reload mesh_classes")
         imp.reload(mesh_classes)
 
+    if "mesh_optimize" in locals():
+        #print("reload mesh_optimize")
+        imp.reload(mesh_optimize)
+
+    if "mesh_lod" in locals():
+        #print("reload mesh_lod")
+        imp.reload(mesh_lod)
+
     if "export_mesh" in locals():
         #print("reload export_mesh")
         imp.reload(export_mesh)
@@ -96,6 +104,22 @@ if "bpy" in locals():
         #print("reload export_action")
         imp.reload(export_action)
 
+    if "mesh_parallel" in locals():
+        #print("reload mesh_parallel")
+        imp.reload(mesh_parallel)
+
+    if "export_cache" in locals():
+        #print("reload export_cache")
+        imp.reload(export_cache)
+
+    if "profiling" in locals():
+        #print("reload profiling")
+        imp.reload(profiling)
+
+    if "memory_trace" in locals():
+        #print("reload memory_trace")
+        imp.reload(memory_trace)
+
 
 import bpy
 from bpy import ops
@@ -156,6 +180,19 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
         description="Set the desired frame rate (IMVU expects 30). You can set the value in Blender in Scene, Render settings.",
         default=30.0)
 
+    bake_animation = BoolProperty(name="Bake animations",
+        description="Sample every bone once per frame between the first and last keyframe of an animation instead of only at its keyframes, so eased curves keep their shape (use with Reduce keyframes to keep the files small).",
+        default=False)
+    reduce_keyframes = BoolProperty(name="Reduce keyframes",
+        description="Leave out the animation keyframes that Cal3d can interpolate from the other keyframes within the tolerances below (much smaller files for motion capture).",
+        default=False)
+    keyframe_loc_tolerance = FloatProperty(name="Translation tolerance",
+        description="Maximum distance between a left out keyframe and the interpolated translation.",
+        default=0.01, min=0.0)
+    keyframe_angle_tolerance = FloatProperty(name="Rotation tolerance",
+        description="Maximum angle in degrees between a left out keyframe and the interpolated rotation.",
+        default=0.5, min=0.0, max=180.0)
+
     #path_mode = bpy_extras.io_utils.path_reference_mode
 
     use_groups = BoolProperty(name="Vertex Groups",
@@ -220,6 +257,47 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
     write_amb = BoolProperty(name="Write scene ambient color to XSF", 
         description="Whether or not to write scene ambient color (uses Blender's world ambient color which is gamma corrected and may look different than the color in IMVU).",
         default=True)
+
+    compute_shapekey_normals = BoolProperty(name="Compute morph normals",
+        description="Compute shape key (morph) normals directly from the shape key data instead of creating a temporary mesh for each shape key (faster, requires NumPy, ignores modifiers).",
+        default=False)
+
+    # Note that the Cal3d saver uses 0.01 for binary and 1.0 for xml files, we go in the middle with 0.1
+    morph_tolerance = FloatProperty(name="Morph tolerance",
+        description="Minimum distance a shape key vertex needs to move before it is exported as a blend vertex of the morph.",
+        default=0.1, min=0.0)
+
+    # IMVU skins with at most 4 influences per vertex
+    max_influences = IntProperty(name="Maximum influences",
+        description="Maximum number of bone influences per vertex, the lightest ones are dropped and the remaining weights normalized (0 = no maximum).",
+        default=4, min=0, max=16)
+
+    optimize_vertex_cache = BoolProperty(name="Optimize vertex cache",
+        description="Reorder the triangles and vertices of each submesh so the GPU can reuse more transformed vertices (slower export).",
+        default=False)
+
+    lod_reduction = FloatProperty(name="LOD reduction",
+        description="Fraction of the triangles of each submesh the level of detail may remove when the avatar is far away (0 = no level of detail). UV seams, skin weights and morphs are kept intact.",
+        default=0.0, min=0.0, max=1.0)
+
+    export_processes = IntProperty(name="Worker processes",
+        description="Number of worker processes used to write XML meshes (1 = no worker processes). Requires Python 3.8 or higher and the fork start method (not on Windows). The Blender versions this exporter supports bundle an older Python, there the option is hidden and meshes are written without worker processes.",
+        default=1, min=1, max=64)
+
+    use_export_cache = BoolProperty(name="Only export changed files",
+        description="Remember a hash of the data used for every exported file and skip files whose data and export options didn't change since the previous export.",
+        default=False)
+
+    # Not in the user interface: "all" to profile the whole export or a comma separated list
+    # of phases (mesh, animation, write, ...), see profiling.py
+    profile_phases = StringProperty(name="Profile",
+        description="Run the export under cProfile and write a .pstats file and a summary next to the log: all, or a comma separated list of phases (skeleton, materials, mesh, shape_keys, animation, morph_animation, write).",
+        default="", options={'HIDDEN'})
+
+    # Not in the user interface either, see memory_trace.py
+    trace_memory = BoolProperty(name="Trace memory",
+        description="Measure the peak and retained memory of every export phase with tracemalloc and log the top allocation sites (slow).",
+        default=False, options={'HIDDEN'})
     
     def execute(self, context):
         from . import export_mesh
@@ -228,8 +306,13 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
         from .export_armature import create_cal3d_skeleton
         from .export_mesh import create_cal3d_materials
         from .export_mesh import create_cal3d_mesh
+        from .export_mesh import use_mesh_materials
         from .export_action import create_cal3d_animation
         from .export_action import create_cal3d_morph_animation
+        from .mesh_parallel import create_vertex_formatter
+        from .export_cache import ExportCache, hash_skeleton, hash_mesh, hash_action, hash_morph_action
+        from .profiling import ExportProfiler, parse_profile_phases
+        from .memory_trace import MemoryTracer, memory_tracing_available
         from . import logger_class
         from .logger_class import Logger, LogMessage
 
@@ -243,15 +326,44 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
                 LogMessage.log_message("\nExport aborted.\n")
                 # Log amount of errors
                 LogMessage.log_counters()
+                write_report("aborted")
+                write_profile()
+                stop_memory_trace()
                 # Close the logger
                 LogMessage.close_log()
         
+        def write_report(status):
+            try:
+                LogMessage.write_report(self.report_file, {"status": status, "filepath": self.filepath,
+                                                           "blend_file": bpy.data.filepath})
+            except (OSError, TypeError, ValueError) as e:
+                LogMessage.log_warning("Could not write export report " + self.report_file + ": " + str(e))
+
+        def write_profile():
+            if LogMessage.profiler:
+                profile_base = os.path.splitext(self.log_file)[0] + "_profile"
+                try:
+                    if LogMessage.profiler.write(profile_base + ".pstats", profile_base + ".txt"):
+                        LogMessage.log_message("Profile written to " + profile_base + ".pstats")
+                    else:
+                        LogMessage.log_warning("Nothing was profiled, none of the phases " + self.profile_phases + " happened")
+                except OSError as e:
+                    LogMessage.log_warning("Could not write profile " + profile_base + ".pstats: " + str(e))
+                LogMessage.profiler = None
+
+        def stop_memory_trace():
+            if LogMessage.memory_tracer:
+                LogMessage.memory_tracer.stop()
+                LogMessage.memory_tracer = None
+
         # Get the user's desired filename
         sc = ""
         if len(bpy.data.scenes) > 1:
             sc = context.scene.name + "_"
         self.file_prefix = os.path.splitext(os.path.basename(self.filepath))[0]
-        self.log_file = os.path.dirname(self.filepath)+'\\'+self.file_prefix+".log"
+        self.log_file = os.path.join(os.path.dirname(self.filepath), self.file_prefix + ".log")
+        # Timings and counters of the export go to a json report next to the log
+        self.report_file = os.path.join(os.path.dirname(self.filepath), self.file_prefix + "_report.json")
         # dont want the last part added to logfile name:
         self.file_prefix = self.file_prefix + "_" + sc
 
@@ -267,6 +379,24 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
         # Console only message to show where we are writing the log file:
         print("Logging info to file: " + LogMessage.file + "\n")
         
+        if self.trace_memory:
+            if memory_tracing_available():
+                LogMessage.memory_tracer = MemoryTracer()
+                LogMessage.memory_tracer.start()
+                LogMessage.log_message("Tracing memory use per phase")
+            else:
+                LogMessage.log_warning("Memory tracing needs the tracemalloc module (Python 3.4 or higher), not tracing.")
+
+        if self.profile_phases:
+            try:
+                LogMessage.profiler = ExportProfiler(parse_profile_phases(self.profile_phases))
+            except ValueError as e:
+                LogMessage.log_warning(str(e) + ", not profiling.")
+            else:
+                LogMessage.log_message("Profiling: " + self.profile_phases)
+                if LogMessage.profiler.profiles_all():
+                    LogMessage.profiler.start_all()
+
         LogMessage.log_message("Reading and converting selected objects.")
 
         # jgb Set desired Cal3d xml export version only once and change it from 900 to 919.
@@ -289,6 +419,41 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
         cal3d_used_materials = []
         armature_obj = None
 
+        # Export cache: digests of the files we are going to write and names of the unchanged
+        # meshes, animations and morph animations that we skip
+        export_cache = None
+        if self.use_export_cache:
+            export_cache = ExportCache(os.path.join(cal3d_dirname, self.file_prefix + "export_cache.json"))
+        output_digests = {}
+        cached_mesh_names = []
+        cached_animation_names = []
+        cached_morph_animation_names = []
+        skeleton_digest = None
+
+        # Names of the files we export
+        def skeleton_filename(name):
+            if self.skeleton_binary_bool == 'binary':
+                return self.skeleton_prefix + name + ".csf"
+            return self.skeleton_prefix + name + ".xsf"
+
+        def mesh_filename(name):
+            if self.mesh_binary_bool == 'binary':
+                return self.mesh_prefix + name + ".cmf"
+            return self.mesh_prefix + name + ".xmf"
+
+        def animation_filename(name):
+            if self.animation_binary_bool == 'binary':
+                return self.anim_prefix + name + ".caf"
+            return self.anim_prefix + name + ".xaf"
+
+        def morph_animation_filename(name):
+            return self.anim_prefix + name + ".xpf"
+
+        # Remember the digest of the file we just wrote in the export cache
+        def update_export_cache(filepath):
+            if export_cache and filepath in output_digests:
+                export_cache.update(filepath, output_digests[filepath])
+
         # base_translation, base_rotation, and base_scale are user adjustments to the export
         base_translation = mathutils.Vector([0.0, 0.0, 0.0])
         base_rotation = mathutils.Euler([self.base_rotation[0],
@@ -310,15 +475,21 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
                     if cal3d_skeleton:
                         raise RuntimeError("Only one armature is supported per scene")
                     armature_obj = obj
-                    cal3d_skeleton = create_cal3d_skeleton(obj, obj.data,
-                                                           base_rotation.copy(),
-                                                           base_translation.copy(),
-                                                           base_scale, Cal3d_xml_version, 
-                                                           self.write_amb, bpy.data.lamps)
+                    with LogMessage.span("skeleton", obj.name):
+                        cal3d_skeleton = create_cal3d_skeleton(obj, obj.data,
+                                                               base_rotation.copy(),
+                                                               base_translation.copy(),
+                                                               base_scale, Cal3d_xml_version, 
+                                                               self.write_amb, bpy.data.lamps)
                     # Add the ambient color as set in blend world to the skeleton
                     # Note that color in Blender may look different than in IMVU due to Blender using color management!
                     if context.scene.world:
-                        cal3d_skeleton.scene_ambient_color = context.scene.world.ambient_color
+                        cal3d_skeleton.scene_ambient_color = tuple(context.scene.world.ambient_color)
+                    if export_cache:
+                        skeleton_digest = hash_skeleton(obj, bpy.data.lamps,
+                            (Cal3d_xml_version, self.skeleton_binary_bool, self.write_amb,
+                             tuple(self.base_rotation), base_scale, tuple(cal3d_skeleton.scene_ambient_color)))
+                        output_digests[os.path.join(cal3d_dirname, skeleton_filename(cal3d_skeleton.name))] = skeleton_digest
         except Exception as e:
             fatal_error(LogMessage, "###### FATAL ERROR DURING ARMATURE EXPORT ######", 
                         e, traceback.format_exc())
@@ -330,18 +501,35 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
             if self.debug_ExportCal3D > 0:
                 LogMessage.log_debug("ExportCal3D: export meshes and materials.")
             try:
-                cal3d_materials = create_cal3d_materials(cal3d_dirname, self.imagepath_prefix, Cal3d_xml_version, self.copy_img)
+                with LogMessage.span("materials"):
+                    cal3d_materials = create_cal3d_materials(cal3d_dirname, self.imagepath_prefix, Cal3d_xml_version, self.copy_img)
 
                 # jgb 2012-11-09 We currently  can't do the meshes without at least 1 material
                 if len(cal3d_materials) > 0:
                     for obj in visible_objects:
                         if obj.type == "MESH" and obj.is_visible(context.scene):
+                            if export_cache:
+                                # Material numbering depends on all meshes, so always assign the materials
+                                mesh_materials = use_mesh_materials(obj, cal3d_materials, cal3d_used_materials)
+                                mesh_digest = hash_mesh(obj, skeleton_digest, mesh_materials,
+                                    (Cal3d_xml_version, self.mesh_binary_bool, tuple(self.base_rotation), base_scale,
+                                     self.use_groups, self.compute_shapekey_normals, self.morph_tolerance,
+                                     self.max_influences, self.optimize_vertex_cache, self.lod_reduction))
+                                mesh_filepath = os.path.join(cal3d_dirname, mesh_filename(obj.name))
+                                if export_cache.is_unchanged(mesh_filepath, mesh_digest):
+                                    cached_mesh_names.append(obj.name)
+                                    continue
+                                output_digests[mesh_filepath] = mesh_digest
                             # jgb 2012-11-14 Creating mesh can fail for several reasons.
                             # Therefore append only after we have checked there really is a mesh
-                            mesh_result = create_cal3d_mesh(context.scene, obj, 
-                                    cal3d_skeleton, cal3d_materials, cal3d_used_materials,
-                                    base_rotation, base_translation, base_scale, 
-                                    Cal3d_xml_version, self.use_groups, False, armature_obj)
+                            with LogMessage.span("mesh", obj.name):
+                                mesh_result = create_cal3d_mesh(context.scene, obj, 
+                                        cal3d_skeleton, cal3d_materials, cal3d_used_materials,
+                                        base_rotation, base_translation, base_scale, 
+                                        Cal3d_xml_version, self.use_groups, False, armature_obj,
+                                        self.compute_shapekey_normals, self.morph_tolerance,
+                                        self.max_influences, self.optimize_vertex_cache,
+                                        self.lod_reduction)
                             if mesh_result:
                                 cal3d_meshes.append(mesh_result)
                 else:
@@ -361,9 +549,23 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
             try:
                 if cal3d_skeleton:
                     for action in bpy.data.actions:
+                        if export_cache:
+                            animation_digest = hash_action(action, skeleton_digest,
+                                (Cal3d_xml_version, self.animation_binary_bool, fps, self.bake_animation,
+                                 self.reduce_keyframes, self.keyframe_loc_tolerance, self.keyframe_angle_tolerance))
+                            animation_filepath = os.path.join(cal3d_dirname, animation_filename(action.name))
+                            if export_cache.is_unchanged(animation_filepath, animation_digest):
+                                cached_animation_names.append(action.name)
+                                continue
+                            output_digests[animation_filepath] = animation_digest
                         # TODO: check action.id_root first for correct type (see morph animation)
-                        cal3d_animation = create_cal3d_animation(cal3d_skeleton,
-                                                                 action, fps, Cal3d_xml_version)
+                        with LogMessage.span("animation", action.name):
+                            cal3d_animation = create_cal3d_animation(cal3d_skeleton,
+                                                                     action, fps, Cal3d_xml_version,
+                                                                     self.reduce_keyframes,
+                                                                     self.keyframe_loc_tolerance,
+                                                                     self.keyframe_angle_tolerance,
+                                                                     self.bake_animation)
                         if cal3d_animation:
                             cal3d_animations.append(cal3d_animation)
                 else:
@@ -381,9 +583,18 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
             try:
                 for action in bpy.data.actions:
                     if action.id_root == "KEY":
+                        if export_cache:
+                            animation_digest = hash_morph_action(action, bpy.data.shape_keys,
+                                                                 (Cal3d_xml_version, fps))
+                            animation_filepath = os.path.join(cal3d_dirname, morph_animation_filename(action.name))
+                            if export_cache.is_unchanged(animation_filepath, animation_digest):
+                                cached_morph_animation_names.append(action.name)
+                                continue
+                            output_digests[animation_filepath] = animation_digest
                         if bpy.data.shape_keys:
-                            cal3d_morph_animation = create_cal3d_morph_animation(
-                                bpy.data.shape_keys, action, fps, Cal3d_xml_version)
+                            with LogMessage.span("morph_animation", action.name):
+                                cal3d_morph_animation = create_cal3d_morph_animation(
+                                    bpy.data.shape_keys, action, fps, Cal3d_xml_version)
                             if cal3d_morph_animation:
                                 cal3d_morph_animations.append(cal3d_morph_animation)
                             
@@ -396,20 +607,26 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
         # Start writing the collected info to files...
         LogMessage.log_message("\nWriting Cal3d files.")
 
+        # The xml files are written one element at a time, use a large buffer to keep the number of writes down
+        xml_buffer_size = 1024 * 1024
+
         if self.export_xsf:
-            if cal3d_skeleton:
-                if self.skeleton_binary_bool == 'binary':
-                    skeleton_filename = self.skeleton_prefix + cal3d_skeleton.name + ".csf"
-                    skeleton_filepath = os.path.join(cal3d_dirname, skeleton_filename)
-                    cal3d_skeleton_file = open(skeleton_filepath, "wb")
-                    cal3d_skeleton.to_cal3d_binary(cal3d_skeleton_file)
-                else:
-                    skeleton_filename = self.skeleton_prefix + cal3d_skeleton.name + ".xsf"
-                    skeleton_filepath = os.path.join(cal3d_dirname, skeleton_filename)
-                    cal3d_skeleton_file = open(skeleton_filepath, "wt")
-                    cal3d_skeleton_file.write(cal3d_skeleton.to_cal3d_xml())
-                cal3d_skeleton_file.close()
-                LogMessage.log_message("  Skeleton '%s'" % (skeleton_filename))
+            if cal3d_skeleton and export_cache and export_cache.is_unchanged(
+                    os.path.join(cal3d_dirname, skeleton_filename(cal3d_skeleton.name)), skeleton_digest):
+                LogMessage.log_message("  Skeleton '%s' unchanged, not written" % (skeleton_filename(cal3d_skeleton.name)))
+            elif cal3d_skeleton:
+                with LogMessage.span("write", skeleton_filename(cal3d_skeleton.name)):
+                    if self.skeleton_binary_bool == 'binary':
+                        skeleton_filepath = os.path.join(cal3d_dirname, skeleton_filename(cal3d_skeleton.name))
+                        cal3d_skeleton_file = open(skeleton_filepath, "wb")
+                        cal3d_skeleton.to_cal3d_binary(cal3d_skeleton_file)
+                    else:
+                        skeleton_filepath = os.path.join(cal3d_dirname, skeleton_filename(cal3d_skeleton.name))
+                        cal3d_skeleton_file = open(skeleton_filepath, "wt", buffering=xml_buffer_size)
+                        cal3d_skeleton.write_cal3d_xml(cal3d_skeleton_file)
+                    cal3d_skeleton_file.close()
+                update_export_cache(skeleton_filepath)
+                LogMessage.log_message("  Skeleton '%s'" % (skeleton_filename(cal3d_skeleton.name)))
             else:
                 LogMessage.log_error("No skeleton selected!")
 
@@ -419,64 +636,80 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
                 if cal3d_material.in_use == True:   # Should not be necessary now but cant hurt
                     if self.material_binary_bool == 'binary':
                         material_filename = self.material_prefix + cal3d_material.name + ".crf"
-                        material_filepath = os.path.join(cal3d_dirname, material_filename)
-                        cal3d_material_file = open(material_filepath, "wb")
-                        cal3d_material.to_cal3d_binary(cal3d_material_file)
                     else:
                         material_filename = self.material_prefix + cal3d_material.name + ".xrf"
-                        material_filepath = os.path.join(cal3d_dirname, material_filename)
-                        cal3d_material_file = open(material_filepath, "wt")
-                        cal3d_material_file.write(cal3d_material.to_cal3d_xml())
-                    cal3d_material_file.close()
+                    material_filepath = os.path.join(cal3d_dirname, material_filename)
+                    with LogMessage.span("write", material_filename):
+                        if self.material_binary_bool == 'binary':
+                            cal3d_material_file = open(material_filepath, "wb")
+                            cal3d_material.to_cal3d_binary(cal3d_material_file)
+                        else:
+                            cal3d_material_file = open(material_filepath, "wt")
+                            cal3d_material_file.write(cal3d_material.to_cal3d_xml())
+                        cal3d_material_file.close()
                     LogMessage.log_message("  Material '%s' with index %s" % (material_filename, i))
                 i += 1
 
         if self.export_xmf:
+            for mesh_name in cached_mesh_names:
+                LogMessage.log_message("  Mesh '%s' unchanged, not written" % (mesh_filename(mesh_name)))
             if cal3d_meshes != []:
-                for cal3d_mesh in cal3d_meshes:
-                    if self.mesh_binary_bool == 'binary':
-                        mesh_filename = self.mesh_prefix + cal3d_mesh.name + ".cmf"
-                        mesh_filepath = os.path.join(cal3d_dirname, mesh_filename)
-                        cal3d_mesh_file = open(mesh_filepath, "wb")
-                        cal3d_mesh.to_cal3d_binary(cal3d_mesh_file)
-                    else:
-                        mesh_filename = self.mesh_prefix + cal3d_mesh.name + ".xmf"
-                        mesh_filepath = os.path.join(cal3d_dirname, mesh_filename)
-                        cal3d_mesh_file = open(mesh_filepath, "wt")
-                        cal3d_mesh_file.write(cal3d_mesh.to_cal3d_xml())
-                    cal3d_mesh_file.close()
-                    LogMessage.log_message("  Mesh '%s' with material(s) %s" % (mesh_filename, [x.material_id for x in cal3d_mesh.submeshes]))
-            else:
+                vertex_formatter = None
+                if self.mesh_binary_bool != 'binary' and self.export_processes > 1:
+                    vertex_formatter = create_vertex_formatter(self.export_processes)
+                    if not vertex_formatter:
+                        LogMessage.log_warning("Worker processes are not supported here, writing meshes without them.")
+                # Always stop the worker processes, also when writing a mesh fails
+                try:
+                    for cal3d_mesh in cal3d_meshes:
+                        mesh_filepath = os.path.join(cal3d_dirname, mesh_filename(cal3d_mesh.name))
+                        with LogMessage.span("write", mesh_filename(cal3d_mesh.name)):
+                            if self.mesh_binary_bool == 'binary':
+                                with open(mesh_filepath, "wb") as cal3d_mesh_file:
+                                    cal3d_mesh.to_cal3d_binary(cal3d_mesh_file)
+                            else:
+                                with open(mesh_filepath, "wt", buffering=xml_buffer_size) as cal3d_mesh_file:
+                                    cal3d_mesh.write_cal3d_xml(cal3d_mesh_file, vertex_formatter)
+                        update_export_cache(mesh_filepath)
+                        LogMessage.log_message("  Mesh '%s' with material(s) %s" % (mesh_filename(cal3d_mesh.name), [x.material_id for x in cal3d_mesh.submeshes]))
+                finally:
+                    if vertex_formatter:
+                        vertex_formatter.close()
+            elif cached_mesh_names == []:
                 LogMessage.log_error("No mesh selected or error exporting mesh!")
             
         if self.export_xaf:
+            for animation_name in cached_animation_names:
+                LogMessage.log_message("  Animation '%s' unchanged, not written" % (animation_filename(animation_name)))
             for cal3d_animation in cal3d_animations:
-                if self.animation_binary_bool == 'binary':
-                    animation_filename = self.anim_prefix + cal3d_animation.name + ".caf"
-                    animation_filepath = os.path.join(cal3d_dirname, animation_filename)
-                    cal3d_animation_file = open(animation_filepath, "wb")
-                    cal3d_animation.to_cal3d_binary(cal3d_animation_file)
-                else:
-                    animation_filename = self.anim_prefix + cal3d_animation.name + ".xaf"
-                    animation_filepath = os.path.join(cal3d_dirname, animation_filename)
-                    cal3d_animation_file = open(animation_filepath, "wt")
-                    cal3d_animation_file.write(cal3d_animation.to_cal3d_xml())
-                cal3d_animation_file.close()
-                LogMessage.log_message("  Animation '%s'" % (animation_filename))
+                animation_filepath = os.path.join(cal3d_dirname, animation_filename(cal3d_animation.name))
+                with LogMessage.span("write", animation_filename(cal3d_animation.name)):
+                    if self.animation_binary_bool == 'binary':
+                        cal3d_animation_file = open(animation_filepath, "wb")
+                        cal3d_animation.to_cal3d_binary(cal3d_animation_file)
+                    else:
+                        cal3d_animation_file = open(animation_filepath, "wt", buffering=xml_buffer_size)
+                        cal3d_animation.write_cal3d_xml(cal3d_animation_file)
+                    cal3d_animation_file.close()
+                update_export_cache(animation_filepath)
+                LogMessage.log_message("  Animation '%s'" % (animation_filename(cal3d_animation.name)))
 
 
         if self.export_xpf:
+            for animation_name in cached_morph_animation_names:
+                LogMessage.log_message("  Morph animation '%s' unchanged, not written" % (morph_animation_filename(animation_name)))
             for cal3d_morph_animation in cal3d_morph_animations:
                 if self.animation_binary_bool == 'binary':
                     LogMessage.log_error("binary not supported here!")
                 else:
                     # using animation settings also for morph animation
-                    animation_filename = self.anim_prefix + cal3d_morph_animation.name + ".xpf"
-                    animation_filepath = os.path.join(cal3d_dirname, animation_filename)
-                    cal3d_morph_animation_file = open(animation_filepath, "wt")
-                    cal3d_morph_animation_file.write(cal3d_morph_animation.to_cal3d_xml())
-                cal3d_morph_animation_file.close()
-                LogMessage.log_message("  Morph animation '%s'" % (animation_filename))
+                    animation_filepath = os.path.join(cal3d_dirname, morph_animation_filename(cal3d_morph_animation.name))
+                    with LogMessage.span("write", morph_animation_filename(cal3d_morph_animation.name)):
+                        cal3d_morph_animation_file = open(animation_filepath, "wt", buffering=xml_buffer_size)
+                        cal3d_morph_animation.write_cal3d_xml(cal3d_morph_animation_file)
+                        cal3d_morph_animation_file.close()
+                    update_export_cache(animation_filepath)
+                    LogMessage.log_message("  Morph animation '%s'" % (morph_animation_filename(cal3d_morph_animation.name)))
 
 
         if self.export_cfg:
@@ -495,18 +728,10 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
             #cal3d_cfg_file.write("scale=0.01f\n")
             
             if cal3d_skeleton:
-                if self.skeleton_binary_bool == 'binary':
-                    skeleton_filename = self.skeleton_prefix + cal3d_skeleton.name + ".csf"
-                else:
-                    skeleton_filename = self.skeleton_prefix + cal3d_skeleton.name + ".xsf"
-                cal3d_cfg_file.write("skeleton={0}\n".format(skeleton_filename))
+                cal3d_cfg_file.write("skeleton={0}\n".format(skeleton_filename(cal3d_skeleton.name)))
 
-            for cal3d_animation in cal3d_animations:
-                if self.animation_binary_bool == 'binary':
-                    animation_filename = self.anim_prefix + cal3d_animation.name + ".caf"
-                else:
-                    animation_filename = self.anim_prefix + cal3d_animation.name + ".xaf"
-                cal3d_cfg_file.write("animation={0}\n".format(animation_filename))
+            for animation_name in cached_animation_names + [x.name for x in cal3d_animations]:
+                cal3d_cfg_file.write("animation={0}\n".format(animation_filename(animation_name)))
 
             for cal3d_material in cal3d_materials:
                 if self.material_binary_bool == 'binary':
@@ -515,19 +740,24 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
                     material_filename = self.material_prefix + cal3d_material.name + ".xrf"
                 cal3d_cfg_file.write("material={0}\n".format(material_filename))
 
-            for cal3d_mesh in cal3d_meshes:
-                if self.mesh_binary_bool == 'binary':
-                    mesh_filename = self.mesh_prefix + cal3d_mesh.name + ".cmf"
-                else:
-                    mesh_filename = self.mesh_prefix + cal3d_mesh.name + ".xmf"
-                cal3d_cfg_file.write("mesh={0}\n".format(mesh_filename))
+            for mesh_name in cached_mesh_names + [x.name for x in cal3d_meshes]:
+                cal3d_cfg_file.write("mesh={0}\n".format(mesh_filename(mesh_name)))
 
             cal3d_cfg_file.close()
 
+        if export_cache:
+            export_cache.save()
+
+        # Stop profiling before the summary is logged
+        if LogMessage.profiler:
+            LogMessage.profiler.stop_all()
         LogMessage.log_message("\nExport finished.\n")
 
         # Log amount of errors
         LogMessage.log_counters()
+        write_report("finished")
+        write_profile()
+        stop_memory_trace()
 
         # Close the logger
         LogMessage.close_log()
@@ -562,6 +792,42 @@ class ExportCal3D(bpy.types.Operator, ExportHelper):
 
         row = layout.row(align=True)
         row.prop(self, "fps")
+
+        row = layout.row(align=True)
+        row.prop(self, "bake_animation")
+
+        row = layout.row(align=True)
+        row.prop(self, "reduce_keyframes")
+
+        row = layout.row(align=True)
+        row.prop(self, "keyframe_loc_tolerance")
+
+        row = layout.row(align=True)
+        row.prop(self, "keyframe_angle_tolerance")
+
+        row = layout.row(align=True)
+        row.prop(self, "compute_shapekey_normals")
+
+        row = layout.row(align=True)
+        row.prop(self, "morph_tolerance")
+
+        row = layout.row(align=True)
+        row.prop(self, "max_influences")
+
+        row = layout.row(align=True)
+        row.prop(self, "optimize_vertex_cache")
+
+        row = layout.row(align=True)
+        row.prop(self, "lod_reduction")
+
+        # Blender 2.6x/2.7x bundle Python 3.2 - 3.5, too old for the worker processes
+        from .mesh_parallel import parallel_writing_available
+        if parallel_writing_available():
+            row = layout.row(align=True)
+            row.prop(self, "export_processes")
+
+        row = layout.row(align=True)
+        row.prop(self, "use_export_cache")
         
         #row = layout.row(align=True)
         #row.label(text="Set Prefix for:")
@@ -20,41 +20,145 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import os
-from array import array
+import io
+import struct
 from math import *
 
-import bpy
-from mathutils import *
+# Cal3d binary files are little-endian with 32 bit integers and floats
+BINARY_KEYFRAME = struct.Struct("<8f")
+BINARY_TRACK = struct.Struct("<2I")
+BINARY_ANIMATION_HEADER = struct.Struct("<4s2If2I")
 
+# loc is stored as an (x, y, z) tuple and quat as a (w, x, y, z) tuple (the order of mathutils.Quaternion)
+# KeyFrame and MorphKeyFrame use __slots__, there are many of them
 class KeyFrame:
+    __slots__ = ("time", "loc", "quat")
+
     def __init__(self, time, loc, quat):
         self.time = time
-        self.loc = loc.copy()
-        self.quat = quat.copy()
+        self.loc = tuple(loc)
+        self.quat = tuple(quat)
  
     def to_cal3d_xml(self):
         s = "    <KEYFRAME TIME=\"{0:0.5f}\">\n".format(self.time)
         s += "      <TRANSLATION>{0:0.6f} {1:0.6f} {2:0.6f}</TRANSLATION>\n".format(self.loc[0], self.loc[1], self.loc[2])
 
         # jgb 2012-11-11 Maybe we need for w: -self.quat.w to get the same negative value as for the mesh.
-        s += "      <ROTATION>{0:0.6f} {1:0.6f} {2:0.6f} {3:0.6f}</ROTATION>\n".format(self.quat.copy().x, 
-                                                                   self.quat.copy().y, 
-                                                                   self.quat.copy().z, 
-                                                                   -self.quat.copy().w)
+        s += "      <ROTATION>{0:0.6f} {1:0.6f} {2:0.6f} {3:0.6f}</ROTATION>\n".format(self.quat[1], 
+                                                                   self.quat[2], 
+                                                                   self.quat[3], 
+                                                                   -self.quat[0])
         s += "    </KEYFRAME>\n"
         return s
 
         
+    def to_cal3d_binary_data(self):
+        return BINARY_KEYFRAME.pack(self.time,
+                                    self.loc[0],
+                                    self.loc[1],
+                                    self.loc[2],
+                                    self.quat[1], 
+                                    self.quat[2],
+                                    self.quat[3],
+                                    -self.quat[0])
+
+
     def to_cal3d_binary(self, file):
-        ar = array('f', [self.time,
-                         self.loc[0],
-                         self.loc[1],
-                         self.loc[2],
-                         self.quat.copy().x, 
-                         self.quat.copy().y,
-                         self.quat.copy().z,
-                         -self.quat.copy().w])
-        ar.tofile(file)
+        file.write(self.to_cal3d_binary_data())
+
+
+
+# Keyframe reduction: drop the keyframes Cal3d can reconstruct from the keyframes around them.
+# Between two keyframes Cal3d interpolates the translation linearly and the rotation with slerp
+# (the shortest way around), so a keyframe can go when that interpolation of its neighbors
+# stays within the tolerances.
+
+# Quaternions (w, x, y, z) closer than this (dot product) are interpolated linearly
+SLERP_LINEAR_DOT = 0.9999
+
+
+def slerp(quat1, quat2, factor):
+    cos_angle = quat1[0]*quat2[0] + quat1[1]*quat2[1] + quat1[2]*quat2[2] + quat1[3]*quat2[3]
+    # q and -q are the same rotation, take the shortest way
+    sign = 1.0
+    if cos_angle < 0.0:
+        cos_angle = -cos_angle
+        sign = -1.0
+    if cos_angle > SLERP_LINEAR_DOT:
+        factor1 = 1.0 - factor
+        factor2 = factor
+    else:
+        angle = acos(cos_angle)
+        factor1 = sin((1.0 - factor) * angle) / sin(angle)
+        factor2 = sin(factor * angle) / sin(angle)
+    factor2 *= sign
+    quat = [factor1*quat1[i] + factor2*quat2[i] for i in range(4)]
+    length = sqrt(quat[0]*quat[0] + quat[1]*quat[1] + quat[2]*quat[2] + quat[3]*quat[3])
+    return (quat[0] / length, quat[1] / length, quat[2] / length, quat[3] / length)
+
+
+# True when all keyframes between first and last (indices in keyframes) are within the
+# tolerances of the interpolation between first and last. min_cos is the cosine of half the
+# angle tolerance: two rotations are within the tolerance when |q1 . q2| >= min_cos.
+def keyframes_fit(keyframes, first, last, loc_tolerance, min_cos):
+    keyframe1 = keyframes[first]
+    keyframe2 = keyframes[last]
+    loc1 = keyframe1.loc
+    loc2 = keyframe2.loc
+    duration = keyframe2.time - keyframe1.time
+    max_distance2 = loc_tolerance * loc_tolerance
+    for keyframe in keyframes[first + 1:last]:
+        factor = (keyframe.time - keyframe1.time) / duration
+        dx = loc1[0] + factor * (loc2[0] - loc1[0]) - keyframe.loc[0]
+        dy = loc1[1] + factor * (loc2[1] - loc1[1]) - keyframe.loc[1]
+        dz = loc1[2] + factor * (loc2[2] - loc1[2]) - keyframe.loc[2]
+        if dx*dx + dy*dy + dz*dz > max_distance2:
+            return False
+        quat = slerp(keyframe1.quat, keyframe2.quat, factor)
+        cos_half_angle = abs(quat[0]*keyframe.quat[0] + quat[1]*keyframe.quat[1] +
+                             quat[2]*keyframe.quat[2] + quat[3]*keyframe.quat[3])
+        if cos_half_angle < min_cos:
+            return False
+    return True
+
+
+# Returns the keyframes that are needed to stay within loc_tolerance (distance) and
+# angle_tolerance (radians) of the rotations. The first and last keyframe are always kept.
+def reduce_keyframes(keyframes, loc_tolerance, angle_tolerance):
+    if len(keyframes) <= 2:
+        return keyframes
+    min_cos = cos(angle_tolerance / 2.0)
+    last = len(keyframes) - 1
+    kept = [keyframes[0]]
+    start = 0
+    while start < last:
+        # Find the furthest keyframe the keyframes from start can be interpolated to: first in
+        # growing steps, then bisect between the last one that fits and the first that doesn't.
+        # Every accepted span is checked completely, so the tolerances always hold.
+        good = start + 1
+        bad = last + 1
+        step = 2
+        while start + step <= last:
+            if keyframes_fit(keyframes, start, start + step, loc_tolerance, min_cos):
+                good = start + step
+                step *= 2
+            else:
+                bad = start + step
+                break
+        else:
+            if keyframes_fit(keyframes, start, last, loc_tolerance, min_cos):
+                good = last
+            else:
+                bad = last
+        while bad - good > 1:
+            middle = (good + bad) // 2
+            if keyframes_fit(keyframes, start, middle, loc_tolerance, min_cos):
+                good = middle
+            else:
+                bad = middle
+        kept.append(keyframes[good])
+        start = good
+    return kept
 
 
 
@@ -74,21 +178,35 @@ class Track:
         self.highrangerequired = 1
 
 
+    # Drop the keyframes that interpolation restores within the tolerances, see reduce_keyframes
+    def reduce_keyframes(self, loc_tolerance, angle_tolerance):
+        self.keyframes = reduce_keyframes(self.keyframes, loc_tolerance, angle_tolerance)
+
+
     def to_cal3d_xml(self):
-        s = "  <TRACK BONEID=\"{0}\" TRANSLATIONREQUIRED=\"{1}\" TRANSLATIONISDYNAMIC=\"{2}\" ".format(self.bone_index, self.translationrequired, self.translationisdynamic)
-        s += "HIGHRANGEREQUIRED=\"{0}\" NUMKEYFRAMES=\"{1}\">\n".format(self.highrangerequired, len(self.keyframes))
-        s += "".join(map(KeyFrame.to_cal3d_xml, self.keyframes))
-        s += "  </TRACK>\n"
-        return s
+        s = io.StringIO()
+        self.write_cal3d_xml(s)
+        return s.getvalue()
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    def write_cal3d_xml(self, file):
+        file.write("  <TRACK BONEID=\"{0}\" TRANSLATIONREQUIRED=\"{1}\" TRANSLATIONISDYNAMIC=\"{2}\" ".format(self.bone_index, self.translationrequired, self.translationisdynamic))
+        file.write("HIGHRANGEREQUIRED=\"{0}\" NUMKEYFRAMES=\"{1}\">\n".format(self.highrangerequired, len(self.keyframes)))
+        for keyframe in self.keyframes:
+            file.write(keyframe.to_cal3d_xml())
+        file.write("  </TRACK>\n")
 
         
-    def to_cal3d_binary(self, file):
-        ar = array('L', [self.bone_index,
-                         len(self.keyframes)])
-        ar.tofile(file)
-        
+    def to_cal3d_binary_data(self):
+        data = [BINARY_TRACK.pack(self.bone_index, len(self.keyframes))]
         for kf in self.keyframes:
-            kf.to_cal3d_binary(file)
+            data.append(kf.to_cal3d_binary_data())
+        return b"".join(data)
+
+
+    def to_cal3d_binary(self, file):
+        file.write(self.to_cal3d_binary_data())
 
 
 
@@ -101,38 +219,29 @@ class Animation:
 
 
     def to_cal3d_xml(self):
-        s = "<HEADER MAGIC=\"XAF\" VERSION=\"{0}\"/>\n".format(self.xml_version)
-        s += "<ANIMATION DURATION=\"{0:0.5f}\" NUMTRACKS=\"{1}\">\n".format(self.duration, len(self.tracks))
-        s += "".join(map(Track.to_cal3d_xml, self.tracks))
-        s += "</ANIMATION>\n"
-        return s
+        s = io.StringIO()
+        self.write_cal3d_xml(s)
+        return s.getvalue()
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    def write_cal3d_xml(self, file):
+        file.write("<HEADER MAGIC=\"XAF\" VERSION=\"{0}\"/>\n".format(self.xml_version))
+        file.write("<ANIMATION DURATION=\"{0:0.5f}\" NUMTRACKS=\"{1}\">\n".format(self.duration, len(self.tracks)))
+        for track in self.tracks:
+            track.write_cal3d_xml(file)
+        file.write("</ANIMATION>\n")
 
         
     def to_cal3d_binary(self, file):
-        s = b'CAF\0'
-        ar = array('b', list(s))
-        ar.tofile(file)
-        
         # Etory : downgrade version to 700 for Cal3D 0.11 compatibility
-        ar = array('L', [700])
-        ar.tofile(file)
-        
-        ar = array('L', [0]) # this is an unknown value that has to be there
-        ar.tofile(file)
+        # The 0 after the version is an unknown value that has to be there
+        # The last value are the flags for tracks      Bit 0: 1 if compressed tracks
+        # We only write normal uncompressed tracks
+        file.write(BINARY_ANIMATION_HEADER.pack(b'CAF\0', 700, 0, self.duration, len(self.tracks), 0))
         
-        ar = array('f', [self.duration])
-        ar.tofile(file)
-        
-        ar = array('L', [len(self.tracks),
-                         0]) # flags for tracks      Bit 0: 1 if compressed tracks
-        ar.tofile(file)
-        
-        if ar[1] == 0: # normal uncompressed tracks
-            for tr in self.tracks:
-                tr.to_cal3d_binary(file)
-        else: # compressed tracks
-            for tr in self.tracks: # not sure what to do here yet
-                tr.to_cal3d_binary(file)
+        for tr in self.tracks:
+            file.write(tr.to_cal3d_binary_data())
 
 
 # ====================================
@@ -141,6 +250,8 @@ class Animation:
 
 # Class MorphKeyFrame store a keyframe of a morph animation and allows export to XML only.
 class MorphKeyFrame:
+    __slots__ = ("time", "weight")
+
     def __init__(self, time, weight):
         self.time = time
         self.weight = weight
@@ -160,10 +271,17 @@ class MorphTrack:
 
 
     def to_cal3d_xml(self):
-        s = "  <TRACK NUMKEYFRAMES=\"{0}\" MORPHNAME=\"{1}\">\n".format(len(self.keyframes), self.morph_name)
-        s += "".join(map(MorphKeyFrame.to_cal3d_xml, self.keyframes))
-        s += "  </TRACK>\n"
-        return s
+        s = io.StringIO()
+        self.write_cal3d_xml(s)
+        return s.getvalue()
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    def write_cal3d_xml(self, file):
+        file.write("  <TRACK NUMKEYFRAMES=\"{0}\" MORPHNAME=\"{1}\">\n".format(len(self.keyframes), self.morph_name))
+        for keyframe in self.keyframes:
+            file.write(keyframe.to_cal3d_xml())
+        file.write("  </TRACK>\n")
 
 
 # Class MorphAnimation stores morph animation data and allows XML export only.
@@ -176,8 +294,15 @@ class MorphAnimation:
 
 
     def to_cal3d_xml(self):
-        s = "<HEADER MAGIC=\"XPF\" VERSION=\"{0}\"/>\n".format(self.xml_version)
-        s += "<ANIMATION NUMTRACKS=\"{0}\" DURATION=\"{1:0.5f}\">\n".format(len(self.morph_tracks), self.duration)
-        s += "".join(map(MorphTrack.to_cal3d_xml, self.morph_tracks))
-        s += "</ANIMATION>\n"
-        return s
+        s = io.StringIO()
+        self.write_cal3d_xml(s)
+        return s.getvalue()
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    def write_cal3d_xml(self, file):
+        file.write("<HEADER MAGIC=\"XPF\" VERSION=\"{0}\"/>\n".format(self.xml_version))
+        file.write("<ANIMATION NUMTRACKS=\"{0}\" DURATION=\"{1:0.5f}\">\n".format(len(self.morph_tracks), self.duration))
+        for morph_track in self.morph_tracks:
+            morph_track.write_cal3d_xml(file)
+        file.write("</ANIMATION>\n")
@@ -20,20 +20,35 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import os
-from array import array
+import io
+import struct
 from math import *
 
 import string
 
-import bpy
-from mathutils import *
 from .logger_class import Logger, get_logger
 
+# Cal3d binary files are little-endian with 32 bit integers and floats
+BINARY_SKELETON_HEADER = struct.Struct("<4s2I")
+BINARY_UINT = struct.Struct("<I")
+BINARY_BONE = struct.Struct("<14f")
+BINARY_BONE_PARENT = struct.Struct("<2i")
+
+
+# Inverse of a (w, x, y, z) quaternion tuple
+def inverted_quaternion(quat):
+    w, x, y, z = quat
+    length_squared = w*w + x*x + y*y + z*z
+    return (w / length_squared, -x / length_squared, -y / length_squared, -z / length_squared)
+
+
+# The skeleton and its bones only hold plain tuples, the transformations are computed
+# in export_armature. Quaternions are (w, x, y, z) tuples (the order of mathutils.Quaternion).
 class Skeleton:
     def __init__(self, name, matrix, anim_scale, xml_version, write_ambient_color):
         self.name = name
-        self.anim_scale = anim_scale.copy()
-        self.matrix = matrix
+        self.anim_scale = tuple(anim_scale)
+        self.matrix = tuple(tuple(row) for row in matrix)
         self.xml_version = xml_version
         self.bones = []
         self.next_bone_id = 0
@@ -45,36 +60,41 @@ class Skeleton:
 
         
     def to_cal3d_xml(self):
-        s = "<HEADER MAGIC=\"XSF\" VERSION=\"{0}\"/>\n".format(self.xml_version)
+        s = io.StringIO()
+        self.write_cal3d_xml(s)
+        return s.getvalue()
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    def write_cal3d_xml(self, file):
+        file.write("<HEADER MAGIC=\"XSF\" VERSION=\"{0}\"/>\n".format(self.xml_version))
         if self.write_ambient_color:
-            s += "<SKELETON NUMBONES=\"{0}\" SCENEAMBIENTCOLOR=\"{1:0.6f} {2:0.6f} {3:0.6f}\">\n".format(len(self.bones), 
+            file.write("<SKELETON NUMBONES=\"{0}\" SCENEAMBIENTCOLOR=\"{1:0.6f} {2:0.6f} {3:0.6f}\">\n".format(len(self.bones), 
                 self.scene_ambient_color[0],
                 self.scene_ambient_color[1],
-                self.scene_ambient_color[2])
+                self.scene_ambient_color[2]))
         else:
-            s += "<SKELETON NUMBONES=\"{0}\">\n".format(len(self.bones))
-        s += "".join(map(Bone.to_cal3d_xml, self.bones))
-        s += "</SKELETON>\n"
-        return s
+            file.write("<SKELETON NUMBONES=\"{0}\">\n".format(len(self.bones)))
+        for bone in self.bones:
+            file.write(bone.to_cal3d_xml())
+        file.write("</SKELETON>\n")
 
         
     def to_cal3d_binary(self, file):
-        s = b'CSF\0'
-        ar = array('b', list(s))
-        ar.tofile(file)
-
         # Etory : downgrade version to 700 for Cal3D 0.11 compatibility
-        ar = array('I', [700, len(self.bones)])
-        ar.tofile(file)
-        
+        data = [BINARY_SKELETON_HEADER.pack(b'CSF\0', 700, len(self.bones))]
         for bn in self.bones:
-            bn.to_cal3d_binary(file)
+            data.append(bn.to_cal3d_binary_data())
+        file.write(b"".join(data))
 
 class Bone:
-    def __init__(self, skeleton, parent, name, loc, rot, lights):
+    def __init__(self, skeleton, parent, name, loc, rot, lloc, lrot, lights):
         '''
         loc is the translation from the parent coordinate frame to the tail of the bone
         rot is the rotation from the parent coordinate frame to the tail of the bone
+        lloc and lrot are the translation and rotation of the inverse of the bone's
+        transformation from the skeleton coordinate frame
+        lights maps light names to their colors
         '''
         
         # Initialize our logger
@@ -108,25 +128,16 @@ class Bone:
         else:
             self.light_color = [0.0, 0.0, 0.0]
 
-        self.child_loc = loc.copy()
+        self.child_loc = tuple(loc)
 
-        self.quat = rot.copy()
-        self.loc = loc.copy()
-        self.matrix = self.quat.to_matrix().to_4x4()
-        self.matrix[0][3] += self.loc[0]
-        self.matrix[1][3] += self.loc[1]
-        self.matrix[2][3] += self.loc[2]
-        if self.debug_bone > 0:
-            self.LogMessage.log_debug("Calculated matrix for bone "+self.name)
-            self.LogMessage.log_debug(self.matrix)
+        self.quat = tuple(rot)
+        self.loc = tuple(loc)
 
         if parent:
-            self.matrix = parent.matrix * self.matrix
             parent.children.append(self)
 
-        lmatrix = self.matrix.inverted()
-        self.lloc = lmatrix.to_translation()
-        self.lquat = lmatrix.to_quaternion()
+        self.lloc = tuple(lloc)
+        self.lquat = tuple(lrot)
         if self.debug_bone > 0:
             self.LogMessage.log_debug("lloc, lquat:")
             self.LogMessage.log_debug(self.lloc)
@@ -140,13 +151,8 @@ class Bone:
     # Get the light color for the current light.
     # If a light with name "name" exists then take the color from that, else set default color
     def get_light_color(self, name, lights):
-        if lights:
-            #light = lights[name]
-            light_index = lights.find(name)
-            if light_index > -1:
-            #if light:
-                light = lights[light_index]
-                return light.color
+        if lights and name in lights:
+            return tuple(lights[name])
 
         # Set default color if no light with same name as light bone present
         self.LogMessage.log_warning ("No light called " + name + " found, setting default light color.")
@@ -171,20 +177,22 @@ class Bone:
                                                                  self.loc[2])
 
         # Etory : need negate quaternion values
-        s += "    <ROTATION>{0:0.6f} {1:0.6f} {2:0.6f} {3:0.6f}</ROTATION>\n".format(-self.quat.inverted().x,
-                                                               -self.quat.inverted().y,
-                                                               -self.quat.inverted().z,
-                                                               -self.quat.inverted().w)
+        quat = inverted_quaternion(self.quat)
+        s += "    <ROTATION>{0:0.6f} {1:0.6f} {2:0.6f} {3:0.6f}</ROTATION>\n".format(-quat[1],
+                                                               -quat[2],
+                                                               -quat[3],
+                                                               -quat[0])
 
         s += "    <LOCALTRANSLATION>{0:0.6f} {1:0.6f} {2:0.6f}</LOCALTRANSLATION>\n".format(self.lloc[0],
                                                                            self.lloc[1],
                                                                            self.lloc[2])
 
         # Etory : need negate quaternion values
-        s += "    <LOCALROTATION>{0:0.6f} {1:0.6f} {2:0.6f} {3:0.6f}</LOCALROTATION>\n".format(-self.lquat.inverted().x,
-                                                                         -self.lquat.inverted().y,
-                                                                         -self.lquat.inverted().z,
-                                                                         -self.lquat.inverted().w)
+        lquat = inverted_quaternion(self.lquat)
+        s += "    <LOCALROTATION>{0:0.6f} {1:0.6f} {2:0.6f} {3:0.6f}</LOCALROTATION>\n".format(-lquat[1],
+                                                                         -lquat[2],
+                                                                         -lquat[3],
+                                                                         -lquat[0])
 
         if self.parent:
             s += "    <PARENTID>{0}</PARENTID>\n".format(self.parent.index)
@@ -196,42 +204,37 @@ class Bone:
         return s
 
         
-    def to_cal3d_binary(self, file):
-        name = self.name
-        name += '\0'
-        ar = array('I', [len(name)])
-        ar.tofile(file)
-        
-        ar = array('b', list(name.encode("utf8")))
-        ar.tofile(file)
-
-        
-        ar = array('f', [self.loc[0],
-                         self.loc[1],
-                         self.loc[2],
-                         -self.quat.inverted().x, # Etory : need negate quaternion values
-                         -self.quat.inverted().y,
-                         -self.quat.inverted().z,
-                         -self.quat.inverted().w,
-
-                         self.lloc[0],
-                         self.lloc[1],
-                         self.lloc[2],
-                         -self.lquat.inverted().x, # Etory : need negate quaternion values
-                         -self.lquat.inverted().y,
-                         -self.lquat.inverted().z,
-                         -self.lquat.inverted().w])
-
-        ar.tofile(file)
+    def to_cal3d_binary_data(self):
+        name = self.name.encode("utf8") + b'\0'
+        data = [BINARY_UINT.pack(len(name)), name]
+
+        quat = inverted_quaternion(self.quat)
+        lquat = inverted_quaternion(self.lquat)
+        data.append(BINARY_BONE.pack(self.loc[0],
+                                     self.loc[1],
+                                     self.loc[2],
+                                     -quat[1], # Etory : need negate quaternion values
+                                     -quat[2],
+                                     -quat[3],
+                                     -quat[0],
+
+                                     self.lloc[0],
+                                     self.lloc[1],
+                                     self.lloc[2],
+                                     -lquat[1], # Etory : need negate quaternion values
+                                     -lquat[2],
+                                     -lquat[3],
+                                     -lquat[0]))
         
         if self.parent:
-            ar = array('I', [self.parent.index])
+            parent_index = self.parent.index
         else:
-            ar = array('i', [-1])
-        if self.children:
-            ar.append(len(self.children))
-            for ch in self.children:
-                ar.append(ch.index)
-        else:
-            ar.append(0)
-        ar.tofile(file)
+            parent_index = -1
+        data.append(BINARY_BONE_PARENT.pack(parent_index, len(self.children)))
+        for ch in self.children:
+            data.append(BINARY_UINT.pack(ch.index))
+        return b"".join(data)
+
+
+    def to_cal3d_binary(self, file):
+        file.write(self.to_cal3d_binary_data())
@@ -0,0 +1,272 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Batch export of many .blend files without the Blender user interface.
+#
+# Driver: reads a manifest and runs every job in its own background Blender process,
+# at most --jobs at the same time. Can be run with any Python 3 or inside Blender:
+#   python batch_export.py manifest.json --blender /path/to/blender --jobs 4 --report report.json
+#   python batch_export.py manifest.json --profile mesh,write      profile some phases of every job
+#   python batch_export.py manifest.json --trace-memory            log the memory use per phase
+#   blender --background --python batch_export.py -- manifest.json --jobs 4
+#
+# Worker: started by the driver as
+#   blender --background file.blend --python batch_export.py -- --job '<job as json>'
+# It selects the objects of the job, runs the ExportCal3D operator with the job options and
+# prints one result line (RESULT_MARKER followed by json) that the driver picks up.
+#
+# Manifest (json), relative paths are relative to the manifest:
+#   {
+#     "options": {"fps": 30.0, "export_xrf": false},     <- defaults for all jobs
+#     "jobs": [
+#       {"blend": "products/shirt.blend",                 <- required
+#        "output": "export/shirt.cfg",                    <- required, same as the file selector path
+#        "objects": ["Armature", "Shirt"],                <- optional, default: all visible objects
+#        "options": {"export_xaf": false}}                <- optional, overrides the defaults
+#     ]
+#   }
+# The options are the properties of the ExportCal3D operator (see __init__.py).
+#
+# Nothing in here imports bpy at module level: the driver doesn't need Blender.
+
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Name of the add-on package, the worker enables it if needed
+ADDON_MODULE = "io_export_cal3d_IMVU"
+
+# Start of the line the worker prints with the job result
+RESULT_MARKER = "CAL3D_BATCH_RESULT "
+
+
+# Arguments after "--" when running inside Blender, all arguments otherwise
+def get_script_args(argv):
+    if "--" in argv:
+        return argv[argv.index("--") + 1:]
+    if os.path.basename(argv[0]).lower().startswith("blender"):
+        return []
+    return argv[1:]
+
+
+# Read the manifest and return the list of jobs with the default options merged in
+# and all paths made absolute
+def load_manifest(manifest_path):
+    with open(manifest_path, "rt") as manifest_file:
+        manifest = json.load(manifest_file)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    default_options = manifest.get("options", {})
+
+    jobs = []
+    for index, entry in enumerate(manifest.get("jobs", [])):
+        if "blend" not in entry or "output" not in entry:
+            raise ValueError("Job {0} in {1} needs both 'blend' and 'output'".format(index, manifest_path))
+        options = dict(default_options)
+        options.update(entry.get("options", {}))
+        jobs.append({"index": index,
+                     "blend": os.path.join(base_dir, entry["blend"]),
+                     "output": os.path.join(base_dir, entry["output"]),
+                     "objects": entry.get("objects"),
+                     "options": options})
+    return jobs
+
+
+# ====================================
+# ========== Driver ==========
+# ====================================
+
+# Run one job in a background Blender process and return its result
+def run_job(blender, job, timeout):
+    command = [blender, "--background", "--factory-startup", job["blend"],
+               "--python", os.path.abspath(__file__), "--", "--job", json.dumps(job)]
+    result = {"index": job["index"], "blend": job["blend"], "output": job["output"],
+              "status": "failed", "errors": 0, "warnings": 0, "message": ""}
+    start = time.time()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   universal_newlines=True)
+        try:
+            output = process.communicate(timeout=timeout)[0]
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output = process.communicate()[0]
+            result["message"] = "timed out after {0} seconds".format(timeout)
+    except OSError as e:
+        output = ""
+        result["message"] = "could not start Blender: " + str(e)
+    result["seconds"] = round(time.time() - start, 3)
+
+    for line in output.splitlines():
+        if line.startswith(RESULT_MARKER):
+            result.update(json.loads(line[len(RESULT_MARKER):]))
+            break
+    else:
+        if not result["message"]:
+            result["message"] = "no result from Blender (exit code {0})".format(process.returncode)
+            # The last lines of the output usually tell what went wrong
+            result["output"] = output.splitlines()[-20:]
+    return result
+
+
+def run_driver(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog="batch_export.py",
+                                     description="Export .blend files listed in a manifest to Cal3d for IMVU.")
+    parser.add_argument("manifest", help="json file with the jobs to export")
+    parser.add_argument("--blender", default=None,
+                        help="Blender executable (default: the running Blender or 'blender')")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of Blender processes running at the same time")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="maximum number of seconds for one job")
+    parser.add_argument("--report", default=None,
+                        help="write the results of all jobs to this json file")
+    parser.add_argument("--profile", default=None,
+                        help="profile the exports: 'all' or a comma separated list of phases (mesh, animation, write, ...); "
+                             "writes a .pstats file and a summary next to every log")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="log the peak and retained memory of every export phase (slow)")
+    options = parser.parse_args(args)
+
+    blender = options.blender
+    if blender is None:
+        if os.path.basename(sys.executable).lower().startswith("blender"):
+            blender = sys.executable
+        else:
+            blender = "blender"
+
+    jobs = load_manifest(options.manifest)
+    if options.profile:
+        for job in jobs:
+            job["options"]["profile_phases"] = options.profile
+    if options.trace_memory:
+        for job in jobs:
+            job["options"]["trace_memory"] = True
+    print("Exporting {0} job(s) with {1} Blender process(es)".format(len(jobs), options.jobs))
+
+    results = []
+    start = time.time()
+    # The real work happens in the Blender processes, threads are enough to wait for them
+    with ThreadPoolExecutor(max_workers=max(options.jobs, 1)) as executor:
+        futures = [executor.submit(run_job, blender, job, options.timeout) for job in jobs]
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            print("[{0}/{1}] {2}: {3} ({4} errors, {5} warnings, {6:0.1f}s) {7}".format(
+                len(results), len(jobs), result["blend"], result["status"],
+                result["errors"], result["warnings"], result["seconds"], result["message"]))
+
+    failed = [result for result in results if result["status"] != "ok"]
+    print("Finished {0} job(s) in {1:0.1f}s, {2} failed".format(len(results), time.time() - start, len(failed)))
+
+    if options.report:
+        with open(options.report, "wt") as report_file:
+            json.dump({"jobs": results, "failed": len(failed)}, report_file, indent=1)
+
+    if failed:
+        return 1
+    return 0
+
+
+# ====================================
+# ========== Worker ==========
+# ====================================
+
+# Make sure the add-on is enabled, also when it isn't installed in the Blender scripts folder
+def enable_addon():
+    import addon_utils
+    import bpy
+    if hasattr(bpy.ops, "cal3d_model_export") and hasattr(bpy.ops.cal3d_model_export, "cfg"):
+        return
+    addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if addon_dir not in sys.path:
+        sys.path.append(addon_dir)
+    if not addon_utils.enable(ADDON_MODULE):
+        raise RuntimeError("Could not enable add-on " + ADDON_MODULE)
+
+
+# Select the objects the job wants to export, the operator exports the selected objects
+def select_objects(scene, object_names):
+    if object_names is None:
+        for obj in scene.objects:
+            obj.select = obj.is_visible(scene)
+        return
+    missing = [name for name in object_names if name not in scene.objects]
+    if missing:
+        raise ValueError("Objects not found in scene '{0}': {1}".format(scene.name, ", ".join(missing)))
+    for obj in scene.objects:
+        obj.select = obj.name in object_names
+
+
+def run_worker(job_json):
+    result = {"status": "failed", "errors": 0, "warnings": 0, "message": ""}
+    try:
+        import bpy
+        job = json.loads(job_json)
+        enable_addon()
+        from io_export_cal3d_IMVU import logger_class
+
+        select_objects(bpy.context.scene, job["objects"])
+        output_dir = os.path.dirname(job["output"])
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        status = bpy.ops.cal3d_model_export.cfg(filepath=job["output"], **job["options"])
+
+        logger = logger_class.get_logger()
+        if logger:
+            result["errors"] = logger.errors
+            result["warnings"] = logger.warnings
+        if "FINISHED" in status and result["errors"] == 0:
+            result["status"] = "ok"
+        else:
+            result["message"] = "export {0} with {1} error(s), see the .log file".format(
+                "/".join(sorted(status)), result["errors"])
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        result["message"] = "{0}: {1}".format(type(e).__name__, e)
+    print(RESULT_MARKER + json.dumps(result))
+    sys.stdout.flush()
+    return result
+
+
+def main(argv):
+    args = get_script_args(argv)
+    if len(args) >= 2 and args[0] == "--job":
+        result = run_worker(args[1])
+        if result["status"] == "ok":
+            return 0
+        return 1
+    return run_driver(args)
+
+
+if __name__ == "__main__":
+    exit_code = main(sys.argv)
+    # Inside Blender sys.exit would only end the script, not Blender
+    if "bpy" in sys.modules and exit_code:
+        sys.stdout.flush()
+        os._exit(exit_code)
+    elif "bpy" not in sys.modules:
+        sys.exit(exit_code)
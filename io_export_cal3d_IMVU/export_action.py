@@ -21,6 +21,8 @@
 
 import bpy
 import mathutils
+from array import array
+from math import floor, radians
 
 from . import armature_classes
 from .armature_classes import *
@@ -49,51 +51,45 @@ def get_keyframes_list(fcu):
     return keyframes_list
 
 
-def evaluate_loc(loc_x_fcu, loc_y_fcu, loc_z_fcu, keyframe):
-    loc_x = 0.0
-    loc_y = 0.0
-    loc_z = 0.0
+# The fcurves of a bone in the order they are sampled: location x, y, z and
+# rotation_quaternion w, x, y, z (jgb NB: w first instead of last, thus has index 0, not 3!)
+BONE_CHANNELS = (("location", 0), ("location", 1), ("location", 2),
+                 ("rotation_quaternion", 0), ("rotation_quaternion", 1),
+                 ("rotation_quaternion", 2), ("rotation_quaternion", 3))
+# Value of a channel without fcurve.
+# jgb 2012-11-11 Blender has a w value of 1.0 when we haven't changed the rotation so try that instead of 0.0
+BONE_CHANNEL_DEFAULTS = (0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0)
 
-    if loc_x_fcu:
-        loc_x = loc_x_fcu.evaluate(keyframe)
 
-    if loc_y_fcu:
-        loc_y = loc_y_fcu.evaluate(keyframe)
+# Evaluate fcu once at each of frames into an array, default for every frame when there is no fcurve.
+# The keyframes are built from these arrays.
+def sample_fcurve(fcu, frames, default):
+    if not fcu:
+        return array('d', [default]) * len(frames)
+    evaluate = fcu.evaluate
+    return array('d', [evaluate(frame) for frame in frames])
 
-    if loc_z_fcu:
-        loc_z = loc_z_fcu.evaluate(keyframe)
 
-    return mathutils.Vector([loc_x, loc_y, loc_z])
-
-
-def evaluate_quat(quat_x_fcu, quat_y_fcu, quat_z_fcu, quat_w_fcu, keyframe):
-    quat_x = 0.0
-    quat_y = 0.0
-    quat_z = 0.0
-    # jgb 2012-11-11 Blender has a w value of 1.0 when we haven't changed the rotation so try that instead of 0.0
-    quat_w = 1.0
-
-    if quat_x_fcu:
-        quat_x = quat_x_fcu.evaluate(keyframe)
-
-    if quat_y_fcu:
-        quat_y = quat_y_fcu.evaluate(keyframe)
-
-    if quat_z_fcu:
-        quat_z = quat_z_fcu.evaluate(keyframe)
-
-    if quat_w_fcu:
-        quat_w = quat_w_fcu.evaluate(keyframe)
-
-    # jgb 2012-11-11 I think with quaternions w needs to come first, not last.
-    return mathutils.Quaternion([quat_w, quat_x, quat_y, quat_z])
+# A uniform grid of one frame per frame (the export frame rate, see the keyframe times below)
+# from first_frame up to and including last_frame
+def frame_grid(first_frame, last_frame):
+    frames = [first_frame + i for i in range(int(floor(last_frame - first_frame)) + 1)]
+    if frames[-1] < last_frame:
+        frames.append(last_frame)
+    return frames
 
 
 def track_sort_key(track):
     return track.bone_index
 
 
-def create_cal3d_animation(cal3d_skeleton, action, fps, xml_version):
+# bake: sample every bone at every frame between the first and last keyframe of the action
+# instead of only at its own keyframes, so eased curves keep their shape.
+# keyframe_reduction: drop the keyframes Cal3d can interpolate from the others within
+# loc_tolerance (distance) and angle_tolerance (degrees)
+def create_cal3d_animation(cal3d_skeleton, action, fps, xml_version,
+                           keyframe_reduction=False, loc_tolerance=0.01, angle_tolerance=0.5,
+                           bake=False):
     global LogMessage
     # Initialize our logger
     LogMessage = get_logger()
@@ -104,6 +100,8 @@ def create_cal3d_animation(cal3d_skeleton, action, fps, xml_version):
     last_keyframe = 0
     first_keyframe = 0
 
+    # First find the bone and fcurves of every action group and the frame range of the action
+    bone_channels = []
     for action_group in action.groups:
         cal3d_bone = None
 
@@ -113,35 +111,16 @@ def create_cal3d_animation(cal3d_skeleton, action, fps, xml_version):
                 break
 
         if not cal3d_bone:
-            LogMessage.log_warning("No bone found corresponding to action group "+action_group.name)
+            LogMessage.log_warning("No bone found corresponding to action group {0}", action_group.name,
+                                   category="action_group_without_bone")
             continue
 
-        cal3d_track = Track(cal3d_bone.index)
-
-        loc_x_fcu = get_action_group_fcurve(action_group, "location", 0)
-        loc_y_fcu = get_action_group_fcurve(action_group, "location", 1)
-        loc_z_fcu = get_action_group_fcurve(action_group, "location", 2)
-
-        # jgb NB: w first instead of last, thus has index 0, not 3!
-        quat_w_fcu = get_action_group_fcurve(action_group,
-                                             "rotation_quaternion", 0)
-        quat_x_fcu = get_action_group_fcurve(action_group, 
-                                             "rotation_quaternion", 1)
-        quat_y_fcu = get_action_group_fcurve(action_group,
-                                             "rotation_quaternion", 2)
-        quat_z_fcu = get_action_group_fcurve(action_group,
-                                             "rotation_quaternion", 3)
+        fcurves = [get_action_group_fcurve(action_group, data_path, array_index)
+                   for data_path, array_index in BONE_CHANNELS]
 
         keyframes_list = []
-
-        keyframes_list.extend(get_keyframes_list(loc_x_fcu))
-        keyframes_list.extend(get_keyframes_list(loc_y_fcu))
-        keyframes_list.extend(get_keyframes_list(loc_z_fcu))
-
-        keyframes_list.extend(get_keyframes_list(quat_x_fcu))
-        keyframes_list.extend(get_keyframes_list(quat_y_fcu))
-        keyframes_list.extend(get_keyframes_list(quat_z_fcu))
-        keyframes_list.extend(get_keyframes_list(quat_w_fcu))
+        for fcu in fcurves:
+            keyframes_list.extend(get_keyframes_list(fcu))
 
         # remove duplicates
         keyframes_set = set(keyframes_list)
@@ -161,23 +140,40 @@ def create_cal3d_animation(cal3d_skeleton, action, fps, xml_version):
             last_keyframe = keyframes_list[len(keyframes_list) - 1]
             initialized_borders = True
 
-        cal3d_track.keyframes = []
+        bone_channels.append((cal3d_bone, fcurves, keyframes_list))
 
-        for keyframe in keyframes_list:
-            dloc = evaluate_loc(loc_x_fcu, loc_y_fcu, loc_z_fcu, keyframe)
-            dquat = evaluate_quat(quat_x_fcu, quat_y_fcu, 
-                                  quat_z_fcu, quat_w_fcu, keyframe)
+    if bake and initialized_borders:
+        baked_frames = frame_grid(first_keyframe, last_keyframe)
+
+    for cal3d_bone, fcurves, keyframes_list in bone_channels:
+        cal3d_track = Track(cal3d_bone.index)
+        # The skeleton stores plain tuples
+        bone_quat = mathutils.Quaternion(cal3d_bone.quat)
+        bone_loc = mathutils.Vector(cal3d_bone.loc)
+
+        if bake:
+            frames = baked_frames
+        else:
+            frames = keyframes_list
+        LogMessage.count("keyframes_evaluated", len(frames))
+        loc_x, loc_y, loc_z, quat_w, quat_x, quat_y, quat_z = [
+            sample_fcurve(fcu, frames, default) for fcu, default in zip(fcurves, BONE_CHANNEL_DEFAULTS)]
+
+        cal3d_track.keyframes = []
+        for i, keyframe in enumerate(frames):
+            dloc = mathutils.Vector([loc_x[i], loc_y[i], loc_z[i]])
+            dquat = mathutils.Quaternion([quat_w[i], quat_x[i], quat_y[i], quat_z[i]])
 
             quat = dquat.copy()
-            quat.rotate(cal3d_bone.quat)
+            quat.rotate(bone_quat)
             quat.normalize()
 
-            dloc.x *= cal3d_skeleton.anim_scale.x
-            dloc.y *= cal3d_skeleton.anim_scale.y
-            dloc.z *= cal3d_skeleton.anim_scale.z
+            dloc.x *= cal3d_skeleton.anim_scale[0]
+            dloc.y *= cal3d_skeleton.anim_scale[1]
+            dloc.z *= cal3d_skeleton.anim_scale[2]
 
-            dloc.rotate(cal3d_bone.quat)
-            loc = cal3d_bone.loc + dloc
+            dloc.rotate(bone_quat)
+            loc = bone_loc + dloc
 
             cal3d_keyframe = KeyFrame(keyframe, loc, quat)
             cal3d_track.keyframes.append(cal3d_keyframe)
@@ -192,6 +188,16 @@ def create_cal3d_animation(cal3d_skeleton, action, fps, xml_version):
         for keyframe in track.keyframes:
             keyframe.time = (keyframe.time - first_keyframe) / fps
 
+    if keyframe_reduction and len(cal3d_animation.tracks) > 0:
+        keyframes_before = 0
+        keyframes_after = 0
+        for track in cal3d_animation.tracks:
+            keyframes_before += len(track.keyframes)
+            track.reduce_keyframes(loc_tolerance, radians(angle_tolerance))
+            keyframes_after += len(track.keyframes)
+        LogMessage.log_message("  Keyframes of {0} reduced from {1} to {2}".format(action.name,
+            keyframes_before, keyframes_after))
+        LogMessage.count("keyframes_dropped", keyframes_before - keyframes_after)
 
     if len(cal3d_animation.tracks) > 0:
         LogMessage.log_message("  Animation: "+action.name)
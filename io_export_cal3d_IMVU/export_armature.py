@@ -30,7 +30,7 @@ from .armature_classes import *
 from .logger_class import Logger, get_logger
 
 
-def treat_bone(b, scale, parent, skeleton, lights):
+def treat_bone(b, scale, parent, parent_matrix, skeleton, lights):
     # skip bones that start with _
     # also skips children of that bone so be careful
     if len(b.name) == 0 or  b.name[0] == '_':
@@ -55,20 +55,31 @@ def treat_bone(b, scale, parent, skeleton, lights):
         #print("parent, matrice :", matrix2)
         bone_trans = (b.matrix_local.to_translation()-b.parent.matrix_local.to_translation())*(b.parent.matrix_local.to_quaternion()).to_matrix()
         bone_quat = bone_matrix.to_quaternion()
-        bone = Bone(skeleton, parent, name, bone_trans, bone_quat, lights)
     else:
         # Here, the translation is simply the head vector
-        bone = Bone(skeleton, parent, name,
-                    (b.matrix_local * skeleton.matrix).to_translation(),
-                    b.matrix.to_quaternion(), lights)
+        bone_trans = (b.matrix_local * Matrix(skeleton.matrix)).to_translation()
+        bone_quat = b.matrix.to_quaternion()
         #Debug :
         #trans = skeleton.matrix.to_translation()
         #print("root bone :", trans)
         #matrix2 = b.matrix_local* skeleton.matrix
         #print("local, matrice :", matrix2)
 
+    # Transformation from the skeleton coordinate frame to the tail of the bone
+    bone_transform = bone_quat.to_matrix().to_4x4()
+    bone_transform[0][3] += bone_trans[0]
+    bone_transform[1][3] += bone_trans[1]
+    bone_transform[2][3] += bone_trans[2]
+    if parent_matrix is not None:
+        bone_transform = parent_matrix * bone_transform
+
+    # Bone only stores plain tuples
+    lmatrix = bone_transform.inverted()
+    bone = Bone(skeleton, parent, name, bone_trans, bone_quat,
+                lmatrix.to_translation(), lmatrix.to_quaternion(), lights)
+
     for child in b.children:
-        treat_bone(child, scale, bone, skeleton, lights)
+        treat_bone(child, scale, bone, bone_transform, skeleton, lights)
     
 
 
@@ -99,9 +110,15 @@ def create_cal3d_skeleton(arm_obj, arm_data,
     scalematrix[1][1] = total_scale.y
     scalematrix[2][2] = total_scale.z
 
+    # Bones look up their light color by name
+    light_colors = {}
+    if lights:
+        for light in lights:
+            light_colors[light.name] = tuple(light.color)
+
     for bone in arm_data.bones.values():
         if not bone.parent and bone.name[0] != "_":
-            treat_bone(bone, scalematrix, None, skeleton, lights)
+            treat_bone(bone, scalematrix, None, None, skeleton, light_colors)
 
     return skeleton
 
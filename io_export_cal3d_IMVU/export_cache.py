@@ -0,0 +1,211 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Incremental export: remember a content hash for every file we write, so the next export
+# can skip building and writing files whose input data and export options didn't change.
+# The hashes are stored in a json file next to the exported files.
+
+import hashlib
+import json
+import os
+from array import array
+
+from .logger_class import get_logger
+
+# Change this when the exporter output changes, so old cache entries are not trusted anymore
+CACHE_VERSION = 1
+
+
+class ExportCache:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        # exported file path -> {"digest": ..., "size": ..., "mtime": ...}
+        self.entries = {}
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, "rt") as cache_file:
+                    data = json.load(cache_file)
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = data.get("files", {})
+            except (ValueError, OSError) as e:
+                get_logger().log_warning("Could not read export cache " + filepath + ": " + str(e))
+
+
+    # True when filepath was written by us with the same digest and hasn't been changed since
+    def is_unchanged(self, filepath, digest):
+        entry = self.entries.get(os.path.abspath(filepath))
+        if not entry or entry["digest"] != digest or not os.path.exists(filepath):
+            return False
+        stat = os.stat(filepath)
+        return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+
+    # Remember the digest of a file we just wrote
+    def update(self, filepath, digest):
+        stat = os.stat(filepath)
+        self.entries[os.path.abspath(filepath)] = {"digest": digest,
+                                                   "size": stat.st_size,
+                                                   "mtime": stat.st_mtime}
+
+
+    def save(self):
+        with open(self.filepath, "wt") as cache_file:
+            json.dump({"version": CACHE_VERSION, "files": self.entries}, cache_file, indent=1, sort_keys=True)
+
+
+# Hash builder that accepts the kind of values we get from Blender
+class ContentHash:
+    def __init__(self, *values):
+        self.sha = hashlib.sha1()
+        self.add(CACHE_VERSION, *values)
+
+
+    def add(self, *values):
+        for value in values:
+            self.sha.update(repr(value).encode("utf8"))
+            self.sha.update(b'\0')
+
+
+    # Add the property prop of all items of an RNA collection, read in bulk with foreach_get
+    def add_collection(self, collection, prop, size, typecode='f'):
+        values = array(typecode, [0]) * (len(collection) * size)
+        if len(values) > 0:
+            collection.foreach_get(prop, values)
+        self.add(prop, len(values))
+        self.sha.update(values.tobytes())
+
+
+    def add_matrix(self, matrix):
+        self.add([tuple(row) for row in matrix])
+
+
+    def hexdigest(self):
+        return self.sha.hexdigest()
+
+
+# Hash of everything the skeleton (and thereby the bone indices in meshes and animations) depends on
+def hash_skeleton(arm_obj, lamps, options):
+    content = ContentHash("skeleton", arm_obj.name, options)
+    content.add_matrix(arm_obj.matrix_world)
+    for bone in arm_obj.data.bones:
+        if bone.parent:
+            content.add(bone.name, bone.parent.name)
+        else:
+            content.add(bone.name, None)
+        content.add_matrix(bone.matrix_local)
+        content.add_matrix(bone.matrix)
+    # Light bones take their color from the lamp with the same name
+    for lamp in lamps:
+        content.add(lamp.name, tuple(lamp.color))
+    return content.hexdigest()
+
+
+# Add the settings of a modifier (of an object or an fcurve): all its RNA properties, pointers
+# (the armature object of an armature modifier, the mirror object, ...) by the name of what they
+# point at, collections (the control points of an envelope) item by item
+def hash_modifier(content, modifier):
+    content.add(getattr(modifier, "type", None))
+    for prop in modifier.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+        value = getattr(modifier, prop.identifier, None)
+        if prop.type == 'POINTER':
+            value = getattr(value, "name", None)
+        elif prop.type == 'COLLECTION':
+            content.add(prop.identifier, len(value))
+            for item in value:
+                hash_modifier(content, item)
+            continue
+        elif getattr(prop, "is_array", False):
+            # The repr of an RNA array doesn't show its values
+            value = tuple(value)
+        elif isinstance(value, (set, frozenset)):
+            # Enum flags, the order of a set depends on the string hash seed
+            value = tuple(sorted(value))
+        content.add(prop.identifier, value)
+
+
+# Hash of the mesh data, weights, shape keys and materials create_cal3d_mesh uses
+# mesh_materials is the list of (material name, used index) of the material slots of the mesh
+def hash_mesh(mesh_obj, skeleton_digest, mesh_materials, options):
+    mesh = mesh_obj.data
+    content = ContentHash("mesh", mesh_obj.name, skeleton_digest, mesh_materials, options)
+    content.add_matrix(mesh_obj.matrix_world)
+    # The exported geometry and the shape key normals depend on the modifier settings
+    for modifier in mesh_obj.modifiers:
+        hash_modifier(content, modifier)
+
+    content.add_collection(mesh.vertices, "co", 3)
+    content.add_collection(mesh.loops, "vertex_index", 1, 'i')
+    content.add_collection(mesh.polygons, "loop_total", 1, 'i')
+    content.add_collection(mesh.polygons, "material_index", 1, 'i')
+    for uv_layer in mesh.uv_layers:
+        content.add(uv_layer.name)
+        content.add_collection(uv_layer.data, "uv", 2)
+    for vertex_color in mesh.vertex_colors:
+        content.add(vertex_color.name, vertex_color.active)
+        content.add_collection(vertex_color.data, "color", 3)
+
+    # Vertex groups have a variable number of entries per vertex, no foreach_get for those
+    content.add([group.name for group in mesh_obj.vertex_groups])
+    weights = array('d')
+    for vertex in mesh.vertices:
+        weights.append(len(vertex.groups))
+        for group in vertex.groups:
+            weights.append(group.group)
+            weights.append(group.weight)
+    content.sha.update(weights.tobytes())
+
+    if mesh.shape_keys:
+        content.add(mesh.shape_keys.use_relative)
+        for kb in mesh.shape_keys.key_blocks:
+            content.add(kb.name)
+            content.add_collection(kb.data, "co", 3)
+    return content.hexdigest()
+
+
+# Hash of the fcurves of an action, used for both skeletal and morph animations
+def hash_action(action, skeleton_digest, options):
+    content = ContentHash("action", action.name, action.id_root, skeleton_digest, options)
+    for fcu in action.fcurves:
+        if fcu.group:
+            content.add(fcu.data_path, fcu.array_index, fcu.group.name, fcu.extrapolation)
+        else:
+            content.add(fcu.data_path, fcu.array_index, None, fcu.extrapolation)
+        # fcu.evaluate applies the modifiers and the easing of the keyframes, all their settings count
+        content.add(len(fcu.modifiers))
+        for modifier in fcu.modifiers:
+            hash_modifier(content, modifier)
+        # The easing settings were added in Blender 2.70
+        content.add([(keyframe.interpolation, getattr(keyframe, "easing", None), getattr(keyframe, "back", None),
+                      getattr(keyframe, "amplitude", None), getattr(keyframe, "period", None))
+                     for keyframe in fcu.keyframe_points])
+        content.add_collection(fcu.keyframe_points, "co", 2)
+        content.add_collection(fcu.keyframe_points, "handle_left", 2)
+        content.add_collection(fcu.keyframe_points, "handle_right", 2)
+    return content.hexdigest()
+
+
+# Hash of a morph (shape key) action. The morph tracks are named after the shape keys, so the
+# names of the key blocks of all shape keys are part of it too.
+def hash_morph_action(action, shape_keys, options):
+    key_block_names = [[kb.name for kb in key.key_blocks] for key in shape_keys]
+    return hash_action(action, None, (options, key_block_names))
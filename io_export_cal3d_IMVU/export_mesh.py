@@ -21,10 +21,20 @@
 
 import bpy
 import mathutils
+from mathutils import Vector
+from array import array
+
+# NumPy is bundled with Blender 2.70 and later, for older versions we fall back to the array module
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from . import mesh_classes
 from . import armature_classes
 from .mesh_classes import *
+from .mesh_optimize import optimize_submesh_vertex_cache
+from .mesh_lod import shared_blender_vertices, generate_submesh_lod
 from .armature_classes import *
 from . import logger_class
 from .logger_class import Logger, get_logger
@@ -90,37 +100,130 @@ def create_cal3d_materials(cal3d_dirname, imagepath_prefix, xml_version, copy_im
     return cal3d_materials
 
 
-def get_vertex_influences(vertex, mesh_obj, cal3d_skeleton, use_groups, use_envelopes, armature_obj):
-    if not cal3d_skeleton:
-        return []
-
-    influences = []
-    
-    if use_groups:
+# Container for the mesh attributes that create_cal3d_mesh needs, extracted in bulk.
+# All arrays are flat: vertex_co[3*i:3*i+3] is the coordinate of blender vertex i,
+# face_vertices[4*f:4*f+4] are the vertex indices of tessface f (fourth is 0 for triangles),
+# face_uvs[layer][8*f:8*f+8] the (already flipped) uvs of the 4 corners of tessface f
+# and face_colors[12*f:12*f+12] the colors of its 4 corners (None without vertex colors).
+class MeshArrays:
+    def __init__(self):
+        self.vertex_co = None
+        self.vertex_normal = None
+        self.face_vertices = None
+        self.face_material = None
+        self.face_uvs = []
+        self.face_colors = None
+
+
+def new_float_array(size):
+    if numpy is not None:
+        return numpy.zeros(size, dtype=numpy.float32)
+    return array('f', [0.0]) * size
+
+
+def new_int_array(size):
+    if numpy is not None:
+        return numpy.zeros(size, dtype=numpy.int32)
+    return array('i', [0]) * size
+
+
+# Pull positions, normals, face vertices, material indices, uvs of every uv layer and vertex
+# colors out of the mesh with foreach_get instead of reading them one attribute at a time.
+def extract_mesh_arrays(mesh_data):
+    vertex_count = len(mesh_data.vertices)
+    face_count = len(mesh_data.tessfaces)
+
+    mesh_arrays = MeshArrays()
+    mesh_arrays.vertex_co = new_float_array(vertex_count * 3)
+    mesh_data.vertices.foreach_get("co", mesh_arrays.vertex_co)
+    mesh_arrays.vertex_normal = new_float_array(vertex_count * 3)
+    mesh_data.vertices.foreach_get("normal", mesh_arrays.vertex_normal)
+
+    mesh_arrays.face_vertices = new_int_array(face_count * 4)
+    mesh_data.tessfaces.foreach_get("vertices_raw", mesh_arrays.face_vertices)
+    mesh_arrays.face_material = new_int_array(face_count)
+    mesh_data.tessfaces.foreach_get("material_index", mesh_arrays.face_material)
+
+    for uv_texture in mesh_data.tessface_uv_textures:
+        face_uv = new_float_array(face_count * 8)
+        uv_texture.data.foreach_get("uv_raw", face_uv)
+        # Etory : Don't flip texture verticaly
+        # jgb 2012-11-03 IMVU does need it to be flipped
+        if numpy is not None:
+            face_uv[1::2] = 1.0 - face_uv[1::2]
+        else:
+            for i in range(1, len(face_uv), 2):
+                face_uv[i] = 1.0 - face_uv[i]
+        mesh_arrays.face_uvs.append(face_uv)
+
+    if mesh_data.tessface_vertex_colors:
+        color_data = mesh_data.tessface_vertex_colors.active.data
+        mesh_arrays.face_colors = new_float_array(face_count * 12)
+        corner_color = new_float_array(face_count * 3)
+        for corner, color_name in enumerate(("color1", "color2", "color3", "color4")):
+            color_data.foreach_get(color_name, corner_color)
+            for c in range(3):
+                mesh_arrays.face_colors[corner * 3 + c::12] = corner_color[c::3]
+
+    return mesh_arrays
+
+
+# Build a table that maps the index of each vertex group of the mesh object to the index
+# of the cal3d bone with the same name. Groups without a matching bone are left out.
+def create_group_bone_table(mesh_obj, cal3d_skeleton):
+    bone_indices = {}
+    for bone in cal3d_skeleton.bones:
+        # Keep the first bone with a given name, same as the old name scan did
+        if bone.name not in bone_indices:
+            bone_indices[bone.name] = bone.index
+
+    group_bone_table = {}
+    for group_index, group in enumerate(mesh_obj.vertex_groups):
+        bone_index = bone_indices.get(group.name)
+        if bone_index is not None:
+            group_bone_table[group_index] = bone_index
+    return group_bone_table
+
+
+# Extract the weights of all vertices in one pass into a sparse vertex x bone structure:
+# a list indexed by blender vertex index holding (bone index, weight) tuples for that vertex.
+def collect_vertex_weights(mesh_data, mesh_obj, group_bone_table):
+    vertex_weights = []
+    for vertex in mesh_data.vertices:
+        weights = []
         for group in vertex.groups:
-            group_index = group.group
-            group_name = mesh_obj.vertex_groups[group_index].name
             # jgb debug
             if debug_export > 0:
-                global LogMessage
-                LogMessage.log_debug( "group name " + group_name + ", group weight: " + str(group.weight))
+                LogMessage.log_debug( "group name " + mesh_obj.vertex_groups[group.group].name +
+                    ", group weight: " + str(group.weight))
             weight = group.weight
             if weight > 0.0001:
-                for bone in cal3d_skeleton.bones:
-                    if (bone.name == group_name):
-                        influence = Influence(bone.index, weight)
-                        influences.append(influence)
-                        break
+                bone_index = group_bone_table.get(group.group)
+                if bone_index is not None:
+                    weights.append((bone_index, weight))
+        vertex_weights.append(weights)
+    return vertex_weights
+
+
+# Returns the influences of a vertex as a list of (bone index, weight)
+def get_vertex_influences(vertex_index, vertex_co, vertex_weights, mesh_obj, cal3d_skeleton, use_envelopes, armature_obj):
+    if not cal3d_skeleton:
+        return []
+
+    influences = []
+    
+    # vertex_weights is None when we are not using vertex groups
+    if vertex_weights is not None:
+        influences.extend(vertex_weights[vertex_index])
 
     # XXX BROKEN (jgb: use_envelopes always set to False in __init__.py, dont know what the intention of this value is)
     if use_envelopes and not (len(influences) > 0):
         for bone in armature_obj.data.bones:
-            weight = bone.evaluate_envelope(armature_obj.matrix_world.copy().inverted() * (mesh_obj.matrix_world * vertex.co))
+            weight = bone.evaluate_envelope(armature_obj.matrix_world.copy().inverted() * (mesh_obj.matrix_world * vertex_co))
             if weight > 0:
                 for cal3d_bone in cal3d_skeleton.bones:
                     if bone.name == cal3d_bone.name:
-                        influence = Influence(cal3d_bone.index, weight)
-                        influences.append(influence)
+                        influences.append((cal3d_bone.index, weight))
                         break
 
     return influences
@@ -185,6 +288,126 @@ def collect_shapekey_normals(mesh_obj, scene, mesh_matrix, shape_keys):
     # Return the collected ShapeKey normals
     return sk_normals, sk_vertices
 
+# Compute ShapeKey vertices and normals numerically instead of creating a mesh for every ShapeKey.
+# The coordinates of all ShapeKeys are read in bulk from their key block data and transformed by
+# mesh_matrix. The normals are face (area) weighted vertex normals over the triangles of the base
+# mesh topology (face_vertices as returned by extract_mesh_arrays).
+# Unlike collect_shapekey_normals this doesn't apply modifiers and leaves the scene state alone.
+# Requires NumPy. Returns arrays with shape (ShapeKeys without Basis, vertices, 3).
+def compute_shapekey_normals_from_keys(mesh_matrix, shape_keys, face_vertices):
+    key_blocks = shape_keys.key_blocks[1:]
+    vertex_count = len(shape_keys.key_blocks[0].data)
+
+    matrix = numpy.array([list(row) for row in mesh_matrix], dtype=numpy.float64)
+    rotation = matrix[:3, :3]
+    translation = matrix[:3, 3]
+
+    # Split quads in two triangles the same way as the faces are written: (1, 2, 3) and (1, 3, 4)
+    faces = numpy.asarray(face_vertices, dtype=numpy.int64).reshape(-1, 4)
+    quads = faces[faces[:, 3] != 0]
+    triangles = numpy.concatenate((faces[:, [0, 1, 2]], quads[:, [0, 2, 3]]))
+
+    sk_vertices = numpy.empty((len(key_blocks), vertex_count, 3), dtype=numpy.float32)
+    sk_normals = numpy.empty((len(key_blocks), vertex_count, 3), dtype=numpy.float32)
+    key_co = numpy.empty(vertex_count * 3, dtype=numpy.float32)
+    for si, kb in enumerate(key_blocks):
+        kb.data.foreach_get("co", key_co)
+        co = key_co.reshape(-1, 3).astype(numpy.float64).dot(rotation.T) + translation
+
+        # The length of the cross product is twice the triangle area, so summing them weighs by area
+        v1 = co[triangles[:, 0]]
+        face_normals = numpy.cross(co[triangles[:, 1]] - v1, co[triangles[:, 2]] - v1)
+        normals = numpy.zeros((vertex_count, 3), dtype=numpy.float64)
+        for corner in range(3):
+            numpy.add.at(normals, triangles[:, corner], face_normals)
+        lengths = numpy.sqrt((normals * normals).sum(axis=1))
+        lengths[lengths == 0.0] = 1.0
+        normals /= lengths[:, numpy.newaxis]
+
+        sk_vertices[si] = co
+        sk_normals[si] = normals
+        if si == 0 and debug_export > 0:
+            LogMessage.log_debug("ShapeKey 0 [0] has normal {0} and vertex {1}".format(normals[0], co[0]))
+
+    return sk_normals, sk_vertices
+
+# Select for all ShapeKeys at once which vertices differ enough from the base mesh to be added
+# as blend vertex to the morph of that ShapeKey.
+# posdiff according to cal3d source in saver.cpp is computed as the absolute length of
+# the difference between the vertex and blend vertex. Blend vertices with a posdiff below
+# tolerance are ignored. Note that the Cal3d saver uses different values for the binary saver
+# and the xml saver: binary uses 0.01 and xml uses 1.0, by default we go in the middle with 0.1
+# Returns a dict that maps blender vertex index to a list of (ShapeKey id, position, normal, posdiff)
+# tuples, ordered by ShapeKey id, with position and normal already transformed for export.
+def select_blend_vertices(vertex_co, sk_vertices, sk_normals, total_translation, base_scale, total_rotation, tolerance):
+    blend_vertex_data = {}
+    # Number of ShapeKey vertices that are too close to the base vertex to become a blend vertex
+    dropped = 0
+
+    if numpy is not None:
+        rotation = numpy.array([list(row) for row in total_rotation], dtype=numpy.float64)
+        translation = numpy.array(list(total_translation), dtype=numpy.float64)
+
+        coords = ((numpy.asarray(vertex_co, dtype=numpy.float64).reshape(-1, 3) + translation) * base_scale).dot(rotation.T)
+
+        # One ShapeKey at a time, so the temporaries stay at (vertices, 3) instead of growing with
+        # the number of ShapeKeys. The ShapeKeys are visited in order, so the list of every vertex
+        # stays ordered by ShapeKey id.
+        for sk_id in range(len(sk_vertices)):
+            sk_coords = ((numpy.asarray(sk_vertices[sk_id], dtype=numpy.float64) + translation) * base_scale).dot(rotation.T)
+            deltas = sk_coords - coords
+            posdiffs = numpy.sqrt((deltas * deltas).sum(axis=1))
+            del deltas
+
+            vertex_indices = numpy.flatnonzero(posdiffs >= tolerance)
+            dropped += len(posdiffs) - len(vertex_indices)
+            if len(vertex_indices) == 0:
+                continue
+
+            # Only the normals of the blend vertices are needed
+            sk_norms = (numpy.asarray(sk_normals[sk_id], dtype=numpy.float64)[vertex_indices] * base_scale).dot(rotation.T)
+            lengths = numpy.sqrt((sk_norms * sk_norms).sum(axis=1))
+            lengths[lengths == 0.0] = 1.0
+            sk_norms /= lengths[:, numpy.newaxis]
+
+            for row, vertex_index in enumerate(vertex_indices.tolist()):
+                blend_vertex_data.setdefault(vertex_index, []).append((sk_id,
+                    Vector(sk_coords[vertex_index].tolist()),
+                    Vector(sk_norms[row].tolist()),
+                    float(posdiffs[vertex_index])))
+    else:
+        vertex_count = len(vertex_co) // 3
+        coords = []
+        for vertex_index in range(vertex_count):
+            coord = Vector(vertex_co[3*vertex_index:3*vertex_index+3].tolist())
+            coord = coord + total_translation
+            coord *= base_scale
+            coord.rotate(total_rotation)
+            coords.append(coord)
+
+        for sk_id in range(len(sk_vertices)):
+            for vertex_index in range(vertex_count):
+                sk_coord = Vector(sk_vertices[sk_id][vertex_index])
+                sk_coord = sk_coord + total_translation
+                sk_coord *= base_scale
+                sk_coord.rotate(total_rotation)
+
+                posdiff = abs((sk_coord - coords[vertex_index]).length)
+                if posdiff >= tolerance:
+                    sk_normal = Vector(sk_normals[sk_id][vertex_index])
+                    sk_normal *= base_scale
+                    sk_normal.rotate(total_rotation)
+                    sk_normal.normalize()
+                    blend_vertex_data.setdefault(vertex_index, []).append((sk_id,
+                        sk_coord, sk_normal, posdiff))
+                else:
+                    dropped += 1
+
+    LogMessage.count("blend_vertices_dropped", dropped)
+    if debug_export > 0:
+        LogMessage.log_debug("Vertices with blend vertices: " + str(len(blend_vertex_data)))
+    return blend_vertex_data
+
 # functions to determine if a string ends in [number]  (a number between square brackets)
 # Returns None if not ending in [number], or the number 
 def ends_with_number(string):
@@ -203,6 +426,49 @@ def ends_with_number(string):
             return None
         
 
+# Set cal3d_material as being in use when needed and assign its used_index
+def use_cal3d_material(cal3d_material, cal3d_used_materials, submesh_index):
+    if cal3d_material.in_use == False:
+        # 2012-12-14 Determine if material name ends in a number
+        mat_num = ends_with_number(cal3d_material.name)
+        if mat_num is not None:
+            # explicit material number set: use that instead of consecutive index
+            # WARNING: currently no checking that a material number is used twice
+            # or that it will interfere with another number using the consecutive indexing!
+            cal3d_material.used_index = mat_num
+            LogMessage.log_message("    Explicit material number {0} set for submesh {1}".format(mat_num,submesh_index))
+        else:
+            cal3d_material.used_index = len(cal3d_used_materials)
+        cal3d_material.in_use = True
+        cal3d_used_materials.append(cal3d_material)
+
+
+# Set the cal3d materials of the material slots of mesh_obj in use, in the same order as
+# create_cal3d_mesh does, without building the mesh. Used by the export cache to keep the
+# material numbering the same when a mesh is skipped.
+# Returns a list of (material name, used index) for the material slots of the mesh.
+def use_mesh_materials(mesh_obj, cal3d_materials, cal3d_used_materials):
+    global LogMessage
+    LogMessage = get_logger()
+    cal3d_materials_by_name = {}
+    for cal3d_material in cal3d_materials:
+        cal3d_materials_by_name.setdefault(cal3d_material.name, cal3d_material)
+
+    mesh_materials = []
+    submesh_index = 0
+    for slot in mesh_obj.material_slots:
+        cal3d_material = None
+        if slot.material:
+            cal3d_material = cal3d_materials_by_name.get(slot.material.name)
+        if cal3d_material:
+            use_cal3d_material(cal3d_material, cal3d_used_materials, submesh_index)
+            mesh_materials.append((cal3d_material.name, cal3d_material.used_index))
+            submesh_index += 1
+        else:
+            mesh_materials.append((None, -1))
+    return mesh_materials
+
+
 def create_cal3d_mesh(scene, mesh_obj,
                       cal3d_skeleton,
                       cal3d_materials, cal3d_used_materials,
@@ -210,7 +476,10 @@ def create_cal3d_mesh(scene, mesh_obj,
                       base_translation_orig,
                       base_scale,
                       xml_version,
-                      use_groups, use_envelopes, armature_obj):
+                      use_groups, use_envelopes, armature_obj,
+                      compute_shapekey_normals=False, morph_tolerance=0.1,
+                      max_influences=MAX_INFLUENCES, optimize_vertex_cache=False,
+                      lod_reduction=0.0):
 
     global LogMessage
     LogMessage = get_logger()
@@ -276,35 +545,28 @@ def create_cal3d_mesh(scene, mesh_obj,
     # Take test for blender_material None out of loop, no need to be tested more than once!
     # if can be replaced by test len(mesh_data.materials) > 0: (see above)
     if blender_material != None:
+        # Look up cal3d materials by name instead of comparing against all of them for every blender material
+        cal3d_materials_by_name = {}
+        for cal3d_material in cal3d_materials:
+            cal3d_materials_by_name.setdefault(cal3d_material.name, cal3d_material)
+
         bm = 0  # jgb not sure if there is another way in python to get the index of blender_material in materials
         for blender_material in mesh_data.materials:
-            for cal3d_material in cal3d_materials:
-                # jgb 2012-11-03 debug
+            cal3d_material = cal3d_materials_by_name.get(blender_material.name)
+            # jgb 2012-11-03 debug
+            if debug_export > 0:
+                LogMessage.log_debug("material: blender name: " + blender_material.name + " found cal3d material: " + str(cal3d_material is not None))
+            if cal3d_material:
+                cal3d_material_index = cal3d_material.index
+                # jgb debug
                 if debug_export > 0:
-                    LogMessage.log_debug("material: blender name: " + blender_material.name + " cal3d name: " + cal3d_material.name)
-                if (cal3d_material.name == blender_material.name):
-                    cal3d_material_index = cal3d_material.index
-                    # jgb debug
-                    if debug_export > 0:
-                        LogMessage.log_debug("cal3d/mesh material indexes: " + str(cal3d_material_index) + " , " + str(bm))
-                    # jgb Set this material as being in use when needed:
-                    if cal3d_material.in_use == False:
-                        # 2012-12-14 Determine if material name ends in a number
-                        mat_num = ends_with_number(cal3d_material.name)
-                        if mat_num is not None:
-                            # explicit material number set: use that instead of consecutive index
-                            # WARNING: currently no checking that a material number is used twice
-                            # or that it will interfere with another number using the consecutive indexing!
-                            cal3d_material.used_index = mat_num
-                            LogMessage.log_message("    Explicit material number {0} set for submesh {1}".format(mat_num,len(cal3d_mesh.submeshes)))
-                        else:
-                            cal3d_material.used_index = len(cal3d_used_materials)
-                        cal3d_material.in_use = True
-                        cal3d_used_materials.append(cal3d_material)
-                    # jgb 2012-11-05 Add mesh_material id relative to mesh to SubMesh
-                    cal3d_submesh = SubMesh(cal3d_mesh, len(cal3d_mesh.submeshes),
-                        cal3d_material.used_index, bm)
-                    cal3d_mesh.submeshes.append(cal3d_submesh)
+                    LogMessage.log_debug("cal3d/mesh material indexes: " + str(cal3d_material_index) + " , " + str(bm))
+                # jgb Set this material as being in use when needed:
+                use_cal3d_material(cal3d_material, cal3d_used_materials, len(cal3d_mesh.submeshes))
+                # jgb 2012-11-05 Add mesh_material id relative to mesh to SubMesh
+                cal3d_submesh = SubMesh(cal3d_mesh, len(cal3d_mesh.submeshes),
+                    cal3d_material.used_index, bm)
+                cal3d_mesh.add_submesh(cal3d_submesh)
             bm += 1
     else:
         LogMessage.log_error("ERROR: this mesh has no materials!")
@@ -322,6 +584,14 @@ def create_cal3d_mesh(scene, mesh_obj,
         LogMessage.log_error("ERROR: There are no uv textures assigned!")
         return None
 
+    # Read all the mesh attributes we need in bulk
+    mesh_arrays = extract_mesh_arrays(mesh_data)
+
+    # The submeshes store their vertices and faces in arrays, with a uv set for every uv layer.
+    # The influences of each vertex are capped and normalized once, when it is added.
+    for sm in cal3d_mesh.submeshes:
+        sm.arrays = SubMeshArrays(len(mesh_arrays.face_uvs), max_influences)
+
     # Test existence of shape keys for morphing
     # Need more than 1 shape_key because first is the Basis which is the same as our mesh
     if mesh_data.shape_keys and len(mesh_data.shape_keys.key_blocks) > 1:
@@ -339,18 +609,19 @@ def create_cal3d_mesh(scene, mesh_obj,
                     LogMessage.log_warning("shape key "+kb.name+" has a different vertex count as the base mesh."+
                         " Morph targets will be ignored and not exported!")
                     break
+                # IMVU requires morph names to end in 1 of 4 names:
+                # .Clamped, . Average, .Exclusive, or .Additive (see IMVU documentation on what they do)
+                # N.B.: the IMVU Morph Targets page wrongly says it should be .Averaged, it should be .Average
+                # The name is the same for all submeshes, so check it only once
+                LogMessage.log_message("    Morph name: "+kb.name)
+                if kb.name.endswith(".Averaged"):
+                    LogMessage.log_warning("WARNING: Morph name " + kb.name + " wrongly ends in .Averaged. It should end in .Average instead!")
+                # We will give a warning here if the morph name doesn't conform to that
+                if not (kb.name.endswith(".Exclusive") or kb.name.endswith(".Additive") or
+                        kb.name.endswith(".Average") or kb.name.endswith(".Clamped")):
+                    LogMessage.log_warning("WARNING: Morph name " + kb.name + " doesn't end in one of the IMVU specified suffixes!")
                 # Add a morph with this name and id to all submeshes
                 for sm in cal3d_mesh.submeshes:
-                    # IMVU requires morph names to end in 1 of 4 names:
-                    # .Clamped, . Average, .Exclusive, or .Additive (see IMVU documentation on what they do)
-                    # N.B.: the IMVU Morph Targets page wrongly says it should be .Averaged, it should be .Average
-                    LogMessage.log_message("    Morph name: "+kb.name)
-                    if kb.name.endswith(".Averaged"):
-                        LogMessage.log_warning("WARNING: Morph name " + kb.name + " wrongly ends in .Averaged. It should end in .Average instead!")
-                    # We will give a warning here if the morph name doesn't conform to that
-                    if not (kb.name.endswith(".Exclusive") or kb.name.endswith(".Additive") or
-                            kb.name.endswith(".Average") or kb.name.endswith(".Clamped")):
-                        LogMessage.log_warning("WARNING: Morph name " + kb.name + " doesn't end in one of the IMVU specified suffixes!")
                     cal3d_morph = Morph(kb.name,sk_id)
                     if cal3d_morph:
                         sm.morphs.append(cal3d_morph)
@@ -363,63 +634,98 @@ def create_cal3d_mesh(scene, mesh_obj,
             # Get the normals of the ShapeKeys
             if debug_export > 0:
                 LogMessage.log_debug("Collecting ShapeKey normals and vertices")
-            sk_normals, sk_vertices = collect_shapekey_normals(mesh_obj, scene, mesh_matrix, mesh_data.shape_keys)
+            if compute_shapekey_normals and numpy is None:
+                LogMessage.log_warning("Computing ShapeKey normals requires NumPy, using the slower mesh based method instead.")
+            with LogMessage.span("shape_keys", mesh_obj.name):
+                if compute_shapekey_normals and numpy is not None:
+                    sk_normals, sk_vertices = compute_shapekey_normals_from_keys(mesh_matrix, mesh_data.shape_keys,
+                        mesh_arrays.face_vertices)
+                else:
+                    sk_normals, sk_vertices = collect_shapekey_normals(mesh_obj, scene, mesh_matrix, mesh_data.shape_keys)
     else:
         do_shape_keys = False
 
-    mind = -1
-    for face in mesh_data.tessfaces:
-        cal3d_vertex1 = None
-        cal3d_vertex2 = None
-        cal3d_vertex3 = None
-        cal3d_vertex4 = None
+    # Select the blend vertices of all morphs at once
+    if do_shape_keys:
+        blend_vertex_data = select_blend_vertices(mesh_arrays.vertex_co, sk_vertices, sk_normals,
+            total_translation, base_scale, total_rotation, morph_tolerance)
+
+    # Look up the bone for each vertex group only once per mesh and extract all weights in one pass
+    vertex_weights = None
+    if use_groups:
+        group_bone_table = create_group_bone_table(mesh_obj, cal3d_skeleton)
+        vertex_weights = collect_vertex_weights(mesh_data, mesh_obj, group_bone_table)
+
+    face_vertices = mesh_arrays.face_vertices
+    face_material = mesh_arrays.face_material
+    face_uvs = mesh_arrays.face_uvs
+    face_colors = mesh_arrays.face_colors
+    vertex_cos = mesh_arrays.vertex_co
+    vertex_normals = mesh_arrays.vertex_normal
+
+    # Look up the submesh of each material index once. A material without cal3d material falls
+    # back to the last submesh (see Mesh.get_submesh), so several material indices can share a submesh.
+    submesh_by_material_index = {}
+    for mind in sorted(set(face_material)):
+        mind = int(mind)
+        cal3d_submesh = cal3d_mesh.get_submesh(mind)
+        if cal3d_submesh is None:
+            LogMessage.log_error("Submesh with correct material id not found!")
+            return None
+        if debug_export > 0:
+            LogMessage.log_debug("tess material: " + str(mind) +
+                                 " submesh material: " + str(cal3d_submesh.mesh_material_id))
+        submesh_by_material_index[mind] = cal3d_submesh.index
+    face_submesh = [submesh_by_material_index[int(mind)] for mind in face_material]
+
+    # Group the faces by submesh with a stable sort, so we only need to switch submesh once per submesh.
+    # Each submesh still gets its faces in tessface order, therefore the vertex numbering doesn't change.
+    if numpy is not None:
+        face_order = numpy.argsort(face_submesh, kind="mergesort").tolist()
+    else:
+        face_order = sorted(range(len(face_submesh)), key=face_submesh.__getitem__)
+
+    # Counters for the export report: vertices found in the dedup index, new vertices, and new
+    # vertices for a blender vertex that was already exported with other uvs (seams)
+    dedup_hits = 0
+    dedup_misses = 0
+    seam_duplicates = 0
+    exported_vertex_indices = set()
+
+    submesh_index = -1
+    for face_index in face_order:
+        face_corners = face_vertices[4*face_index:4*face_index+4].tolist()
+        # A fourth vertex index of 0 means this tessface is a triangle
+        if face_corners[3] == 0:
+            face_corners = face_corners[:3]
+        face_corner_uvs = [face_uv[8*face_index:8*face_index+8].tolist() for face_uv in face_uvs]
+        face_vertex_list = []
         
         #jgb 2012-11-4 try to add support for multiple submeshes based on material id
         # Get the submesh that has same material id as the one in tessfaces...
-        if mind != face.material_index:
-            mind = face.material_index
-            if debug_export > 0:
-                LogMessage.log_debug("tess material: " + str(face.material_index))
-                LogMessage.log_debug("tess verts: " + str(len(face.vertices)))
-            cal3d_submesh = cal3d_mesh.get_submesh(face.material_index)
-            if cal3d_submesh != None:
-                if debug_export > 0:
-                    LogMessage.log_debug("submesh material: " + str(cal3d_submesh.mesh_material_id))
-            else:
-                LogMessage.log_error("Submesh with correct material id not found!")
-                return None
+        if submesh_index != face_submesh[face_index]:
+            submesh_index = face_submesh[face_index]
+            cal3d_submesh = cal3d_mesh.submeshes[submesh_index]
 
-        for vertex_index in face.vertices:
+        for corner, vertex_index in enumerate(face_corners):
             duplicate = False
+            # Index of the vertex in the submesh arrays (its exportindex)
             cal3d_vertex = None
-            uvs = []
-
-            #Blender 2.6.3 use tesselation : tessface_uv_textures
-            for uv_texture in mesh_data.tessface_uv_textures:
-                if not cal3d_vertex1:
-                    uvs.append(uv_texture.data[face.index].uv1.copy())
-                elif not cal3d_vertex2:
-                    uvs.append(uv_texture.data[face.index].uv2.copy())
-                elif not cal3d_vertex3:
-                    uvs.append(uv_texture.data[face.index].uv3.copy())
-                elif not cal3d_vertex4:
-                    uvs.append(uv_texture.data[face.index].uv4.copy())
-
-            # Etory : Don't flip texture verticaly
-            # jgb 2012-11-03 IMVU does need it to be flipped, so uncommented the next 2 lines
-            for uv in uvs:
-                uv[1] = 1.0 - uv[1]
+
+            #Blender 2.6.3 use tesselation : tessface_uv_textures, already flipped for IMVU
+            uvs = [(corner_uvs[2*corner], corner_uvs[2*corner+1]) for corner_uvs in face_corner_uvs]
 
             if not uvs:
-                LogMessage.log_warning("No uv texture assigned to face "+str(face.index) + " vertex "+str(vertex_index))
+                LogMessage.log_warning("No uv texture assigned to face {0} vertex {1}", face_index, vertex_index,
+                                       category="face_without_uv")
 
             # 2012-12-15 Moved computing of normal here because for duplicate vertex ids we also
             # need to compare the normals!
-            vertex = mesh_data.vertices[vertex_index]
+            vertex_co = Vector(vertex_cos[3*vertex_index:3*vertex_index+3].tolist())
             if debug_export > 0:
-                LogMessage.log_debug("vertex "+str(vertex.co))
+                LogMessage.log_debug("vertex "+str(vertex_co))
 
-            normal = vertex.normal.copy()
+            normal = Vector(vertex_normals[3*vertex_index:3*vertex_index+3].tolist())
             normal *= base_scale
             normal.rotate(total_rotation)
             normal.normalize()
@@ -427,66 +733,35 @@ def create_cal3d_mesh(scene, mesh_obj,
                 LogMessage.log_debug("vertex normal: "+str(normal))
 
             # jgb 2012-12-15 We only need to duplicate a vertex if the uv coordinates differ
-            uv_matches = False
-            for cal3d_vertex_iter in cal3d_submesh.vertices:
-                # 2012-12-15 Since we are making duplicates in certain cases we can't just stop
-                # on the first equal index we find. In case they have differing uvs we should look
-                # for another corresponding index and test for equal uvs there too!
-                # Therefore we replace breaks with continue and we don't need duplicate variable anymore
-                # This change will of course make this part of the code slower
-                # because we need more iterations.
-                if cal3d_vertex_iter.index == vertex_index:
-                    #duplicate = True
-                    if len(cal3d_vertex_iter.maps) != len(uvs):
-                        #break
-                        continue
-                    
-                    uv_matches = True
-                    for i in range(len(uvs)):
-                        if cal3d_vertex_iter.maps[i].u != uvs[i][0]:
-                            uv_matches = False
-                            #break
-                            continue
-
-                        if cal3d_vertex_iter.maps[i].v != uvs[i][1]:
-                            uv_matches = False
-                            #break
-                            continue
-                    
-                    if uv_matches:
-                        cal3d_vertex = cal3d_vertex_iter
-                        # We have found an equal vertex thus can stop the loop
-                        break
-
-                    #break
-
-
-            # jgb 2012-11-07 try to figure out the vertex colors
-            # jgb 2012-11-08 but first test if there are any vertex colors
-            if mesh_data.tessface_vertex_colors:
-                col = mesh_data.tessface_vertex_colors.active.data[face.index]
-                if debug_export > 0:
-                    LogMessage.log_debug("vertex colors for face" + str(face.index))
-                    LogMessage.log_debug("colors: " + str(col.color1) + ", "+ str(col.color2) + ", "+ str(col.color3) + ", "+ str(col.color4))
-                if not cal3d_vertex1:
-                    vertex_color = col.color1
-                elif not cal3d_vertex2:
-                    vertex_color = col.color2
-                elif not cal3d_vertex3:
-                    vertex_color = col.color3
-                elif not cal3d_vertex4:
-                    vertex_color = col.color4
-                if debug_export > 0:
-                    LogMessage.log_debug(str(vertex_color))
-            else:
-                # jgb cal3d v 919 always requires the color tag to be written even if we don't use vertex colors thus set default colors
-                # 2012-12-23 Make it a Vector because we need to make a copy in mesh_classes if real vertex colors are used
-                vertex_color = Vector((1.0, 1.0, 1.0))
+            # Look up an already exported vertex with the same blender index and uvs in the
+            # dedup index of this submesh instead of scanning all of its vertices.
+            vertex_key = (vertex_index, tuple(uvs))
+            cal3d_vertex = cal3d_submesh.vertex_lookup.get(vertex_key)
 
             if debug_export > 0:
                 LogMessage.log_debug("vertex, duplicate indexes: "+str(vertex_index)+", "+str(duplicate_index))
 
-            if not cal3d_vertex:
+            if cal3d_vertex is not None:
+                dedup_hits += 1
+            else:
+                dedup_misses += 1
+                if (cal3d_submesh.index, vertex_index) in exported_vertex_indices:
+                    seam_duplicates += 1
+                else:
+                    exported_vertex_indices.add((cal3d_submesh.index, vertex_index))
+
+                # jgb 2012-11-07 try to figure out the vertex colors
+                # jgb 2012-11-08 but first test if there are any vertex colors
+                if face_colors is not None:
+                    color_start = 12*face_index + 3*corner
+                    vertex_color = Vector(face_colors[color_start:color_start+3].tolist())
+                    if debug_export > 0:
+                        LogMessage.log_debug("vertex color for face " + str(face_index) + ": " + str(vertex_color))
+                else:
+                    # jgb cal3d v 919 always requires the color tag to be written even if we don't use vertex colors thus set default colors
+                    # 2012-12-23 Make it a Vector because we need to make a copy in mesh_classes if real vertex colors are used
+                    vertex_color = Vector((1.0, 1.0, 1.0))
+
                 # 2012-12-15 jgb We need normals earlier in the code commenting it here
                 # vertex = mesh_data.vertices[vertex_index]
                 # if debug_export > 0:
@@ -499,73 +774,26 @@ def create_cal3d_mesh(scene, mesh_obj,
                 # if debug_export > 0:
                     # print("vertex normal: "+str(normal))
 
-                coord = vertex.co.copy()
+                coord = vertex_co.copy()
                 coord = coord + total_translation
                 coord *= base_scale
                 coord.rotate(total_rotation)
 
-                # If we have shape keys (morph targets) then also compute their vertex info
-                if do_shape_keys:
-                    sk_id = 0
-                    # loop over all ShapeKeys
-                    for kb in mesh_data.shape_keys.key_blocks[1:]:
-                        # Turn ShapeKey data into a Vector.
-                        blend_vertex = mathutils.Vector(kb.data[vertex_index].co.copy())
-                        if debug_export > 0:
-                            if vertex_index == 0:
-                                LogMessage.log_debug("vertex 0: {0}\nblend vertex 0: {1}".format(str(vertex.co),str(blend_vertex)))
-
-                        # Get the previously collected normal for this ShapeKey and vertex index
-                        #print("shapekey normal indexes sk, vertex "+str(sk_id)+", "+str(vertex_index))
-                        # sk_normals index starts at 0 for First non Basis ShapeKey!
-                        sk_normal = sk_normals[sk_id][vertex_index].copy()
-                        #print("shapekey normal "+str(sk_normal)+", vert: "+str(blend_vertex))
-                        sk_normal *= base_scale
-                        sk_normal.rotate(total_rotation)
-                        sk_normal.normalize()
-
-                        if debug_export > 0:
-                            LogMessage.log_debug("ShapeKey normal: "+str(sk_normal))
-
-                        # Compute ShapeKey position
-                        # jgb 2012-11-24 Now use the stored ShapeKey vertex instead of the data from the ShapeKey array
-                        sk_coord = sk_vertices[sk_id][vertex_index].copy()
-                        #sk_coord = blend_vertex.copy()
-                        sk_coord = sk_coord + total_translation
-                        sk_coord *= base_scale
-                        sk_coord.rotate(total_rotation)
-
-                        # Calculate posdiff between vertex and blend vertex
-                        # posdiff according to cal3d source in saver.cpp is computed as the absolute length of 
-                        # the difference between the vertex and blend vertex
-                        vec_posdiff = sk_coord - coord
-
-                        # Ignore this Blend Vector when difference is below Tolerance value
-                        # Note that the Cal3d saver uses different values for the binary saver and the xml saver
-                        # binary uses 0.01 and xml uses 1.0, We go in the middle with 0.1
-                        differenceTolerance = 0.1;
-                        posdiff = abs(vec_posdiff.length)
-                        if debug_export > 0:
-                            LogMessage.log_debug("posdiff: "+str(posdiff)+" vec_posdiff: "+str(vec_posdiff))
-                        
-                        # Only add this Blend Vertex if there is enough difference with the original Vertex
-                        if posdiff >= differenceTolerance:
-                            # BlendVertex index should be same as exportindex for normal Vertex:
-                            bv_index = len(cal3d_submesh.vertices)
-                            # Add Blend Vertex
-                            cal3d_blend_vertex = BlendVertex( bv_index,
-                                sk_coord, sk_normal, posdiff)
-                            # For now we always use the same texture coordinates for vertex and blend vertex
-                            # According to Boris the engineer using different values may not work anyway
-                            for uv in uvs:
-                                cal3d_blend_vertex.maps.append(Map(uv[0], uv[1]))
-                            # Get corresponding morph in submesh
-                            sk_morph = cal3d_submesh.morphs[sk_id]
-                            # Add the blend vertex to morph
-                            sk_morph.blend_vertices.append(cal3d_blend_vertex)
-
-                        # Increment the current ShapeKey index
-                        sk_id += 1
+                # If we have shape keys (morph targets) then add the blend vertices that were
+                # selected for this vertex
+                if do_shape_keys and vertex_index in blend_vertex_data:
+                    for sk_id, sk_coord, sk_normal, posdiff in blend_vertex_data[vertex_index]:
+                        # BlendVertex index should be same as exportindex for normal Vertex:
+                        bv_index = len(cal3d_submesh.arrays)
+                        # Add Blend Vertex
+                        cal3d_blend_vertex = BlendVertex( bv_index,
+                            sk_coord, sk_normal, posdiff)
+                        # For now we always use the same texture coordinates for vertex and blend vertex
+                        # According to Boris the engineer using different values may not work anyway
+                        for uv in uvs:
+                            cal3d_blend_vertex.maps.append(Map(uv[0], uv[1]))
+                        # Add the blend vertex to the corresponding morph in submesh
+                        cal3d_submesh.morphs[sk_id].blend_vertices.append(cal3d_blend_vertex)
 
                 #if duplicate:
                     #print("duplicate vertex: "+str(coord))
@@ -578,36 +806,48 @@ def create_cal3d_mesh(scene, mesh_obj,
                 #   duplicate_index += 1
 
                 #else:
-                cal3d_vertex = Vertex(cal3d_submesh, vertex_index,
-                                      coord, normal, vertex_color)
-
-                cal3d_vertex.influences = get_vertex_influences(vertex,
-                                                                mesh_obj,
-                                                                cal3d_skeleton,
-                                                                use_groups, use_envelopes, armature_obj)
+                influences = get_vertex_influences(vertex_index, vertex_co, vertex_weights,
+                                                   mesh_obj,
+                                                   cal3d_skeleton,
+                                                   use_envelopes, armature_obj)
                 # jgb 2012-11-14 Add warning when vertex has no influences!
-                if cal3d_vertex.influences == []:
-                    LogMessage.log_warning("Vertex " + str(vertex.co) + " has no influences!")
-                
-                for uv in uvs:
-                    cal3d_vertex.maps.append(Map(uv[0], uv[1]))
-
-                cal3d_submesh.vertices.append(cal3d_vertex)
-
-            if not cal3d_vertex1:
-                cal3d_vertex1 = cal3d_vertex
-            elif not cal3d_vertex2:
-                cal3d_vertex2 = cal3d_vertex
-            elif not cal3d_vertex3:
-                cal3d_vertex3 = cal3d_vertex
-            elif not cal3d_vertex4:
-                cal3d_vertex4 = cal3d_vertex
-
-        cal3d_face = Face(cal3d_submesh, cal3d_vertex1,
-                          cal3d_vertex2, cal3d_vertex3,
-                          cal3d_vertex4)
-        cal3d_submesh.faces.append(cal3d_face)
-
+                if influences == []:
+                    LogMessage.log_warning("Vertex {0} has no influences!", vertex_co,
+                                           category="vertex_without_influences")
+                elif max_influences > 0 and len(influences) > max_influences:
+                    LogMessage.count("influences_pruned", len(influences) - max_influences)
+
+                cal3d_vertex = cal3d_submesh.arrays.add_vertex(vertex_index, coord, normal, vertex_color,
+                                                               uvs, influences)
+                cal3d_submesh.vertex_lookup[vertex_key] = cal3d_vertex
+
+            face_vertex_list.append(cal3d_vertex)
+
+        # Triangles have no fourth vertex
+        if len(face_vertex_list) < 4:
+            face_vertex_list.append(None)
+        cal3d_submesh.arrays.add_face(face_vertex_list[0], face_vertex_list[1],
+                                      face_vertex_list[2], face_vertex_list[3])
+
+    LogMessage.count("vertex_dedup_hits", dedup_hits)
+    LogMessage.count("vertex_dedup_misses", dedup_misses)
+    LogMessage.count("seam_vertices_duplicated", seam_duplicates)
+
+    # Reorder the triangles and vertices of each submesh for the GPU vertex cache
+    if optimize_vertex_cache:
+        for sm in cal3d_mesh.submeshes:
+            acmr_before, acmr_after = optimize_submesh_vertex_cache(sm)
+            LogMessage.log_message("    Submesh {0} vertex cache ACMR: {1:0.3f} before, {2:0.3f} after".format(
+                sm.index, acmr_before, acmr_after))
+
+    # Level of detail last, it keeps the order of the vertices and triangles it doesn't collapse
+    if lod_reduction > 0.0:
+        shared = shared_blender_vertices(cal3d_mesh)
+        for sm in cal3d_mesh.submeshes:
+            lod_steps, removed_faces = generate_submesh_lod(sm, shared, lod_reduction)
+            LogMessage.log_message("    Submesh {0} level of detail: {1} steps removing {2} of {3} triangles".format(
+                sm.index, lod_steps, removed_faces, sm.arrays.triangle_count()))
+            LogMessage.count("lod_steps", lod_steps)
 
     bpy.data.meshes.remove(mesh_data)
 
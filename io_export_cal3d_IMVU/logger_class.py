@@ -19,16 +19,47 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import json
+import time
+
+# time.perf_counter is new in Python 3.3, Blender 2.63 and 2.64 bundle Python 3.2
+try:
+    perf_counter = time.perf_counter
+except AttributeError:
+    perf_counter = time.time
+
+# Message levels, messages below the level of the logger are counted but not logged
+LEVEL_DEBUG = 10
+LEVEL_INFO = 20
+LEVEL_WARNING = 30
+LEVEL_ERROR = 40
+
+# Number of messages of a category that are logged, the rest is only counted
+MAX_EXAMPLES = 5
+
+# Size of the write buffer of the log file
+LOG_BUFFER_SIZE = 256 * 1024
+
 # A class to log messages
 # Input:
 #   name = name of logger
 #   type = console (default), or file
 #   file = filename
 # file_and_print = logging to file but also print message to console
+# level = lowest level of the messages that are logged (default all)
+#
+# The log_error, log_warning, log_info and log_debug messages can be format strings: the
+# arguments after the message are only formatted into it when the message is really logged.
+# Messages that may repeat many times (e.g. for every vertex) get a category: only the first
+# MAX_EXAMPLES of a category are logged and log_counters tells how many more there were.
+#   LogMessage.log_warning("Vertex {0} has no influences!", vertex_co, category="vertex_without_influences")
+#
+# Besides messages the logger collects timing spans and counters of the export,
+# write_report writes them to a json file for tools that monitor exports.
 
 class Logger:
 
-    def __init__(self, name, type='console', file='', file_and_print=False):
+    def __init__(self, name, type='console', file='', file_and_print=False, level=LEVEL_DEBUG):
         self.name = name
         if self.name == '':
             self.name = 'Logger'
@@ -37,15 +68,27 @@ class Logger:
             self.file = file
             if self.file == '':
                 self.file = self.name + '.log'
-            self.logfile = open(self.file, "wt")
+            self.logfile = open(self.file, "wt", buffering=LOG_BUFFER_SIZE)
             #print("\nLogging info to file: " + self.file)
         else:
             self.logfile = None
         self.file_and_print = file_and_print
+        self.level = level
+        # category -> [number of messages, logged messages]
+        self.categories = {}
         self.errors = 0
         self.warnings = 0
         self.debug = 0
         self.info = 0
+        self.start_time = perf_counter()
+        # list of (phase, name, start, seconds), start relative to start_time
+        self.spans = []
+        # counter name -> value
+        self.counters = {}
+        # ExportProfiler (see profiling.py) that profiles some of the spans, None when not profiling
+        self.profiler = None
+        # MemoryTracer (see memory_trace.py) that measures the memory of the spans, None when not tracing
+        self.memory_tracer = None
 
 
     def close_log(self):
@@ -67,21 +110,37 @@ class Logger:
             self.logfile.write(message + "\n")
             print(message)
 
-    def log_warning(self, warning):
+    # Log message with prefix when level is high enough and its category isn't exhausted yet,
+    # the message is only formatted when it gets logged
+    def log_with_level(self, level, prefix, message, args, category):
+        if level < self.level:
+            return
+        if category is not None:
+            entry = self.categories.setdefault(category, [0, []])
+            entry[0] += 1
+            if entry[0] > MAX_EXAMPLES:
+                return
+        if args:
+            message = message.format(*args)
+        if category is not None:
+            entry[1].append(message)
+        self.log_message(prefix + message)
+
+    def log_warning(self, warning, *args, category=None):
         self.warnings += 1
-        self.log_message("WARNING: " + warning)
+        self.log_with_level(LEVEL_WARNING, "WARNING: ", warning, args, category)
 
-    def log_error(self, error):
+    def log_error(self, error, *args, category=None):
         self.errors += 1
-        self.log_message("ERROR: " + error)
+        self.log_with_level(LEVEL_ERROR, "ERROR: ", error, args, category)
 
-    def log_info(self, info):
+    def log_info(self, info, *args, category=None):
         self.info += 1
-        self.log_message("INFO: " + info)
+        self.log_with_level(LEVEL_INFO, "INFO: ", info, args, category)
 
-    def log_debug(self, debug_msg):
+    def log_debug(self, debug_msg, *args, category=None):
         self.debug += 1
-        self.log_message("DEBUG: " + debug_msg)
+        self.log_with_level(LEVEL_DEBUG, "DEBUG: ", debug_msg, args, category)
 
     def log_error_count(self):
         self.log_message("Total amount of errors: {0}" .format(self.errors))
@@ -90,15 +149,96 @@ class Logger:
         self.log_message("Total amount of warnings: {0}" .format(self.warnings))
 
     def log_info_count(self):
-        self.log_message("Total amount of info messages: {0}" .format(self.errors))
+        self.log_message("Total amount of info messages: {0}" .format(self.info))
 
     def log_debug_count(self):
-        self.log_message("Total amount of debug messages: {0}" .format(self.errors))
+        self.log_message("Total amount of debug messages: {0}" .format(self.debug))
+
+    # Tell how many messages of each category were not logged
+    def log_category_counts(self):
+        for category in sorted(self.categories):
+            count, examples = self.categories[category]
+            if count > len(examples):
+                self.log_message("{0} messages of type '{1}', only the first {2} were logged".format(
+                    count, category, len(examples)))
 
     def log_counters(self):
+        self.log_category_counts()
         self.log_error_count()
         self.log_warning_count()
 
+    # Time a part of the export:
+    #   with LogMessage.span("mesh", mesh_obj.name):
+    #       ...
+    def span(self, phase, name=''):
+        return TimingSpan(self, phase, name)
+
+    # Add amount to a counter, for counts in a loop add the total afterwards instead of calling this every time
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    # Log the memory use of a span as measured by the MemoryTracer
+    def log_memory(self, record):
+        self.log_message("  Memory {0} '{1}': peak +{2:.2f} MB, retained {3:+.2f} MB".format(
+            record["phase"], record["name"], record["peak_mb"], record["retained_mb"]))
+        for site in record["top"]:
+            self.log_message("      {0:.2f} MB in {1} blocks: {2}".format(site["size_mb"], site["count"], site["site"]))
+
+    # Write the spans, counters and message counts to a json file
+    def write_report(self, filepath, extra=None):
+        phases = {}
+        for phase, name, start, seconds in self.spans:
+            totals = phases.setdefault(phase, {"count": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += seconds
+        report = {"total_seconds": perf_counter() - self.start_time,
+                  "errors": self.errors,
+                  "warnings": self.warnings,
+                  "phases": phases,
+                  "spans": [{"phase": phase, "name": name, "start": start, "seconds": seconds}
+                            for phase, name, start, seconds in self.spans],
+                  "counters": self.counters}
+        if self.memory_tracer:
+            report["memory"] = self.memory_tracer.records
+        if self.categories:
+            report["repeated_messages"] = dict((category, {"count": count, "examples": examples})
+                                               for category, (count, examples) in self.categories.items())
+        if extra:
+            report.update(extra)
+        with open(filepath, "wt") as report_file:
+            json.dump(report, report_file, indent=1, sort_keys=True)
+
+
+# Context manager returned by Logger.span, adds the span to the logger when the block ends,
+# also when it ends with an exception
+class TimingSpan:
+
+    def __init__(self, logger, phase, name):
+        self.logger = logger
+        self.phase = phase
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        # Memory snapshots first, so they are not part of the profile and timing
+        if self.logger.memory_tracer:
+            self.logger.memory_tracer.start_phase(self.phase, self.name)
+        if self.logger.profiler:
+            self.logger.profiler.start_phase(self.phase)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = perf_counter()
+        if self.logger.profiler:
+            self.logger.profiler.stop_phase(self.phase)
+        if self.logger.memory_tracer:
+            record = self.logger.memory_tracer.stop_phase(self.phase, self.name)
+            if record:
+                self.logger.log_memory(record)
+        self.logger.spans.append((self.phase, self.name, self.start - self.logger.start_time, end - self.start))
+        return False
+
 # ---------------------------------------------------------------------------------------------------------------------------------
 
 # Current logger class:
@@ -0,0 +1,109 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Memory accounting of the export with tracemalloc, switched on with the hidden trace_memory
+# property of the operator (or --trace-memory of batch_export.py).
+# For every Logger span it records how much memory the span needed at its peak and how much
+# it left behind, and the source lines that allocated most of the memory left behind.
+# Spans can be nested (shape_keys inside mesh), the numbers of the outer span include the inner one.
+# Tracing makes the export several times slower and needs extra memory itself.
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Number of allocation sites logged per span
+TOP_SITES = 5
+
+MEGABYTE = 1024.0 * 1024.0
+
+
+def memory_tracing_available():
+    return tracemalloc is not None
+
+
+class MemoryTracer:
+    def __init__(self, top_sites=TOP_SITES):
+        self.top_sites = top_sites
+        # Open spans: [phase, name, traced memory at start, snapshot at start, peak so far]
+        self.stack = []
+        # One dict per finished span, in order of finishing
+        self.records = []
+        # Without reset_peak (Python < 3.9) peaks are measured from the start of the trace
+        self.can_reset_peak = hasattr(tracemalloc, "reset_peak")
+
+
+    def start(self):
+        tracemalloc.start()
+
+
+    def stop(self):
+        self.stack = []
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+    def take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+    # The peak since the last reset counts for all open spans
+    def update_peaks(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for entry in self.stack:
+            entry[4] = max(entry[4], peak)
+
+
+    def start_phase(self, phase, name):
+        if not tracemalloc.is_tracing():
+            return
+        self.update_peaks()
+        snapshot = self.take_snapshot()
+        current = tracemalloc.get_traced_memory()[0]
+        if self.can_reset_peak:
+            tracemalloc.reset_peak()
+        self.stack.append([phase, name, current, snapshot, current])
+
+
+    # Returns the record of the finished span, None when not tracing
+    def stop_phase(self, phase, name):
+        if not self.stack:
+            return None
+        self.update_peaks()
+        entry_phase, entry_name, start_memory, start_snapshot, peak = self.stack.pop()
+        current = tracemalloc.get_traced_memory()[0]
+        top = []
+        for statistic in self.take_snapshot().compare_to(start_snapshot, "lineno")[:self.top_sites]:
+            if statistic.size_diff <= 0:
+                break
+            frame = statistic.traceback[0]
+            top.append({"site": "{0}:{1}".format(frame.filename, frame.lineno),
+                        "size_mb": statistic.size_diff / MEGABYTE,
+                        "count": statistic.count_diff})
+        record = {"phase": entry_phase, "name": entry_name,
+                  "start_mb": start_memory / MEGABYTE,
+                  "peak_mb": (peak - start_memory) / MEGABYTE,
+                  "retained_mb": (current - start_memory) / MEGABYTE,
+                  "top": top}
+        self.records.append(record)
+        return record
@@ -21,6 +21,28 @@
 
 from operator import attrgetter
 from array import array
+import io
+import struct
+import sys
+
+# Cal3d binary files are little-endian with 32 bit integers and floats
+BINARY_HEADER = struct.Struct("<4sI")
+BINARY_UINT = struct.Struct("<I")
+BINARY_MATERIAL = struct.Struct("<12BfI")
+BINARY_MAP = struct.Struct("<2f")
+BINARY_INFLUENCE = struct.Struct("<If")
+BINARY_VERTEX = struct.Struct("<6f2i")
+BINARY_FLOAT = struct.Struct("<f")
+BINARY_SPRING = struct.Struct("<2I2f")
+BINARY_TRIANGLE = struct.Struct("<3I")
+BINARY_QUAD = struct.Struct("<6I")
+BINARY_SUBMESH = struct.Struct("<6i")
+
+
+# Pack a string as length (including the terminating null) followed by the utf8 encoded bytes
+def pack_binary_string(string):
+    data = string.encode("utf8") + b'\0' # all strings end in null
+    return BINARY_UINT.pack(len(data)) + data
 
 class MaterialColor:
     def __init__(self, r, g, b, a):
@@ -76,84 +98,151 @@ class Material:
 
         
     def to_cal3d_binary(self, file):
-        s = b'CRF\0'
-        ar = array('b', list(s))
-        ar.tofile(file)
-
         # Etory : downgrade version to 700 for Cal3D 0.11 compatibility
-        ar = array('I', [700])
-        ar.tofile(file)
-        
-        ar = array('B', [self.ambient.r, 
-                         self.ambient.g, 
-                         self.ambient.b, 
-                         self.ambient.a,
-                         self.diffuse.r, 
-                         self.diffuse.g, 
-                         self.diffuse.b, 
-                         self.diffuse.a,
-                         self.specular.r, 
-                         self.specular.g, 
-                         self.specular.b, 
-                         self.specular.a])
-        ar.tofile(file)
-        
-        ar = array('f', [self.shininess])
-        ar.tofile(file)
-        
-        ar = array('I', [len(self.maps_filenames)])
-        ar.tofile(file)
-        
+        data = [BINARY_HEADER.pack(b'CRF\0', 700),
+                BINARY_MATERIAL.pack(self.ambient.r, 
+                                     self.ambient.g, 
+                                     self.ambient.b, 
+                                     self.ambient.a,
+                                     self.diffuse.r, 
+                                     self.diffuse.g, 
+                                     self.diffuse.b, 
+                                     self.diffuse.a,
+                                     self.specular.r, 
+                                     self.specular.g, 
+                                     self.specular.b, 
+                                     self.specular.a,
+                                     self.shininess,
+                                     len(self.maps_filenames))]
         for map_filename in self.maps_filenames:
-            map_filename += '\0' # all strings end in null
-            ar = array('I', [len(map_filename)])
-            ar.tofile(file)
-            
-            ar = array('b', list(map_filename.encode("utf8")))
-            ar.tofile(file)
+            data.append(pack_binary_string(map_filename))
+        file.write(b"".join(data))
+
+# XML formatting helpers shared by the classes below and the parallel mesh writer (mesh_parallel),
+# so both produce exactly the same text.
+def map_xml(u, v):
+    return "      <TEXCOORD>{0:0.6f} {1:0.6f}</TEXCOORD>\n".format(u, v)
+
+
+def influence_xml(bone_index, weight):
+    # Reduce filesize by testing for common situations (weight = 1.0) use int instead of float:
+    if weight == 1.0:
+        return "      <INFLUENCE ID=\"{0}\">1</INFLUENCE>\n".format(bone_index)
+    else:
+        return "      <INFLUENCE ID=\"{0}\">{1:0.6f}</INFLUENCE>\n".format(bone_index, 
+                                                                  weight)
+
+
+# maps is a list of (u, v), influences a list of (bone index, weight) and weight is None
+# when the vertex has no physique weight. collapse is the (collapse id, face collapse count)
+# of a vertex that is removed by a level of detail step, None otherwise.
+def vertex_xml(exportindex, loc, normal, vertex_color, maps, influences, weight, collapse=None):
+    # 2012-12-16 Since IMVU MAX exporter has NUMINFLUENCES first and then ID we change it to that order too
+    s = "    <VERTEX NUMINFLUENCES=\"{0}\" ID=\"{1}\">\n".format(
+        len(influences), exportindex )
+    s += "      <POS>{0:0.6f} {1:0.6f} {2:0.6f}</POS>\n".format(loc[0],
+                                                 loc[1], 
+                                                 loc[2])
+
+    s += "      <NORM>{0:0.6f} {1:0.6f} {2:0.6f}</NORM>\n".format(normal[0],
+                                                   normal[1],
+                                                   normal[2])
+
+    # Reduce filesize by testing for common situations (all 1.0 means no vertex colors set) use int instead of float:
+    if vertex_color[0] == 1.0 and vertex_color[1] == 1.0 and vertex_color[2] == 1.0:
+        s += "      <COLOR>1 1 1</COLOR>\n"
+    elif vertex_color[0] == 0.0 and vertex_color[1] == 0.0 and vertex_color[2] == 0.0:
+        s += "      <COLOR>0 0 0</COLOR>\n"
+    else:
+        s += "      <COLOR>{0:0.3f} {1:0.3f} {2:0.3f}</COLOR>\n".format(vertex_color[0],
+                                                   vertex_color[1],
+                                                   vertex_color[2])
+
+    # Same place as the Cal3d saver writes them: after the color, before the texture coordinates
+    if collapse is not None:
+        s += "      <COLLAPSEID>{0}</COLLAPSEID>\n".format(collapse[0])
+        s += "      <COLLAPSECOUNT>{0}</COLLAPSECOUNT>\n".format(collapse[1])
+
+    s += "".join([map_xml(u, v) for u, v in maps])
+    s += "".join([influence_xml(bone_index, influence_weight) for bone_index, influence_weight in influences])
+    if weight is not None:
+        s += "      <PHYSIQUE>{0:0.6f}</PHYSIQUE>\n".format(weight)
+    s += "    </VERTEX>\n"
+        
+    return s
 
-            
 
+
+# Maximum number of influences per vertex IMVU skins with
+MAX_INFLUENCES = 4
+
+
+# Sort influences, a list of (bone index, weight), by weight in descending order, keep only the
+# max_influences heaviest ones (0 = keep all) and normalize their weights.
+# Same result as Vertex.normalize_influences.
+def normalize_influences(influences, max_influences=0):
+    influences = sorted(influences, key=lambda influence: influence[1], reverse=True)
+    if max_influences > 0:
+        influences = influences[:max_influences]
+    total_weight = 0.0
+    for bone_index, weight in influences:
+        total_weight += weight
+    if total_weight != 1.0:
+        influences = [(bone_index, weight / total_weight) for bone_index, weight in influences]
+    return influences
+
+
+# Vertex color of vertices without vertex colors, shared by all of them
+DEFAULT_VERTEX_COLOR = (1.0, 1.0, 1.0)
+
+# The element classes below (Map, Influence, Vertex, Face, BlendVertex) exist once per vertex,
+# uv or face, so they use __slots__ to leave out the per instance dict
 class Map:
+    __slots__ = ("u", "v")
+
     def __init__(self, u, v):
         self.u = u
         self.v = v
     
     
     def to_cal3d_xml(self):
-        return "      <TEXCOORD>{0:0.6f} {1:0.6f}</TEXCOORD>\n".format(self.u, self.v)
+        return map_xml(self.u, self.v)
 
         
+    def to_cal3d_binary_data(self):
+        return BINARY_MAP.pack(self.u, self.v)
+
+
     def to_cal3d_binary(self, file):
-        ar = array('f', [self.u, self.v])
-        ar.tofile(file)
+        file.write(self.to_cal3d_binary_data())
 
 
 
 class Influence:
+    __slots__ = ("bone_index", "weight")
+
     def __init__(self, bone_index, weight):
         self.bone_index = bone_index
         self.weight = weight
     
     
     def to_cal3d_xml(self):
-        # Reduce filesize by testing for common situations (weight = 1.0) use int instead of float:
-        if self.weight == 1.0:
-            return "      <INFLUENCE ID=\"{0}\">1</INFLUENCE>\n".format(self.bone_index)
-        else:
-            return "      <INFLUENCE ID=\"{0}\">{1:0.6f}</INFLUENCE>\n".format(self.bone_index, 
-                                                                      self.weight)
+        return influence_xml(self.bone_index, self.weight)
 
         
+    def to_cal3d_binary_data(self):
+        return BINARY_INFLUENCE.pack(self.bone_index, self.weight)
+
+
     def to_cal3d_binary(self, file):
-        ar = array('L', [self.bone_index])
-        ar.tofile(file)
-        ar = array('f', [self.weight])
-        ar.tofile(file)
+        file.write(self.to_cal3d_binary_data())
 
 
 
 class Vertex:
+    __slots__ = ("submesh", "index", "exportindex", "vertex_color", "loc", "normal",
+                 "maps", "influences", "weight", "hasweight")
+
     # jgb 2012-11-07 Add vertex color to mesh
     def __init__(self, submesh, index, loc, normal, vertex_color):
         self.submesh = submesh
@@ -161,19 +250,27 @@ class Vertex:
         # jgb 2012-11-06 vertex indexes should be exported  starting from 0 for every submesh apparently to work in imvu
         self.exportindex = len(submesh.vertices)
         # jgb 2012-11-07 Store vertex color of this vertex
-        self.vertex_color = vertex_color.copy() # IMPORTANT needs copy or color will be 1,1,1
+        # Store plain tuples, not the (mutable) vectors of the caller
+        self.vertex_color = tuple(vertex_color)
+        if self.vertex_color == DEFAULT_VERTEX_COLOR:
+            self.vertex_color = DEFAULT_VERTEX_COLOR
 
-        self.loc = loc.copy()
-        self.normal = normal.copy()
+        self.loc = tuple(loc)
+        self.normal = tuple(normal)
         self.maps = []
         self.influences = []
         self.weight = 0.0
         self.hasweight = False
 
 
-    def to_cal3d_xml(self):
+    # Sort influences by weight in descending order, keep only the max_influences heaviest ones
+    # (0 = keep all) and normalize their weights. Call this once after adding the influences,
+    # the serializers write them as they are.
+    def normalize_influences(self, max_influences=0):
         # sort influences by weights, in descending order
         self.influences = sorted(self.influences, key=attrgetter('weight'), reverse=True)
+        if max_influences > 0:
+            del self.influences[max_influences:]
 
         # normalize weights
         total_weight = 0.0
@@ -183,74 +280,43 @@ class Vertex:
         if total_weight != 1.0:
             for influence in self.influences:
                 influence.weight /= total_weight
-        
-        # 2012-12-16 Since IMVU MAX exporter has NUMINFLUENCES first and then ID we change it to that order too
-        s = "    <VERTEX NUMINFLUENCES=\"{0}\" ID=\"{1}\">\n".format(
-            len(self.influences), self.exportindex )
-        s += "      <POS>{0:0.6f} {1:0.6f} {2:0.6f}</POS>\n".format(self.loc[0],
-                                                     self.loc[1], 
-                                                     self.loc[2])
 
-        s += "      <NORM>{0:0.6f} {1:0.6f} {2:0.6f}</NORM>\n".format(self.normal[0],
-                                                       self.normal[1],
-                                                       self.normal[2])
 
-        # Reduce filesize by testing for common situations (all 1.0 means no vertex colors set) use int instead of float:
-        if self.vertex_color[0] == 1.0 and self.vertex_color[1] == 1.0 and self.vertex_color[2] == 1.0:
-            s += "      <COLOR>1 1 1</COLOR>\n"
-        elif self.vertex_color[0] == 0.0 and self.vertex_color[1] == 0.0 and self.vertex_color[2] == 0.0:
-            s += "      <COLOR>0 0 0</COLOR>\n"
-        else:
-            s += "      <COLOR>{0:0.3f} {1:0.3f} {2:0.3f}</COLOR>\n".format(self.vertex_color[0],
-                                                       self.vertex_color[1],
-                                                       self.vertex_color[2])
-
-        s += "".join(map(Map.to_cal3d_xml, self.maps))
-        s += "".join(map(Influence.to_cal3d_xml, self.influences))
+    def to_cal3d_xml(self):
         if self.hasweight:
-            s += "      <PHYSIQUE>{0:0.6f}</PHYSIQUE>\n".format(self.weight)
-        s += "    </VERTEX>\n"
-            
-        return s
+            weight = self.weight
+        else:
+            weight = None
+        return vertex_xml(self.exportindex, self.loc, self.normal, self.vertex_color,
+            [(mp.u, mp.v) for mp in self.maps],
+            [(ic.bone_index, ic.weight) for ic in self.influences],
+            weight)
 
         
-    def to_cal3d_binary(self, file):
-        # sort influences by weights, in descending order
-        self.influences = sorted(self.influences, key=attrgetter('weight'), reverse=True)
-
-        # normalize weights
-        total_weight = 0.0
-        for influence in self.influences:
-            total_weight += influence.weight
-
-        if total_weight != 1.0:
-            for influence in self.influences:
-                influence.weight /= total_weight
-        
-        ar = array('f', [self.loc[0],
-                         self.loc[1], 
-                         self.loc[2],
-                         self.normal[0],
-                         self.normal[1],
-                         self.normal[2]])
-        ar.tofile(file)
-        
-        ar = array('I', [0, #collapse id
-                         0]) #face collapse count
-        ar.tofile(file)
-        
+    def to_cal3d_binary_data(self):
+        data = [BINARY_VERTEX.pack(self.loc[0],
+                                   self.loc[1], 
+                                   self.loc[2],
+                                   self.normal[0],
+                                   self.normal[1],
+                                   self.normal[2],
+                                   0, #collapse id
+                                   0)] #face collapse count
         for mp in self.maps:
-            mp.to_cal3d_binary(file)
+            data.append(mp.to_cal3d_binary_data())
             
-        ar = array('I', [len(self.influences)])
-        ar.tofile(file)
-        
+        data.append(BINARY_UINT.pack(len(self.influences)))
         for ic in self.influences:
-            ic.to_cal3d_binary(file)
+            data.append(ic.to_cal3d_binary_data())
             
         if self.hasweight:
-            ar = array('f', [self.weight])
-            ar.tofile(file) # writes the weight as a float for cloth hair animation (0.0 == rigid)
+            # writes the weight as a float for cloth hair animation (0.0 == rigid)
+            data.append(BINARY_FLOAT.pack(self.weight))
+        return b"".join(data)
+
+
+    def to_cal3d_binary(self, file):
+        file.write(self.to_cal3d_binary_data())
 
 
 
@@ -267,19 +333,24 @@ class Spring:
                                                                                       self.vertex2.index,
                                                                                       self.spring_coef,
                                                                                       self.idle_length)
+        return s
 
         
+    def to_cal3d_binary_data(self):
+        return BINARY_SPRING.pack(self.vertex1.index,
+                                  self.vertex2.index,
+                                  self.spring_coef,
+                                  self.idle_length)
+
+
     def to_cal3d_binary(self, file):
-        ar = array('I', [self.vertex1.index,
-                         self.vertex2.index])
-        ar.tofile(file)
-        ar = array('f', [self.spring_coef,
-                         self.idle_length])
-        ar.tofile(file)
+        file.write(self.to_cal3d_binary_data())
 
 
 
 class Face:
+    __slots__ = ("vertex1", "vertex2", "vertex3", "vertex4", "can_collapse", "submesh")
+
     def __init__(self, submesh, vertex1, vertex2, vertex3, vertex4):
         self.vertex1 = vertex1
         self.vertex2 = vertex2
@@ -307,29 +378,33 @@ class Face:
                                                                    self.vertex3.exportindex)
 
         
-    def to_cal3d_binary(self, file):
+    def to_cal3d_binary_data(self):
         if self.vertex4:
-            ar = array('I', [self.vertex1.exportindex,
-                             self.vertex2.exportindex,
-                             self.vertex3.exportindex,
-                             self.vertex1.exportindex,
-                             self.vertex3.exportindex,
-                             self.vertex4.exportindex])
+            return BINARY_QUAD.pack(self.vertex1.exportindex,
+                                    self.vertex2.exportindex,
+                                    self.vertex3.exportindex,
+                                    self.vertex1.exportindex,
+                                    self.vertex3.exportindex,
+                                    self.vertex4.exportindex)
         else:
-            ar = array('I', [self.vertex1.exportindex,
-                             self.vertex2.exportindex,
-                             self.vertex3.exportindex])
-        
-        ar.tofile(file)
+            return BINARY_TRIANGLE.pack(self.vertex1.exportindex,
+                                        self.vertex2.exportindex,
+                                        self.vertex3.exportindex)
+
+
+    def to_cal3d_binary(self, file):
+        file.write(self.to_cal3d_binary_data())
 
 
 class BlendVertex:
+    __slots__ = ("index", "loc", "normal", "maps", "posdiff")
+
     # jgb 2012-11-07 Add vertex color to mesh
     def __init__(self, index, loc, normal, posdiff):
         # Index should be the same as the exported vertex index!
         self.index = index
-        self.loc = loc.copy()
-        self.normal = normal.copy()
+        self.loc = tuple(loc)
+        self.normal = tuple(normal)
         self.maps = []
         # posdiff:  position difference value, see Cal3d sourcecode saver.cpp
         self.posdiff = posdiff
@@ -359,15 +434,272 @@ class Morph:
         self.morph_id = morph_id
 
     def to_cal3d_xml(self):
+        s = io.StringIO()
+        self.write_cal3d_xml(s)
+        return s.getvalue()
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    def write_cal3d_xml(self, file):
         #  Morph has 2  xml formats: 1 without blendvertex data ends with />, the other 2 has a separate end morph tag
-        s = "    <MORPH NAME=\"{0}\" NUMBLENDVERTS=\"{1}\" MORPHID=\"{2}\"".format(self.name, len(self.blend_vertices), self.morph_id)
+        file.write("    <MORPH NAME=\"{0}\" NUMBLENDVERTS=\"{1}\" MORPHID=\"{2}\"".format(self.name, len(self.blend_vertices), self.morph_id))
         if len(self.blend_vertices) > 0:
-            s += ">\n"
-            s += "".join(map(BlendVertex.to_cal3d_xml, self.blend_vertices))
-            s += "    </MORPH>\n"
+            file.write(">\n")
+            for blend_vertex in self.blend_vertices:
+                file.write(blend_vertex.to_cal3d_xml())
+            file.write("    </MORPH>\n")
         else:
-            s += " />\n"
-        return s
+            file.write(" />\n")
+
+
+# Vertices and faces of a submesh stored as parallel typed arrays (struct of arrays) instead of
+# Vertex and Face objects: less memory, and the arrays can be handed to worker processes in
+# shared memory as they are (see mesh_parallel). Vertex i is the vertex with exportindex i.
+#   blender_indices     blender vertex index of each vertex
+#   positions, normals  3 doubles per vertex
+#   colors              3 doubles per vertex, the vertex color
+#   uvs                 2 doubles (u, v) for each of the map_count uv layers per vertex
+#   influence_offsets   the influences of vertex i are influence_offsets[i] up to influence_offsets[i + 1]
+#                       in influence_bones and influence_weights, sorted by weight, capped at
+#                       max_influences (0 = no cap) and normalized when the vertex is added
+#   physique            physique weight per vertex, only written when has_physique is 1
+#   triangles           3 vertex indices per triangle, quads are split when they are added
+#   collapse_ids        level of detail (see mesh_lod): vertex each vertex collapses to, -1 if it
+#   face_collapse_counts  is never collapsed, and the number of triangles that collapse removes.
+#                       Both are None when the submesh has no level of detail.
+class SubMeshArrays:
+    # Names of all arrays, in a fixed order
+    ARRAY_NAMES = ("blender_indices", "positions", "normals", "colors", "uvs",
+                   "influence_offsets", "influence_bones", "influence_weights",
+                   "physique", "has_physique", "triangles")
+
+    def __init__(self, map_count, max_influences=0):
+        self.map_count = map_count
+        self.max_influences = max_influences
+        self.blender_indices = array('i')
+        self.positions = array('d')
+        self.normals = array('d')
+        self.colors = array('d')
+        self.uvs = array('d')
+        self.influence_offsets = array('i', [0])
+        self.influence_bones = array('i')
+        self.influence_weights = array('d')
+        self.physique = array('d')
+        self.has_physique = array('b')
+        self.triangles = array('i')
+        self.collapse_ids = None
+        self.face_collapse_counts = None
+
+
+    def __len__(self):
+        return len(self.blender_indices)
+
+
+    def triangle_count(self):
+        return len(self.triangles) // 3
+
+
+    # Add a vertex and return its index (the exportindex).
+    # uvs is a list of map_count (u, v), influences a list of (bone index, weight) that is
+    # sorted, capped and normalized here, physique the physique weight or None.
+    def add_vertex(self, blender_index, loc, normal, vertex_color, uvs, influences, physique=None):
+        index = len(self.blender_indices)
+        self.blender_indices.append(blender_index)
+        self.positions.extend(loc)
+        self.normals.extend(normal)
+        self.colors.extend(vertex_color)
+        for u, v in uvs:
+            self.uvs.append(u)
+            self.uvs.append(v)
+        for bone_index, weight in normalize_influences(influences, self.max_influences):
+            self.influence_bones.append(bone_index)
+            self.influence_weights.append(weight)
+        self.influence_offsets.append(len(self.influence_bones))
+        if physique is None:
+            self.physique.append(0.0)
+            self.has_physique.append(0)
+        else:
+            self.physique.append(physique)
+            self.has_physique.append(1)
+        return index
+
+
+    # Add a triangle or, when vertex4 is not None, a quad split the same way as Face does
+    def add_face(self, vertex1, vertex2, vertex3, vertex4=None):
+        self.triangles.extend((vertex1, vertex2, vertex3))
+        if vertex4 is not None:
+            self.triangles.extend((vertex1, vertex3, vertex4))
+
+
+    # Renumber the vertices: order is a list of all old vertex indices in their new order.
+    # The triangles are updated, returns an array that maps old vertex indices to new ones.
+    # Reorder before generating the level of detail, the collapse ids are not renumbered.
+    def reorder_vertices(self, order):
+        remap = array('i', [0]) * len(order)
+        for new_index, old_index in enumerate(order):
+            remap[old_index] = new_index
+
+        def gather(values, size):
+            result = array(values.typecode)
+            for old_index in order:
+                result.extend(values[size*old_index:size*old_index + size])
+            return result
+
+        self.blender_indices = gather(self.blender_indices, 1)
+        self.positions = gather(self.positions, 3)
+        self.normals = gather(self.normals, 3)
+        self.colors = gather(self.colors, 3)
+        self.uvs = gather(self.uvs, 2 * self.map_count)
+        self.physique = gather(self.physique, 1)
+        self.has_physique = gather(self.has_physique, 1)
+
+        offsets = self.influence_offsets
+        influence_offsets = array('i', [0])
+        influence_bones = array('i')
+        influence_weights = array('d')
+        for old_index in order:
+            start = offsets[old_index]
+            stop = offsets[old_index + 1]
+            influence_bones.extend(self.influence_bones[start:stop])
+            influence_weights.extend(self.influence_weights[start:stop])
+            influence_offsets.append(len(influence_bones))
+        self.influence_offsets = influence_offsets
+        self.influence_bones = influence_bones
+        self.influence_weights = influence_weights
+
+        self.triangles = array('i', [remap[vertex] for vertex in self.triangles])
+        return remap
+
+
+    # (bone index, weight) of the influences of vertex i
+    def vertex_influences(self, i):
+        start = self.influence_offsets[i]
+        stop = self.influence_offsets[i + 1]
+        return list(zip(self.influence_bones[start:stop], self.influence_weights[start:stop]))
+
+
+    def vertex_uvs(self, i):
+        start = 2 * self.map_count * i
+        return [(self.uvs[start + 2*m], self.uvs[start + 2*m + 1]) for m in range(self.map_count)]
+
+
+# Xml of the vertices start to stop (not included) of arrays. arrays can also be an object with
+# memoryviews of the same arrays, see mesh_parallel.
+def format_vertices_xml(arrays, start, stop):
+    positions = arrays.positions
+    normals = arrays.normals
+    colors = arrays.colors
+    uvs = arrays.uvs
+    map_count = arrays.map_count
+    offsets = arrays.influence_offsets
+    bones = arrays.influence_bones
+    weights = arrays.influence_weights
+    collapse_ids = arrays.collapse_ids
+    collapse = None
+    s = []
+    for i in range(start, stop):
+        uv_start = 2 * map_count * i
+        maps = [(uvs[uv_start + 2*m], uvs[uv_start + 2*m + 1]) for m in range(map_count)]
+        influences = [(bones[ic], weights[ic]) for ic in range(offsets[i], offsets[i + 1])]
+        if arrays.has_physique[i]:
+            physique = arrays.physique[i]
+        else:
+            physique = None
+        if collapse_ids is not None and collapse_ids[i] >= 0:
+            collapse = (collapse_ids[i], arrays.face_collapse_counts[i])
+        else:
+            collapse = None
+        s.append(vertex_xml(i,
+                            (positions[3*i], positions[3*i + 1], positions[3*i + 2]),
+                            (normals[3*i], normals[3*i + 1], normals[3*i + 2]),
+                            (colors[3*i], colors[3*i + 1], colors[3*i + 2]),
+                            maps, influences, physique, collapse))
+    return "".join(s)
+
+
+# Number of vertices formatted at once when writing xml
+XML_VERTEX_CHUNK = 4096
+
+
+def write_vertices_xml(arrays, file):
+    for start in range(0, len(arrays), XML_VERTEX_CHUNK):
+        file.write(format_vertices_xml(arrays, start, min(start + XML_VERTEX_CHUNK, len(arrays))))
+
+
+def write_triangles_xml(arrays, file):
+    triangles = arrays.triangles
+    face_xml = "    <FACE VERTEXID=\"{0} {1} {2}\"/>\n"
+    for start in range(0, len(triangles), 3 * XML_VERTEX_CHUNK):
+        file.write("".join([face_xml.format(triangles[t], triangles[t + 1], triangles[t + 2])
+                            for t in range(start, min(start + 3 * XML_VERTEX_CHUNK, len(triangles)), 3)]))
+
+
+def vertices_binary_data(arrays):
+    positions = arrays.positions
+    normals = arrays.normals
+    uvs = arrays.uvs
+    map_count = arrays.map_count
+    offsets = arrays.influence_offsets
+    collapse_ids = arrays.collapse_ids
+    face_collapse_counts = arrays.face_collapse_counts
+    collapse_id = 0
+    face_collapse_count = 0
+    data = []
+    for i in range(len(arrays)):
+        if collapse_ids is not None:
+            collapse_id = collapse_ids[i]
+            face_collapse_count = face_collapse_counts[i]
+        data.append(BINARY_VERTEX.pack(positions[3*i], positions[3*i + 1], positions[3*i + 2],
+                                       normals[3*i], normals[3*i + 1], normals[3*i + 2],
+                                       collapse_id,
+                                       face_collapse_count))
+        uv_start = 2 * map_count * i
+        for m in range(map_count):
+            data.append(BINARY_MAP.pack(uvs[uv_start + 2*m], uvs[uv_start + 2*m + 1]))
+        data.append(BINARY_UINT.pack(offsets[i + 1] - offsets[i]))
+        for ic in range(offsets[i], offsets[i + 1]):
+            data.append(BINARY_INFLUENCE.pack(arrays.influence_bones[ic], arrays.influence_weights[ic]))
+        if arrays.has_physique[i]:
+            # writes the weight as a float for cloth hair animation (0.0 == rigid)
+            data.append(BINARY_FLOAT.pack(arrays.physique[i]))
+    return b"".join(data)
+
+
+# The triangle index buffer is written as it is, only the byte order may need a swap
+def triangles_binary_data(arrays):
+    triangles = array('I', arrays.triangles)
+    if sys.byteorder != "little":
+        triangles.byteswap()
+    return triangles.tobytes()
+
+
+# Pack Vertex and Face objects into a SubMeshArrays. Vertices are taken in exportindex order
+# and their influences are sorted, capped and normalized like Vertex.normalize_influences does.
+def pack_submesh(vertices, faces, max_influences=0):
+    vertices = sorted(vertices, key=attrgetter('exportindex'))
+    map_count = 0
+    if vertices:
+        map_count = len(vertices[0].maps)
+    arrays = SubMeshArrays(map_count, max_influences)
+    # Vertices are numbered by position in the arrays, normally that is their exportindex
+    vertex_numbers = {}
+    for vertex in vertices:
+        if vertex.hasweight:
+            physique = vertex.weight
+        else:
+            physique = None
+        vertex_numbers[id(vertex)] = arrays.add_vertex(vertex.index, vertex.loc, vertex.normal, vertex.vertex_color,
+            [(mp.u, mp.v) for mp in vertex.maps],
+            [(ic.bone_index, ic.weight) for ic in vertex.influences],
+            physique)
+    for face in faces:
+        if face.vertex4:
+            arrays.add_face(vertex_numbers[id(face.vertex1)], vertex_numbers[id(face.vertex2)],
+                            vertex_numbers[id(face.vertex3)], vertex_numbers[id(face.vertex4)])
+        else:
+            arrays.add_face(vertex_numbers[id(face.vertex1)], vertex_numbers[id(face.vertex2)],
+                            vertex_numbers[id(face.vertex3)])
+    return arrays
 
 
 class SubMesh:
@@ -380,78 +712,93 @@ class SubMesh:
         self.material_id = material_id
         self.mesh_material_id = mesh_material_id
 
+        # A submesh holds its vertices and faces either as Vertex and Face objects (vertices, faces)
+        # or in arrays (a SubMeshArrays, as built by create_cal3d_mesh). The serializers always work
+        # on arrays, the objects are packed into arrays when written.
         self.vertices = []
         self.faces = []
+        self.arrays = None
+        # Dedup index: (blender vertex index, uv tuple) -> vertex index, used while building the submesh
+        self.vertex_lookup = {}
         self.nb_lodsteps = 0
         self.springs = []
         #jgb  morphs present in this submesh
         self.morphs = []
 
 
-    def to_cal3d_xml(self):
-        self.vertices = sorted(self.vertices, key=attrgetter('exportindex'))
-        texcoords_num = 0
-        if self.vertices and len(self.vertices) > 0:
-            texcoords_num = len(self.vertices[0].maps)
-
-        faces_num = 0
-        for face in self.faces:
-            if face.vertex4:
-                faces_num += 2
-            else:
-                faces_num += 1
+    def to_cal3d_xml(self, format_vertices=None):
+        s = io.StringIO()
+        self.write_cal3d_xml(s, format_vertices)
+        return s.getvalue()
+
+
+    # Renumber the blend vertices of the morphs after the vertices in the arrays were reordered,
+    # remap maps old vertex indices to new ones (see SubMeshArrays.reorder_vertices)
+    def remap_vertices(self, remap):
+        for morph in self.morphs:
+            for blend_vertex in morph.blend_vertices:
+                blend_vertex.index = remap[blend_vertex.index]
+            morph.blend_vertices.sort(key=attrgetter('index'))
+        # The build time lookup still has the old vertex numbers
+        self.vertex_lookup = {}
+
+
+    # The arrays of this submesh, packed from the Vertex and Face objects when it has no arrays
+    def get_arrays(self):
+        if self.arrays is not None:
+            return self.arrays
+        return pack_submesh(self.vertices, self.faces)
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    # format_vertices: optional function that writes the xml of the vertices in a SubMeshArrays
+    # to file, used to format the vertices in parallel (see mesh_parallel)
+    def write_cal3d_xml(self, file, format_vertices=None):
+        arrays = self.get_arrays()
+        texcoords_num = arrays.map_count
 
         # 2012-12-16 Change order to that of the MAX exporter: MATERIAL last
-        s = "  <SUBMESH NUMVERTICES=\"{0}\" NUMFACES=\"{1}\" ".format(
-            len(self.vertices), faces_num )
+        file.write("  <SUBMESH NUMVERTICES=\"{0}\" NUMFACES=\"{1}\" ".format(
+            len(arrays), arrays.triangle_count() ))
 
-        s += "NUMLODSTEPS=\"{0}\" NUMSPRINGS=\"{1}\" NUMMORPHS=\"{2}\" NUMTEXCOORDS=\"{3}\" ".format(self.nb_lodsteps,
+        file.write("NUMLODSTEPS=\"{0}\" NUMSPRINGS=\"{1}\" NUMMORPHS=\"{2}\" NUMTEXCOORDS=\"{3}\" ".format(self.nb_lodsteps,
             len(self.springs),
             len(self.morphs),
-            texcoords_num)
+            texcoords_num))
         # MATERIAL last:
-        s += "MATERIAL=\"{0}\">\n".format(self.material_id)
+        file.write("MATERIAL=\"{0}\">\n".format(self.material_id))
 
-        s += "".join(map(Vertex.to_cal3d_xml, self.vertices))
+        if format_vertices:
+            format_vertices(arrays, file)
+        else:
+            write_vertices_xml(arrays, file)
         if self.springs and len(self.springs) > 0:
-            s += "".join(map(Spring.to_cal3d_xml, self.springs))
+            for spring in self.springs:
+                file.write(spring.to_cal3d_xml())
         if self.morphs and len(self.morphs) > 0:
-            s += "".join(map(Morph.to_cal3d_xml, self.morphs))
-        s += "".join(map(Face.to_cal3d_xml, self.faces))
-        s += "  </SUBMESH>\n"
-        return s
+            for morph in self.morphs:
+                morph.write_cal3d_xml(file)
+        write_triangles_xml(arrays, file)
+        file.write("  </SUBMESH>\n")
 
         
     def to_cal3d_binary(self, file):
-        self.vertices = sorted(self.vertices, key=attrgetter('exportindex'))
-        texcoords_num = 0
-        if self.vertices and len(self.vertices) > 0:
-            texcoords_num = len(self.vertices[0].maps)
-
-        faces_num = 0
-        for face in self.faces:
-            if face.vertex4:
-                faces_num += 2
-            else:
-                faces_num += 1
-
-        ar = array('i', [self.material_id,
-                         len(self.vertices),
-                         faces_num,
-                         self.nb_lodsteps,
-                         len(self.springs),
-                         texcoords_num])
-        ar.tofile(file)
+        arrays = self.get_arrays()
+
+        # Write each section (header, vertices, springs, faces) with a single write
+        file.write(BINARY_SUBMESH.pack(self.material_id,
+                                       len(arrays),
+                                       arrays.triangle_count(),
+                                       self.nb_lodsteps,
+                                       len(self.springs),
+                                       arrays.map_count))
         
-        for vt in self.vertices:
-            vt.to_cal3d_binary(file)
+        file.write(vertices_binary_data(arrays))
         
         if self.springs and len(self.springs) > 0:
-            for sp in self.springs:
-                sp.to_cal3d_binary(file)
+            file.write(b"".join([sp.to_cal3d_binary_data() for sp in self.springs]))
         
-        for fc in self.faces:
-            fc.to_cal3d_binary(file)
+        file.write(triangles_binary_data(arrays))
 
 
 class Mesh:
@@ -459,37 +806,41 @@ class Mesh:
         self.name = name
         self.xml_version = xml_version
         self.submeshes = [] 
+        # mesh_material_id -> SubMesh
+        self.submesh_by_material = {}
 
 
-    def to_cal3d_xml(self):
-        s = "<HEADER MAGIC=\"XMF\" VERSION=\"{0}\"/>\n".format(self.xml_version)
-        s += "<MESH NUMSUBMESH=\"{0}\">\n".format(len(self.submeshes))
-        s += "".join(map(SubMesh.to_cal3d_xml, self.submeshes))
-        s += "</MESH>\n"
-        return s
+    def to_cal3d_xml(self, format_vertices=None):
+        s = io.StringIO()
+        self.write_cal3d_xml(s, format_vertices)
+        return s.getvalue()
+
+
+    # Write the xml to file one element at a time instead of building one big string
+    def write_cal3d_xml(self, file, format_vertices=None):
+        file.write("<HEADER MAGIC=\"XMF\" VERSION=\"{0}\"/>\n".format(self.xml_version))
+        file.write("<MESH NUMSUBMESH=\"{0}\">\n".format(len(self.submeshes)))
+        for sm in self.submeshes:
+            sm.write_cal3d_xml(file, format_vertices)
+        file.write("</MESH>\n")
 
         
     def to_cal3d_binary(self, file):
-        s = b'CMF\0'
-        ar = array('b', list(s))
-        ar.tofile(file)
-
         # Etory : downgrade version to 700 for Cal3D 0.11 compatibility
-        #ar = array('L', [1200])
-        ar = array('I', [700])
-        ar.tofile(file)
-        
-        ar = array('I', [len(self.submeshes)])
-        ar.tofile(file)
+        file.write(BINARY_HEADER.pack(b'CMF\0', 700) + BINARY_UINT.pack(len(self.submeshes)))
         
         for sm in self.submeshes:
             sm.to_cal3d_binary(file)
 
+    def add_submesh(self, submesh):
+        self.submeshes.append(submesh)
+        self.submesh_by_material.setdefault(submesh.mesh_material_id, submesh)
+
     # jgb 2012-11-04 Get the submesh that has the requested material index assigned to it
     # jgb 2012-11-05 Need mesh_material_id to compare to mat which is id relative to mesh
     def get_submesh(self, mat):
-        sm = None
-        for sm in self.submeshes:
-            if sm.mesh_material_id == mat:
-                break
+        sm = self.submesh_by_material.get(mat)
+        # Like the linear search this replaced: without a match we get the last submesh
+        if sm is None and self.submeshes:
+            sm = self.submeshes[-1]
         return sm
@@ -0,0 +1,289 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Level of detail for Cal3d submeshes: a progressive mesh built from edge collapses.
+# Cal3d lowers the detail of a submesh by dropping vertices from the end of its vertex list: every
+# dropped vertex is replaced by its collapse id in the remaining triangles, and the last triangles
+# (face collapse count of the vertex) disappear. So the vertex collapsed first has to be the last
+# vertex, and the triangles its collapse removes the last triangles; NUMLODSTEPS is the number
+# of collapses.
+#
+# The collapses are chosen greedily by the cost of Stan Melax's "A Simple, Fast, and Effective
+# Polygon Reduction Algorithm" (edge length times curvature), with a few restrictions:
+# - vertices on a UV seam, shared with another submesh or with a physique weight never move,
+# - a vertex on the border of the submesh only slides along the border,
+# - the two vertices need about the same skin weights and to be in the same morphs,
+# - a collapse may not change the topology (link condition) or flip a triangle.
+
+from array import array
+from heapq import heappush, heappop
+from math import sqrt
+
+# Added to the curvature so flat areas still collapse their shortest edges first
+FLAT_COST = 0.05
+# Vertices with skin weights further apart than this (half the sum of the weight differences,
+# 0 = same weights, 1 = no bone in common) are not collapsed onto each other
+MAX_SKIN_DISTANCE = 0.5
+
+
+def face_normal(p1, p2, p3):
+    ax, ay, az = p2[0] - p1[0], p2[1] - p1[1], p2[2] - p1[2]
+    bx, by, bz = p3[0] - p1[0], p3[1] - p1[1], p3[2] - p1[2]
+    nx, ny, nz = ay*bz - az*by, az*bx - ax*bz, ax*by - ay*bx
+    length = sqrt(nx*nx + ny*ny + nz*nz)
+    if length == 0.0:
+        return (0.0, 0.0, 0.0)
+    return (nx / length, ny / length, nz / length)
+
+
+def dot(a, b):
+    return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
+
+
+# Difference between the influences of vertex u and v, between 0 (same) and 1 (no bone in common)
+def skin_distance(arrays, u, v):
+    weights = {}
+    for bone_index, weight in arrays.vertex_influences(u):
+        weights[bone_index] = weights.get(bone_index, 0.0) + weight
+    for bone_index, weight in arrays.vertex_influences(v):
+        weights[bone_index] = weights.get(bone_index, 0.0) - weight
+    return sum([abs(weight) for weight in weights.values()]) / 2.0
+
+
+# Blender vertex indices used by more than one vertex of the mesh: vertices split on a UV seam
+# or shared by several submeshes
+def shared_blender_vertices(mesh):
+    seen = set()
+    shared = set()
+    for sm in mesh.submeshes:
+        for blender_index in sm.arrays.blender_indices:
+            if blender_index in seen:
+                shared.add(blender_index)
+            seen.add(blender_index)
+    return shared
+
+
+# The working state of the edge collapses of one submesh
+class EdgeCollapser:
+    def __init__(self, arrays, locked, morph_sets):
+        self.arrays = arrays
+        self.locked = locked
+        self.morph_sets = morph_sets
+        vertex_count = len(arrays)
+        positions = arrays.positions
+        triangles = arrays.triangles
+        self.positions = [(positions[3*i], positions[3*i + 1], positions[3*i + 2]) for i in range(vertex_count)]
+        self.faces = [[triangles[3*f], triangles[3*f + 1], triangles[3*f + 2]] for f in range(len(triangles) // 3)]
+        self.normals = [face_normal(*[self.positions[vertex] for vertex in face]) for face in self.faces]
+        self.vertex_faces = [set() for vertex in range(vertex_count)]
+        for f, face in enumerate(self.faces):
+            # Degenerate triangles are left alone, they are never removed
+            if face[0] != face[1] and face[1] != face[2] and face[0] != face[2]:
+                for vertex in face:
+                    self.vertex_faces[vertex].add(f)
+        self.neighbors = [self.face_neighbors(vertex) for vertex in range(vertex_count)]
+        self.collapsed = bytearray(vertex_count)
+
+
+    def face_neighbors(self, vertex):
+        neighbors = set()
+        for f in self.vertex_faces[vertex]:
+            neighbors.update(self.faces[f])
+        neighbors.discard(vertex)
+        return neighbors
+
+
+    # The neighbors of vertex along edges used by only one triangle, empty unless vertex is on the border
+    def border_neighbors(self, vertex):
+        border = []
+        for neighbor in self.neighbors[vertex]:
+            edge_faces = 0
+            for f in self.vertex_faces[vertex]:
+                if neighbor in self.faces[f]:
+                    edge_faces += 1
+            if edge_faces == 1:
+                border.append(neighbor)
+        return border
+
+
+    # Cost of collapsing vertex u onto its neighbor v, None when the collapse is not allowed.
+    # border is the list of border neighbors of u.
+    def collapse_cost(self, u, v, border):
+        if self.morph_sets[u] != self.morph_sets[v]:
+            return None
+        shared = [f for f in self.vertex_faces[u] if v in self.faces[f]]
+        # Link condition: the common neighbors of u and v must be exactly the third vertices of
+        # the triangles on the edge, otherwise the collapse changes the topology
+        if len(self.neighbors[u] & self.neighbors[v]) != len(shared):
+            return None
+        if border and v not in border:
+            return None
+        skin = skin_distance(self.arrays, u, v)
+        if skin > MAX_SKIN_DISTANCE:
+            return None
+
+        pu = self.positions[u]
+        pv = self.positions[v]
+        curvature = 0.0
+        for f in self.vertex_faces[u]:
+            normal = self.normals[f]
+            if f not in shared:
+                # The triangle may not flip when u moves to v
+                moved = [pv if vertex == u else self.positions[vertex] for vertex in self.faces[f]]
+                if dot(normal, face_normal(*moved)) <= 0.0:
+                    return None
+            curvature = max(curvature, min([(1.0 - dot(normal, self.normals[g])) / 2.0 for g in shared]))
+        length = sqrt((pv[0] - pu[0])**2 + (pv[1] - pu[1])**2 + (pv[2] - pu[2])**2)
+        # On the border the bend between the border edges counts as curvature too, so straight
+        # borders get simpler but corners stay
+        for w in border:
+            if w != v and length > 0.0:
+                pw = self.positions[w]
+                other = sqrt((pw[0] - pu[0])**2 + (pw[1] - pu[1])**2 + (pw[2] - pu[2])**2)
+                if other > 0.0:
+                    bend = ((pv[0] - pu[0])*(pw[0] - pu[0]) + (pv[1] - pu[1])*(pw[1] - pu[1]) +
+                            (pv[2] - pu[2])*(pw[2] - pu[2])) / (length * other)
+                    curvature = max(curvature, (1.0 + bend) / 2.0)
+        return length * (curvature + FLAT_COST) * (1.0 + skin)
+
+
+    # (cost, target) of the cheapest allowed collapse of vertex u, None when there is none
+    def best_collapse(self, u):
+        if self.locked[u] or self.collapsed[u]:
+            return None
+        border = self.border_neighbors(u)
+        best = None
+        for v in sorted(self.neighbors[u]):
+            cost = self.collapse_cost(u, v, border)
+            if cost is not None and (best is None or cost < best[0]):
+                best = (cost, v)
+        return best
+
+
+    # Collapse vertex u onto v, returns the triangles removed by the collapse
+    def collapse(self, u, v):
+        removed = sorted([f for f in self.vertex_faces[u] if v in self.faces[f]])
+        for f in removed:
+            for vertex in self.faces[f]:
+                self.vertex_faces[vertex].discard(f)
+        for f in self.vertex_faces[u]:
+            face = self.faces[f]
+            face[face.index(u)] = v
+            self.normals[f] = face_normal(*[self.positions[vertex] for vertex in face])
+            self.vertex_faces[v].add(f)
+        self.vertex_faces[u] = set()
+        self.collapsed[u] = 1
+
+        changed = self.neighbors[u] | set([v])
+        self.neighbors[u] = set()
+        for vertex in changed:
+            self.neighbors[vertex] = self.face_neighbors(vertex)
+        return removed, changed
+
+
+    # Collapse edges, cheapest first, until no allowed collapse fits in the max_removed triangles
+    # anymore. Returns the list of collapses as (vertex, target, removed triangles).
+    def run(self, max_removed):
+        heap = []
+        # A heap entry is only valid while the version of its vertex is the same
+        versions = [0] * len(self.positions)
+        for u in range(len(self.positions)):
+            best = self.best_collapse(u)
+            if best:
+                heappush(heap, (best[0], u, 0, best[1]))
+
+        steps = []
+        removed_count = 0
+        while heap and removed_count < max_removed:
+            cost, u, version, v = heappop(heap)
+            if version != versions[u] or self.collapsed[u]:
+                continue
+            # The neighborhood of u may have changed since its cost was computed
+            best = self.best_collapse(u)
+            if best is None:
+                continue
+            if best != (cost, v):
+                heappush(heap, (best[0], u, version, best[1]))
+                continue
+            # Never remove more than max_removed triangles, a collapse that removes fewer (on the
+            # border) may still fit
+            if removed_count + len(self.vertex_faces[u] & self.vertex_faces[v]) > max_removed:
+                continue
+
+            removed, changed = self.collapse(u, v)
+            steps.append((u, v, removed))
+            removed_count += len(removed)
+            for vertex in changed:
+                versions[vertex] += 1
+                best = self.best_collapse(vertex)
+                if best:
+                    heappush(heap, (best[0], vertex, versions[vertex], best[1]))
+        return steps
+
+
+# Generate the level of detail of a submesh built with arrays: its vertices and triangles are
+# reordered the way Cal3d needs them and the collapse ids and face collapse counts are filled in.
+# shared is the set from shared_blender_vertices, reduction the maximum fraction of the triangles
+# the collapses may remove. Returns the number of collapses (NUMLODSTEPS) and removed triangles.
+def generate_submesh_lod(submesh, shared, reduction):
+    arrays = submesh.arrays
+    vertex_count = len(arrays)
+    locked = bytearray(vertex_count)
+    for vertex in range(vertex_count):
+        if arrays.blender_indices[vertex] in shared or arrays.has_physique[vertex]:
+            locked[vertex] = 1
+    morph_sets = [[] for vertex in range(vertex_count)]
+    for morph_index, morph in enumerate(submesh.morphs):
+        for blend_vertex in morph.blend_vertices:
+            morph_sets[blend_vertex.index].append(morph_index)
+
+    collapser = EdgeCollapser(arrays, locked, morph_sets)
+    steps = collapser.run(int(arrays.triangle_count() * reduction))
+    if not steps:
+        return 0, 0
+
+    # Vertices that stay first, then the collapsed ones with the one collapsed first last.
+    # The triangles the same way. Both keep their order otherwise (see mesh_optimize).
+    order = [vertex for vertex in range(vertex_count) if not collapser.collapsed[vertex]]
+    order.extend([u for u, v, removed in reversed(steps)])
+    removed_faces = set()
+    for u, v, removed in steps:
+        removed_faces.update(removed)
+    face_order = [f for f in range(arrays.triangle_count()) if f not in removed_faces]
+    for u, v, removed in reversed(steps):
+        face_order.extend(removed)
+
+    # Cal3d follows the collapse ids itself, the triangles keep their original vertices
+    triangles = arrays.triangles
+    reordered = array('i')
+    for f in face_order:
+        reordered.extend(triangles[3*f:3*f + 3])
+    arrays.triangles = reordered
+    remap = arrays.reorder_vertices(order)
+    submesh.remap_vertices(remap)
+
+    arrays.collapse_ids = array('i', [-1]) * vertex_count
+    arrays.face_collapse_counts = array('i', [0]) * vertex_count
+    for u, v, removed in steps:
+        arrays.collapse_ids[remap[u]] = remap[v]
+        arrays.face_collapse_counts[remap[u]] = len(removed)
+    submesh.nb_lodsteps = len(steps)
+    return len(steps), len(removed_faces)
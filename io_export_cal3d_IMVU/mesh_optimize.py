@@ -0,0 +1,177 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Post-transform vertex cache optimization of the triangles of a submesh.
+# The triangles are reordered with Tom Forsyth's "Linear-Speed Vertex Cache Optimisation"
+# (https://tomforsyth1000.github.io/papers/fast_vert_cache_opt.html): every vertex gets a score
+# from its position in a simulated LRU cache and the number of triangles still using it, and
+# each step adds the triangle with the highest score among the triangles of the cached vertices.
+# The vertices are then renumbered in the order the triangles first use them, so the vertex
+# fetches follow the triangles as well.
+#
+# The quality is reported as ACMR (average cache miss ratio): vertices transformed per triangle
+# with a FIFO cache, between 0.5 (best possible) and 3 (no reuse at all).
+
+from array import array
+from collections import deque
+
+# Size of the LRU cache simulated while ordering the triangles
+CACHE_SIZE = 32
+# Scoring constants from the paper
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+# Size of the FIFO cache used to compute the ACMR, typical for the GPUs IMVU runs on
+ACMR_CACHE_SIZE = 16
+
+# Score of a vertex by position in the cache, the 3 vertices of the last triangle get a fixed score
+CACHE_POSITION_SCORE = [LAST_TRIANGLE_SCORE] * 3 + \
+    [(1.0 - (position - 3) / (CACHE_SIZE - 3)) ** CACHE_DECAY_POWER for position in range(3, CACHE_SIZE)]
+
+
+# Score of a vertex at cache_position (-1 when not in the cache) used by remaining triangles
+def vertex_score(cache_position, remaining):
+    if remaining == 0:
+        # No triangle uses this vertex anymore
+        return -1.0
+    score = 0.0
+    if cache_position >= 0:
+        score = CACHE_POSITION_SCORE[cache_position]
+    # Boost vertices with few triangles left, to finish them off and avoid isolated triangles
+    return score + VALENCE_BOOST_SCALE * remaining ** -VALENCE_BOOST_POWER
+
+
+# Average cache miss ratio of triangles (a flat sequence of vertex indices, 3 per triangle)
+def average_cache_miss_ratio(triangles, cache_size=ACMR_CACHE_SIZE):
+    triangle_count = len(triangles) // 3
+    if triangle_count == 0:
+        return 0.0
+    fifo = deque()
+    cached = set()
+    misses = 0
+    for vertex in triangles:
+        if vertex not in cached:
+            misses += 1
+            fifo.append(vertex)
+            cached.add(vertex)
+            if len(fifo) > cache_size:
+                cached.discard(fifo.popleft())
+    return misses / triangle_count
+
+
+# Returns triangles (a flat sequence of vertex indices below vertex_count) reordered for the
+# vertex cache, as an array of vertex indices. The corners of each triangle keep their order.
+def optimize_triangle_order(triangles, vertex_count):
+    triangle_count = len(triangles) // 3
+    # Triangles of each vertex that are not added yet
+    vertex_triangles = [[] for vertex in range(vertex_count)]
+    for triangle in range(triangle_count):
+        for vertex in triangles[3*triangle:3*triangle + 3]:
+            vertex_triangles[vertex].append(triangle)
+
+    cache_position = [-1] * vertex_count
+    scores = [vertex_score(-1, len(vertex_triangles[vertex])) for vertex in range(vertex_count)]
+    triangle_scores = [scores[triangles[3*triangle]] + scores[triangles[3*triangle + 1]] +
+                       scores[triangles[3*triangle + 2]] for triangle in range(triangle_count)]
+    added = bytearray(triangle_count)
+
+    order = array('i')
+    cache = []
+    best_triangle = -1
+    if triangle_count > 0:
+        best_triangle = max(range(triangle_count), key=triangle_scores.__getitem__)
+    # When none of the cached vertices has triangles left (the end of a connected part of the
+    # mesh) we continue with the first triangle not added yet
+    next_unadded = 0
+    for step in range(triangle_count):
+        if best_triangle < 0:
+            while added[next_unadded]:
+                next_unadded += 1
+            best_triangle = next_unadded
+        triangle = best_triangle
+        added[triangle] = 1
+        corners = triangles[3*triangle:3*triangle + 3]
+        order.extend(corners)
+
+        # The vertices of the new triangle move to the front of the cache
+        new_cache = []
+        for vertex in corners:
+            vertex_triangles[vertex].remove(triangle)
+            if vertex not in new_cache:
+                new_cache.append(vertex)
+        new_cache.extend([vertex for vertex in cache if vertex not in corners])
+
+        # Update the scores of the vertices whose cache position or remaining triangles changed,
+        # the vertices pushed out of the cache included
+        for position, vertex in enumerate(new_cache):
+            if position >= CACHE_SIZE:
+                position = -1
+            cache_position[vertex] = position
+            score = vertex_score(position, len(vertex_triangles[vertex]))
+            delta = score - scores[vertex]
+            if delta != 0.0:
+                scores[vertex] = score
+                for other in vertex_triangles[vertex]:
+                    triangle_scores[other] += delta
+        cache = new_cache[:CACHE_SIZE]
+
+        # Continue with the best triangle that uses a cached vertex
+        best_triangle = -1
+        best_score = -1.0
+        for vertex in cache:
+            for other in vertex_triangles[vertex]:
+                if triangle_scores[other] > best_score:
+                    best_triangle = other
+                    best_score = triangle_scores[other]
+    return order
+
+
+# Vertex order that numbers the vertices in the order triangles first use them, as a list of
+# old vertex indices. Vertices not used by any triangle keep their relative order at the end.
+def first_use_vertex_order(triangles, vertex_count):
+    used = bytearray(vertex_count)
+    order = []
+    for vertex in triangles:
+        if not used[vertex]:
+            used[vertex] = 1
+            order.append(vertex)
+    order.extend([vertex for vertex in range(vertex_count) if not used[vertex]])
+    return order
+
+
+# Optimize the triangle and vertex order of a SubMeshArrays in place.
+# Returns (remap, ACMR before, ACMR after), remap maps old vertex indices to new ones.
+def optimize_vertex_cache(arrays):
+    acmr_before = average_cache_miss_ratio(arrays.triangles)
+    arrays.triangles = optimize_triangle_order(arrays.triangles, len(arrays))
+    remap = arrays.reorder_vertices(first_use_vertex_order(arrays.triangles, len(arrays)))
+    acmr_after = average_cache_miss_ratio(arrays.triangles)
+    return remap, acmr_before, acmr_after
+
+
+# Optimize the vertex cache order of a submesh built with arrays, the blend vertices of its
+# morphs are renumbered to match. Returns (ACMR before, ACMR after).
+def optimize_submesh_vertex_cache(submesh):
+    remap, acmr_before, acmr_after = optimize_vertex_cache(submesh.arrays)
+    submesh.remap_vertices(remap)
+    return acmr_before, acmr_after
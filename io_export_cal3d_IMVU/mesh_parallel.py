@@ -0,0 +1,140 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Format the vertices of a submesh as XML in worker processes.
+# The parent copies the vertex arrays of a submesh (see SubMeshArrays in mesh_classes) into
+# shared memory blocks. The workers read them without copying and each format a chunk of
+# vertices, the parent then writes the chunks in order. The text is produced by the same
+# format_vertices_xml function as the serial path uses, so the output is exactly the same.
+#
+# Requires Python 3.8+ (multiprocessing.shared_memory) and the fork start method: under spawn
+# the workers would have to import this package, which imports bpy. When either is missing
+# create_vertex_formatter returns None and the mesh is written serially.
+# Note that the Blender versions this exporter supports (2.63 - 2.79) bundle Python 3.2 - 3.5,
+# so there this is never available: it is for running the exporter with a newer Python, like
+# with the bpy stand-in. The export option is hidden when it's not available.
+
+import multiprocessing
+from array import array
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+from .mesh_classes import SubMeshArrays, format_vertices_xml, write_vertices_xml
+
+# The arrays format_vertices_xml needs, the level of detail arrays only when the submesh has them
+SHARED_ARRAYS = ("positions", "normals", "colors", "uvs",
+                 "influence_offsets", "influence_bones", "influence_weights",
+                 "physique", "has_physique", "collapse_ids", "face_collapse_counts")
+
+# Submeshes with less vertices than this are not worth sending to the workers
+MIN_PARALLEL_VERTICES = 2000
+
+
+# Copy an array into a new shared memory block
+def create_shared_array(data):
+    size = len(data) * data.itemsize
+    # A shared memory block can't be empty
+    shm = shared_memory.SharedMemory(create=True, size=max(size, data.itemsize))
+    shm.buf[:size] = data.tobytes()
+    return shm
+
+
+# Worker: format the vertices start to stop (not included) of the shared submesh arrays.
+# blocks is a list of (array name, shared memory name, typecode, length).
+def format_vertex_chunk(args):
+    map_count, blocks, start, stop = args
+
+    shms = []
+    views = []
+    arrays = SubMeshArrays(map_count)
+    try:
+        for name, shm_name, typecode, length in blocks:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            shms.append(shm)
+            view = shm.buf[:length * array(typecode).itemsize].cast(typecode)
+            views.append(view)
+            setattr(arrays, name, view)
+        return format_vertices_xml(arrays, start, stop)
+    finally:
+        # All views on the buffers need to be released before the blocks can be closed
+        del arrays
+        for view in views:
+            view.release()
+        for shm in shms:
+            shm.close()
+
+
+# Callable that can be passed as format_vertices to Mesh.write_cal3d_xml
+class ParallelVertexFormatter:
+    def __init__(self, processes):
+        self.processes = processes
+        # Start the resource tracker before forking, so the workers share it with us and the
+        # shared memory blocks are only tracked (and cleaned up) once
+        resource_tracker.ensure_running()
+        self.pool = multiprocessing.get_context("fork").Pool(processes)
+
+
+    def __call__(self, arrays, file):
+        vertex_count = len(arrays)
+        if vertex_count < MIN_PARALLEL_VERTICES:
+            write_vertices_xml(arrays, file)
+            return
+
+        shms = []
+        try:
+            blocks = []
+            for name in SHARED_ARRAYS:
+                data = getattr(arrays, name)
+                if data is None:
+                    continue
+                shm = create_shared_array(data)
+                shms.append(shm)
+                blocks.append((name, shm.name, data.typecode, len(data)))
+            chunk_size = max(vertex_count // (self.processes * 4), 1)
+            chunks = [(arrays.map_count, blocks, start, min(start + chunk_size, vertex_count))
+                      for start in range(0, vertex_count, chunk_size)]
+            # imap returns the chunks in order, write each one as soon as it is ready
+            for chunk in self.pool.imap(format_vertex_chunk, chunks):
+                file.write(chunk)
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+# True when vertices can be formatted in worker processes with this Python and platform
+def parallel_writing_available():
+    return shared_memory is not None and "fork" in multiprocessing.get_all_start_methods()
+
+
+# Returns a ParallelVertexFormatter using processes workers, or None when we should write serially
+def create_vertex_formatter(processes):
+    if processes < 2 or not parallel_writing_available():
+        return None
+    return ParallelVertexFormatter(processes)
@@ -0,0 +1,105 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Profiling of the export with cProfile, switched on with the hidden profile_phases
+# property of the operator (or --profile of batch_export.py).
+# profile_phases is "all" for the whole export, or a comma separated list of the phases
+# of Logger.span to profile only those: skeleton, materials, mesh, shape_keys, animation,
+# morph_animation and write.
+
+import cProfile
+import pstats
+
+# Phases that can be profiled on their own, these are the phases of the Logger spans
+PROFILE_PHASES = ("skeleton", "materials", "mesh", "shape_keys", "animation", "morph_animation", "write")
+
+# Number of functions in the text summary
+SUMMARY_LIMIT = 40
+
+
+# Turn the profile_phases text into a set of phase names, raises ValueError for unknown phases
+def parse_profile_phases(text):
+    phases = set(phase.strip() for phase in text.split(",") if phase.strip())
+    if "all" in phases:
+        return set(["all"])
+    unknown = phases.difference(PROFILE_PHASES)
+    if unknown:
+        raise ValueError("Unknown profile phase(s) {0}, use all or some of: {1}".format(
+            ", ".join(sorted(unknown)), ", ".join(PROFILE_PHASES)))
+    return phases
+
+
+class ExportProfiler:
+    def __init__(self, phases):
+        self.phases = phases
+        self.profile = cProfile.Profile()
+        # Spans can be nested (shape_keys inside mesh), only the outermost one switches the profiler
+        self.depth = 0
+        self.used = False
+
+
+    def profiles_all(self):
+        return "all" in self.phases
+
+
+    # Called when a span starts, profiles it when its phase was asked for
+    def start_phase(self, phase):
+        if self.depth > 0:
+            self.depth += 1
+        elif phase in self.phases:
+            self.depth = 1
+            self.used = True
+            self.profile.enable()
+
+
+    def stop_phase(self, phase):
+        if self.depth > 0:
+            self.depth -= 1
+            if self.depth == 0:
+                self.profile.disable()
+
+
+    # Profile everything from now until stop_all
+    def start_all(self):
+        self.depth = 1
+        self.used = True
+        self.profile.enable()
+
+
+    def stop_all(self):
+        if self.depth > 0:
+            self.depth = 0
+            self.profile.disable()
+
+
+    # Write the profile data (for pstats, snakeviz and the like) and a text summary
+    # of the functions with the highest cumulative time.
+    # Returns False when nothing was profiled (none of the phases happened).
+    def write(self, pstats_filepath, summary_filepath):
+        self.stop_all()
+        if not self.used:
+            return False
+        self.profile.dump_stats(pstats_filepath)
+        with open(summary_filepath, "wt") as summary_file:
+            summary_file.write("Profiled phases: {0}\n\n".format(", ".join(sorted(self.phases))))
+            stats = pstats.Stats(self.profile, stream=summary_file)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(SUMMARY_LIMIT)
+        return True
@@ -0,0 +1,275 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Checks of the invariants of the skin weight, vertex cache, level of detail and keyframe
+# reduction code:
+#
+#   python -m pytest tests
+#   python -m unittest discover tests
+#
+# Runs without Blender, with the bpy stand-in.
+
+import os
+import random
+import sys
+import unittest
+from array import array
+from collections import Counter
+from math import cos, pi, sin, sqrt
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+try:
+    import bpy
+except ImportError:
+    sys.path.insert(0, os.path.join(REPO_DIR, "bpy_standin"))
+
+from io_export_cal3d_IMVU.action_classes import KeyFrame, reduce_keyframes, slerp
+from io_export_cal3d_IMVU.mesh_classes import BlendVertex, Morph, SubMesh, SubMeshArrays, normalize_influences
+from io_export_cal3d_IMVU.mesh_lod import generate_submesh_lod
+from io_export_cal3d_IMVU.mesh_optimize import (average_cache_miss_ratio, optimize_submesh_vertex_cache,
+                                                optimize_triangle_order)
+
+
+def random_influences(rnd, count):
+    bones = rnd.sample(range(50), count)
+    return [(bone, rnd.uniform(0.01, 1.0)) for bone in bones]
+
+
+class InfluenceTest(unittest.TestCase):
+    def check_influences(self, original, influences, max_influences):
+        self.assertAlmostEqual(sum(weight for bone, weight in influences), 1.0, places=9)
+        if max_influences > 0:
+            self.assertLessEqual(len(influences), max_influences)
+        else:
+            self.assertEqual(len(influences), len(original))
+        weights = [weight for bone, weight in influences]
+        self.assertEqual(weights, sorted(weights, reverse=True))
+        # The heaviest influences are the ones that are kept
+        heaviest = sorted(original, key=lambda influence: influence[1], reverse=True)[:len(influences)]
+        self.assertEqual([bone for bone, weight in influences], [bone for bone, weight in heaviest])
+
+    def test_normalize_influences(self):
+        rnd = random.Random(1)
+        for max_influences in (0, 1, 2, 4):
+            for count in range(1, 8):
+                original = random_influences(rnd, count)
+                self.check_influences(original, normalize_influences(original, max_influences), max_influences)
+
+    def test_submesh_arrays(self):
+        rnd = random.Random(2)
+        for max_influences in (0, 4):
+            arrays = SubMeshArrays(1, max_influences)
+            originals = []
+            for i in range(40):
+                original = random_influences(rnd, rnd.randint(1, 7))
+                originals.append(original)
+                arrays.add_vertex(i, (i, 0.0, 0.0), (0.0, 0.0, 1.0), (1.0, 1.0, 1.0), [(0.0, 0.0)], original)
+            for i, original in enumerate(originals):
+                self.check_influences(original, arrays.vertex_influences(i), max_influences)
+
+            # Reordering moves the influences along with their vertex
+            order = list(range(len(arrays)))
+            rnd.shuffle(order)
+            before = [arrays.vertex_influences(i) for i in range(len(arrays))]
+            remap = arrays.reorder_vertices(order)
+            for old_index, influences in enumerate(before):
+                self.assertEqual(arrays.vertex_influences(remap[old_index]), influences)
+
+
+# A curved grid of size x size vertices, every vertex weighted to the same bone
+def make_grid_submesh(size):
+    submesh = SubMesh(None, 0, 0, 0)
+    arrays = SubMeshArrays(1)
+    for y in range(size):
+        for x in range(size):
+            z = 0.3 * sin(x * 0.7) * cos(y * 0.5)
+            arrays.add_vertex(y * size + x, (float(x), float(y), z), (0.0, 0.0, 1.0), (1.0, 1.0, 1.0),
+                              [(x / size, y / size)], [(0, 1.0)])
+    for y in range(size - 1):
+        for x in range(size - 1):
+            v = y * size + x
+            arrays.add_face(v, v + 1, v + size + 1, v + size)
+    submesh.arrays = arrays
+    return submesh
+
+
+class VertexCacheTest(unittest.TestCase):
+    def triangle_list(self, triangles):
+        return [tuple(triangles[3*t:3*t + 3]) for t in range(len(triangles) // 3)]
+
+    def test_permutation_of_triangles(self):
+        submesh = make_grid_submesh(10)
+        rnd = random.Random(4)
+        triangles = self.triangle_list(submesh.arrays.triangles)
+        rnd.shuffle(triangles)
+        flat = [vertex for triangle in triangles for vertex in triangle]
+        ordered = optimize_triangle_order(flat, len(submesh.arrays))
+        # The same triangles, each with its corners in the same order (no rotation either)
+        self.assertEqual(Counter(self.triangle_list(ordered)), Counter(triangles))
+
+    def test_acmr_on_grid(self):
+        submesh = make_grid_submesh(30)
+        triangles = submesh.arrays.triangles
+        ordered = optimize_triangle_order(triangles, len(submesh.arrays))
+        self.assertLessEqual(average_cache_miss_ratio(ordered), average_cache_miss_ratio(triangles))
+
+        shuffled = self.triangle_list(triangles)
+        random.Random(5).shuffle(shuffled)
+        shuffled = [vertex for triangle in shuffled for vertex in triangle]
+        ordered = optimize_triangle_order(shuffled, len(submesh.arrays))
+        self.assertLess(average_cache_miss_ratio(ordered), average_cache_miss_ratio(shuffled))
+
+    def test_blend_vertices_follow_remap(self):
+        submesh = make_grid_submesh(12)
+        arrays = submesh.arrays
+        rnd = random.Random(6)
+        # Shuffle the triangles so the optimization really renumbers the vertices
+        triangles = self.triangle_list(arrays.triangles)
+        rnd.shuffle(triangles)
+        arrays.triangles = array('i', [vertex for triangle in triangles for vertex in triangle])
+        for morph_id in range(3):
+            morph = Morph("Morph{0}".format(morph_id), morph_id)
+            for vertex in sorted(rnd.sample(range(len(arrays)), 20)):
+                morph.blend_vertices.append(BlendVertex(vertex, arrays.positions[3*vertex:3*vertex + 3],
+                                                        (0.0, 0.0, 1.0), 0.5))
+            submesh.morphs.append(morph)
+        before = [[(blend_vertex, arrays.blender_indices[blend_vertex.index]) for blend_vertex in morph.blend_vertices]
+                  for morph in submesh.morphs]
+
+        optimize_submesh_vertex_cache(submesh)
+        self.assertNotEqual(list(arrays.blender_indices), list(range(len(arrays))))
+        for morph, blend_vertices in zip(submesh.morphs, before):
+            indices = [blend_vertex.index for blend_vertex in morph.blend_vertices]
+            self.assertEqual(indices, sorted(indices))
+            for blend_vertex, blender_index in blend_vertices:
+                # Still the same vertex, also at the same position as the blend vertex was made from
+                self.assertEqual(arrays.blender_indices[blend_vertex.index], blender_index)
+                self.assertEqual(tuple(arrays.positions[3*blend_vertex.index:3*blend_vertex.index + 3]),
+                                 blend_vertex.loc)
+
+
+class LodTest(unittest.TestCase):
+    def test_collapses(self):
+        submesh = make_grid_submesh(12)
+        arrays = submesh.arrays
+        triangle_count = arrays.triangle_count()
+        steps, removed = generate_submesh_lod(submesh, set(), 0.5)
+        self.assertGreater(steps, 0)
+        self.assertLessEqual(removed, triangle_count // 2)
+        self.assertEqual(arrays.triangle_count(), triangle_count)
+        self.assertEqual(submesh.nb_lodsteps, steps)
+
+        vertex_count = len(arrays)
+        collapse_ids = arrays.collapse_ids
+        # The collapsed vertices are the last ones, each collapses to a vertex before it
+        for vertex in range(vertex_count):
+            if vertex < vertex_count - steps:
+                self.assertEqual(collapse_ids[vertex], -1)
+                self.assertEqual(arrays.face_collapse_counts[vertex], 0)
+            else:
+                self.assertGreaterEqual(collapse_ids[vertex], 0)
+                self.assertLess(collapse_ids[vertex], vertex)
+        self.assertEqual(sum(arrays.face_collapse_counts), removed)
+
+        # Replay the collapses the way Cal3d does: at every level the remaining triangles are
+        # intact and the dropped ones degenerate
+        triangles = [arrays.triangles[3*f:3*f + 3] for f in range(triangle_count)]
+        face_count = triangle_count
+        for level in range(steps + 1):
+            remaining = vertex_count - level
+            if level > 0:
+                face_count -= arrays.face_collapse_counts[remaining]
+
+            def collapse(vertex):
+                while vertex >= remaining:
+                    vertex = collapse_ids[vertex]
+                return vertex
+
+            for f, triangle in enumerate(triangles):
+                distinct = len(set(collapse(vertex) for vertex in triangle))
+                self.assertEqual(distinct == 3, f < face_count)
+
+    def test_locked_vertices(self):
+        submesh = make_grid_submesh(6)
+        shared = set(range(36))
+        self.assertEqual(generate_submesh_lod(submesh, shared, 0.5), (0, 0))
+        self.assertIsNone(submesh.arrays.collapse_ids)
+
+
+def axis_angle_quat(axis, angle):
+    s = sin(angle / 2.0)
+    return (cos(angle / 2.0), axis[0] * s, axis[1] * s, axis[2] * s)
+
+
+class KeyframeReductionTest(unittest.TestCase):
+    def check_reduced(self, keyframes, loc_tolerance, angle_tolerance):
+        kept = reduce_keyframes(keyframes, loc_tolerance, angle_tolerance)
+        self.assertIs(kept[0], keyframes[0])
+        self.assertIs(kept[-1], keyframes[-1])
+        # Every dropped keyframe is restored by interpolating the kept ones around it
+        min_cos = cos(angle_tolerance / 2.0) - 1e-12
+        k = 0
+        for keyframe in keyframes:
+            while kept[k + 1].time < keyframe.time:
+                k += 1
+            keyframe1 = kept[k]
+            keyframe2 = kept[k + 1]
+            factor = (keyframe.time - keyframe1.time) / (keyframe2.time - keyframe1.time)
+            loc = [a + factor * (b - a) for a, b in zip(keyframe1.loc, keyframe2.loc)]
+            distance = sqrt(sum((a - b) ** 2 for a, b in zip(loc, keyframe.loc)))
+            self.assertLessEqual(distance, loc_tolerance + 1e-12)
+            quat = slerp(keyframe1.quat, keyframe2.quat, factor)
+            self.assertGreaterEqual(abs(sum(a * b for a, b in zip(quat, keyframe.quat))), min_cos)
+        return kept
+
+    def test_linear_track(self):
+        axis = (0.0, 0.0, 1.0)
+        keyframes = [KeyFrame(i / 30.0, (i * 0.1, 0.0, 2.0), axis_angle_quat(axis, i * 0.02)) for i in range(61)]
+        kept = self.check_reduced(keyframes, 0.001, 0.001)
+        self.assertEqual(len(kept), 2)
+
+    def test_noisy_track(self):
+        rnd = random.Random(3)
+        axis = (0.0, 0.6, 0.8)
+        for loc_tolerance, angle_tolerance in ((0.001, 0.001), (0.01, pi / 180.0), (0.1, 0.1)):
+            keyframes = []
+            for i in range(200):
+                time = i / 30.0
+                loc = (sin(time), 0.5 * cos(2.0 * time), rnd.gauss(0.0, 0.01))
+                quat = axis_angle_quat(axis, sin(time) + rnd.gauss(0.0, 0.005))
+                # q and -q are the same rotation, the reduction must handle both
+                if rnd.random() < 0.2:
+                    quat = tuple(-c for c in quat)
+                keyframes.append(KeyFrame(time, loc, quat))
+            kept = self.check_reduced(keyframes, loc_tolerance, angle_tolerance)
+            if loc_tolerance > 0.05:
+                self.assertLess(len(kept), len(keyframes) // 2)
+
+    def test_short_track(self):
+        keyframes = [KeyFrame(0.0, (0.0, 0.0, 0.0), (1.0, 0.0, 0.0, 0.0)),
+                     KeyFrame(1.0, (1.0, 0.0, 0.0), (1.0, 0.0, 0.0, 0.0))]
+        self.assertEqual(reduce_keyframes(keyframes, 0.01, 0.01), keyframes)
+
+
+if __name__ == "__main__":
+    unittest.main()
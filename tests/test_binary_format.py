@@ -0,0 +1,266 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Round trip checks of the binary Cal3d files (CMF meshes, CSF skeletons, CAF animations): the
+# files are read back with struct.unpack following the layouts of the Cal3d file format
+# (little-endian, 32 bit integers and floats) and compared with the data they were written from.
+# Runs without Blender, with the bpy stand-in.
+
+import io
+import os
+import struct
+import sys
+import unittest
+from array import array
+from math import cos, sin
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+try:
+    import bpy
+except ImportError:
+    sys.path.insert(0, os.path.join(REPO_DIR, "bpy_standin"))
+
+from io_export_cal3d_IMVU.action_classes import Animation, KeyFrame, Track
+from io_export_cal3d_IMVU.armature_classes import Bone, Skeleton
+from io_export_cal3d_IMVU.mesh_classes import Face, Influence, Map, Mesh, SubMesh, SubMeshArrays, Vertex, \
+    pack_submesh
+
+
+# Sequential struct.unpack over the bytes of a file
+class Reader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, layout):
+        values = struct.unpack_from("<" + layout, self.data, self.offset)
+        self.offset += struct.calcsize("<" + layout)
+        return values
+
+    def at_end(self):
+        return self.offset == len(self.data)
+
+
+# The value a float has after a round trip through a 32 bit float
+def f32(value):
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+def f32_tuple(values):
+    return tuple(f32(value) for value in values)
+
+
+# Read a CMF file into a list of submeshes: dicts with the header, the vertices as
+# (position, normal, collapse id, face collapse count, maps, influences) and the triangles
+def read_cmf(data):
+    reader = Reader(data)
+    magic, version, submesh_count = reader.read("4sII")
+    assert magic == b'CMF\0' and version == 700
+    submeshes = []
+    for s in range(submesh_count):
+        material, vertex_count, face_count, lod_count, spring_count, map_count = reader.read("6i")
+        vertices = []
+        for v in range(vertex_count):
+            position = reader.read("3f")
+            normal = reader.read("3f")
+            collapse_id, face_collapse_count = reader.read("2i")
+            maps = [reader.read("2f") for m in range(map_count)]
+            influence_count, = reader.read("I")
+            influences = [reader.read("If") for i in range(influence_count)]
+            vertices.append((position, normal, collapse_id, face_collapse_count, maps, influences))
+        springs = [reader.read("2I2f") for s in range(spring_count)]
+        triangles = [reader.read("3I") for f in range(face_count)]
+        submeshes.append({"material": material, "lod_count": lod_count, "vertices": vertices,
+                          "springs": springs, "triangles": triangles})
+    assert reader.at_end()
+    return submeshes
+
+
+# Read a CSF file into a list of bones: (name, translation, rotation, local translation,
+# local rotation, parent id, child ids), rotations as (x, y, z, w)
+def read_csf(data):
+    reader = Reader(data)
+    magic, version, bone_count = reader.read("4sII")
+    assert magic == b'CSF\0' and version == 700
+    bones = []
+    for b in range(bone_count):
+        name_length, = reader.read("I")
+        name, = reader.read("{0}s".format(name_length))
+        assert name.endswith(b'\0')
+        translation = reader.read("3f")
+        rotation = reader.read("4f")
+        local_translation = reader.read("3f")
+        local_rotation = reader.read("4f")
+        parent_id, child_count = reader.read("iI")
+        children = [reader.read("I")[0] for c in range(child_count)]
+        bones.append((name[:-1].decode("utf8"), translation, rotation, local_translation, local_rotation,
+                      parent_id, children))
+    assert reader.at_end()
+    return bones
+
+
+# Read a CAF file into (duration, tracks), tracks as (bone id, [(time, translation, rotation)])
+# with rotations as (x, y, z, w)
+def read_caf(data):
+    reader = Reader(data)
+    magic, version, unknown, duration, track_count, flags = reader.read("4sIIfII")
+    assert magic == b'CAF\0' and version == 700 and flags == 0
+    tracks = []
+    for t in range(track_count):
+        bone_id, keyframe_count = reader.read("2I")
+        keyframes = []
+        for k in range(keyframe_count):
+            time, = reader.read("f")
+            keyframes.append((time, reader.read("3f"), reader.read("4f")))
+        tracks.append((bone_id, keyframes))
+    assert reader.at_end()
+    return duration, tracks
+
+
+def axis_quat(angle, axis):
+    s = sin(angle / 2.0)
+    return (cos(angle / 2.0), axis[0] * s, axis[1] * s, axis[2] * s)
+
+
+class MeshBinaryTest(unittest.TestCase):
+    def test_arrays(self):
+        mesh = Mesh("Test", 919)
+        expected = []
+        for s in range(2):
+            submesh = SubMesh(mesh, s, 10 + s, s)
+            arrays = SubMeshArrays(2)
+            vertices = []
+            for v in range(6):
+                loc = (v * 0.5, s - v * 0.25, 1.0 / (v + 3))
+                normal = (0.0, 0.6, 0.8)
+                maps = [(v * 0.1, 0.3), (0.7, v * 0.2)]
+                arrays.add_vertex(v, loc, normal, (1.0, 1.0, 1.0), maps, [(v, 0.25), (v + 1, 0.75)])
+                vertices.append((f32_tuple(loc), f32_tuple(normal), [f32_tuple(mp) for mp in maps],
+                                 [(v + 1, 0.75), (v, 0.25)]))
+            arrays.add_face(0, 1, 2, 3)
+            arrays.add_face(3, 4, 5)
+            # Level of detail with the vertex that is never collapsed at -1
+            arrays.collapse_ids = array('i', [-1, -1, -1, -1, 3, 2])
+            arrays.face_collapse_counts = array('i', [0, 0, 0, 0, 1, 0])
+            submesh.nb_lodsteps = 2
+            submesh.arrays = arrays
+            mesh.add_submesh(submesh)
+            expected.append(vertices)
+
+        data = io.BytesIO()
+        mesh.to_cal3d_binary(data)
+        submeshes = read_cmf(data.getvalue())
+
+        self.assertEqual(len(submeshes), 2)
+        for s, submesh in enumerate(submeshes):
+            self.assertEqual(submesh["material"], 10 + s)
+            self.assertEqual(submesh["lod_count"], 2)
+            self.assertEqual(submesh["springs"], [])
+            # Quads are split in (1, 2, 3) and (1, 3, 4)
+            self.assertEqual(submesh["triangles"], [(0, 1, 2), (0, 2, 3), (3, 4, 5)])
+            for v, (vertex, (loc, normal, maps, influences)) in enumerate(zip(submesh["vertices"], expected[s])):
+                position, read_normal, collapse_id, face_collapse_count, read_maps, read_influences = vertex
+                self.assertEqual(position, loc)
+                self.assertEqual(read_normal, normal)
+                self.assertEqual((collapse_id, face_collapse_count), ([-1, -1, -1, -1, 3, 2][v], [0, 0, 0, 0, 1, 0][v]))
+                self.assertEqual(read_maps, maps)
+                self.assertEqual(read_influences, influences)
+
+    # Vertex and Face objects are packed into arrays when written (pack_submesh)
+    def test_objects(self):
+        mesh = Mesh("Test", 919)
+        submesh = SubMesh(mesh, 0, 4, 0)
+        mesh.add_submesh(submesh)
+        for v in range(5):
+            vertex = Vertex(submesh, 100 + v, (v, 2.0 * v, -v), (1.0, 0.0, 0.0), (1.0, 1.0, 1.0))
+            vertex.maps.append(Map(0.25 * v, 0.5))
+            vertex.influences.append(Influence(v % 2, 1.0))
+            submesh.vertices.append(vertex)
+        vertices = submesh.vertices
+        submesh.faces.append(Face(submesh, vertices[0], vertices[1], vertices[2], vertices[3]))
+        submesh.faces.append(Face(submesh, vertices[4], vertices[3], vertices[2], None))
+
+        data = io.BytesIO()
+        mesh.to_cal3d_binary(data)
+        read_submesh, = read_cmf(data.getvalue())
+
+        self.assertEqual(read_submesh["material"], 4)
+        self.assertEqual(read_submesh["triangles"], [(0, 1, 2), (0, 2, 3), (4, 3, 2)])
+        for v, vertex in enumerate(read_submesh["vertices"]):
+            self.assertEqual(vertex, ((v, 2.0 * v, -v), (1.0, 0.0, 0.0), 0, 0, [(0.25 * v, 0.5)], [(v % 2, 1.0)]))
+        arrays = pack_submesh(vertices, submesh.faces)
+        self.assertEqual(list(arrays.blender_indices), [100, 101, 102, 103, 104])
+
+
+class SkeletonBinaryTest(unittest.TestCase):
+    def test_bones(self):
+        identity = ((1.0, 0.0, 0.0, 0.0), (0.0, 1.0, 0.0, 0.0), (0.0, 0.0, 1.0, 0.0), (0.0, 0.0, 0.0, 1.0))
+        skeleton = Skeleton("Test", identity, (1.0, 1.0, 1.0), 919, False)
+        quats = [axis_quat(0.3 * (b + 1), (0.0, 0.6, 0.8)) for b in range(3)]
+        root = Bone(skeleton, None, "Root", (0.0, 0.0, 1.0), quats[0], (0.0, 0.0, -1.0), quats[1], {})
+        Bone(skeleton, root, "Arm.L", (1.0, 0.0, 0.0), quats[1], (-1.0, 0.0, -1.0), quats[2], {})
+        Bone(skeleton, root, "Arm.R", (-1.0, 0.0, 0.0), quats[2], (1.0, 0.0, -1.0), quats[0], {})
+
+        data = io.BytesIO()
+        skeleton.to_cal3d_binary(data)
+        bones = read_csf(data.getvalue())
+
+        self.assertEqual([bone[0] for bone in bones], ["Root", "Arm.L", "Arm.R"])
+        self.assertEqual([(bone[5], bone[6]) for bone in bones], [(-1, [1, 2]), (0, []), (0, [])])
+        for bone, source in zip(bones, skeleton.bones):
+            self.assertEqual(bone[1], f32_tuple(source.loc))
+            self.assertEqual(bone[3], f32_tuple(source.lloc))
+            # Rotations are written as (x, y, z, -w), like the xml
+            for read_rotation, quat in ((bone[2], source.quat), (bone[4], source.lquat)):
+                for read, value in zip(read_rotation, (quat[1], quat[2], quat[3], -quat[0])):
+                    self.assertAlmostEqual(read, value, places=6)
+
+
+class AnimationBinaryTest(unittest.TestCase):
+    def test_tracks(self):
+        animation = Animation("Test", 919)
+        animation.duration = 1.5
+        for bone_index in (2, 0):
+            track = Track(bone_index)
+            for k in range(4):
+                track.keyframes.append(KeyFrame(k * 0.5, (k, bone_index, 0.125 * k),
+                                                axis_quat(0.2 * k + bone_index, (1.0, 0.0, 0.0))))
+            animation.tracks.append(track)
+
+        data = io.BytesIO()
+        animation.to_cal3d_binary(data)
+        duration, tracks = read_caf(data.getvalue())
+
+        self.assertEqual(duration, 1.5)
+        self.assertEqual([track[0] for track in tracks], [2, 0])
+        for (bone_id, keyframes), track in zip(tracks, animation.tracks):
+            self.assertEqual(len(keyframes), len(track.keyframes))
+            for (time, translation, rotation), keyframe in zip(keyframes, track.keyframes):
+                self.assertEqual(time, f32(keyframe.time))
+                self.assertEqual(translation, f32_tuple(keyframe.loc))
+                quat = keyframe.quat
+                self.assertEqual(rotation, f32_tuple((quat[1], quat[2], quat[3], -quat[0])))
+
+
+if __name__ == "__main__":
+    unittest.main()
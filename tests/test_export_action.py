@@ -0,0 +1,125 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Checks of the sampling of bone animations (export_action): the frame grid of baked animations
+# and baked against keyframe-only sampling of an eased curve. Runs without Blender, with the
+# bpy stand-in.
+
+import os
+import sys
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+try:
+    import bpy
+except ImportError:
+    sys.path.insert(0, os.path.join(REPO_DIR, "bpy_standin"))
+    import bpy
+
+from io_export_cal3d_IMVU import logger_class
+from io_export_cal3d_IMVU.armature_classes import Bone, Skeleton
+from io_export_cal3d_IMVU.export_action import create_cal3d_animation, frame_grid, sample_fcurve
+
+FPS = 30.0
+
+
+# Smoothstep between the first and last keyframe of fcurve, like an ease in/out curve
+def eased(fcurve, frame):
+    (frame1, value1), (frame2, value2) = [keyframe.co for keyframe in (fcurve.keyframe_points[0],
+                                                                       fcurve.keyframe_points[-1])]
+    t = min(max((frame - frame1) / (frame2 - frame1), 0.0), 1.0)
+    return value1 + (value2 - value1) * t * t * (3.0 - 2.0 * t)
+
+
+class FrameGridTest(unittest.TestCase):
+    def test_whole_frames(self):
+        self.assertEqual(frame_grid(1.0, 5.0), [1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(frame_grid(3.0, 3.0), [3.0])
+
+    def test_fractional_last_frame(self):
+        frames = frame_grid(1.0, 10.5)
+        self.assertEqual(frames[0], 1.0)
+        self.assertEqual(frames[-1], 10.5)
+        self.assertEqual(frames[:-1], [1.0 + i for i in range(10)])
+
+        # The last frame isn't added twice when it is on the grid
+        frames = frame_grid(1.25, 4.25)
+        self.assertEqual(frames, [1.25, 2.25, 3.25, 4.25])
+        frames = frame_grid(0.5, 2.75)
+        self.assertEqual(frames, [0.5, 1.5, 2.5, 2.75])
+
+    def test_sample_without_fcurve(self):
+        self.assertEqual(list(sample_fcurve(None, [1.0, 2.0, 3.5], 1.0)), [1.0, 1.0, 1.0])
+
+
+class BakeTest(unittest.TestCase):
+    def setUp(self):
+        bpy.reset()
+        logger_class.LogMessage = logger_class.Logger("test")
+        identity = ((1.0, 0.0, 0.0, 0.0), (0.0, 1.0, 0.0, 0.0), (0.0, 0.0, 1.0, 0.0), (0.0, 0.0, 0.0, 1.0))
+        self.skeleton = Skeleton("Test", identity, (1.0, 1.0, 1.0), 919, False)
+        Bone(self.skeleton, None, "Bone", (0.0, 0.0, 0.0), (1.0, 0.0, 0.0, 0.0),
+             (0.0, 0.0, 0.0), (1.0, 0.0, 0.0, 0.0), {})
+
+    def tearDown(self):
+        logger_class.LogMessage = None
+
+    # Action that moves the bone from x = 0 to x = 1 between first_frame and last_frame, eased
+    def make_action(self, first_frame, last_frame):
+        action = bpy.data.actions.new("Move")
+        fcurve = action.fcurves.new('pose.bones["Bone"].location', 0, "Bone")
+        fcurve.keyframe_points.insert(first_frame, 0.0)
+        fcurve.keyframe_points.insert(last_frame, 1.0)
+        # The stand-in interpolates linearly, Blender would ease with Bezier keyframes
+        fcurve.evaluate = lambda frame: eased(fcurve, frame)
+        return action, fcurve
+
+    def test_baked_follows_eased_curve(self):
+        action, fcurve = self.make_action(1.0, 11.0)
+
+        keyframes = create_cal3d_animation(self.skeleton, action, FPS, 919).tracks[0].keyframes
+        self.assertEqual([keyframe.time for keyframe in keyframes], [0.0, 10.0 / FPS])
+        # Cal3d interpolates linearly between the two keyframes, far from the eased curve
+        linear = keyframes[0].loc[0] + (keyframes[1].loc[0] - keyframes[0].loc[0]) * 0.2
+        self.assertGreater(abs(linear - eased(fcurve, 3.0)), 0.05)
+
+        keyframes = create_cal3d_animation(self.skeleton, action, FPS, 919, bake=True).tracks[0].keyframes
+        self.assertEqual(len(keyframes), 11)
+        for frame, keyframe in zip(range(1, 12), keyframes):
+            self.assertAlmostEqual(keyframe.time, (frame - 1.0) / FPS)
+            self.assertAlmostEqual(keyframe.loc[0], eased(fcurve, frame))
+
+    def test_baked_fractional_last_frame(self):
+        action, fcurve = self.make_action(1.0, 8.5)
+        animation = create_cal3d_animation(self.skeleton, action, FPS, 919, bake=True)
+        keyframes = animation.tracks[0].keyframes
+        self.assertAlmostEqual(animation.duration, 7.5 / FPS)
+        self.assertEqual(keyframes[0].time, 0.0)
+        self.assertAlmostEqual(keyframes[-1].time, 7.5 / FPS)
+        self.assertAlmostEqual(keyframes[-1].loc[0], 1.0)
+        self.assertAlmostEqual(keyframes[-2].time, 7.0 / FPS)
+        self.assertEqual(len(keyframes), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
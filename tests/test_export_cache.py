@@ -0,0 +1,144 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Checks of the incremental export (export_cache): unchanged files are skipped, edited data and
+# changed export options are written again. Runs without Blender, with the bpy stand-in.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+try:
+    import bpy
+except ImportError:
+    sys.path.insert(0, os.path.join(REPO_DIR, "bpy_standin"))
+    import bpy
+
+from mathutils import Matrix
+
+import io_export_cal3d_IMVU
+from io_export_cal3d_IMVU.export_cache import hash_action
+
+
+# An armature with two bones, a skinned mesh and a walk action
+def build_scene():
+    bpy.reset()
+    scene = bpy.context.scene
+    scene.world = bpy.data.worlds.new("World")
+    armature = bpy.data.armatures.new("Arm")
+    root = armature.bones.new("Root", None, Matrix.Translation((0, 0, 0)))
+    armature.bones.new("Child", root, Matrix.Translation((0, 0, 1)))
+    armature_obj = bpy.data.objects.new("Skel", armature)
+    scene.objects.link(armature_obj)
+    armature_obj.select = True
+
+    material = bpy.data.materials.new("Skin")
+    slot = material.texture_slots.add()
+    slot.texture.image = bpy.data.images.new("skin", "//skin.png")
+    mesh = bpy.data.meshes.new("Body")
+    vertices = [(x, y, z) for z in range(3) for y in range(2) for x in range(2)]
+    faces = [(0, 1, 5, 4), (1, 3, 7), (1, 7, 5), (4, 5, 9, 8), (5, 7, 11), (5, 11, 9)]
+    mesh.from_pydata(vertices, [], faces)
+    mesh.materials.append(material)
+    mesh.tessface_uv_textures.new("UV")
+    mesh_obj = bpy.data.objects.new("Body", mesh)
+    mesh_obj.vertex_groups.new("Root").add(range(len(vertices)), 0.7, 'REPLACE')
+    mesh_obj.vertex_groups.new("Child").add(range(4, len(vertices)), 0.3, 'REPLACE')
+    scene.objects.link(mesh_obj)
+    mesh_obj.select = True
+
+    action = bpy.data.actions.new("Walk")
+    for i in range(3):
+        fcurve = action.fcurves.new('pose.bones["Child"].location', i, "Child")
+        fcurve.keyframe_points.insert(1, 0.0)
+        fcurve.keyframe_points.insert(11, 1.0)
+    return action
+
+
+class ExportCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.action = build_scene()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Export with the export cache on, returns the log of the export
+    def export(self, **options):
+        operator = io_export_cal3d_IMVU.ExportCal3D()
+        operator.filepath = os.path.join(self.directory, "test.cfg")
+        operator.use_export_cache = True
+        for name, value in options.items():
+            setattr(operator, name, value)
+        self.assertEqual(operator.execute(bpy.context), {'FINISHED'})
+        with open(os.path.join(self.directory, "test.log"), "rt") as log_file:
+            return log_file.read()
+
+    def test_unchanged_scene_is_skipped(self):
+        log = self.export()
+        self.assertIn("Mesh 'test_Body.xmf' with material(s)", log)
+        log = self.export()
+        self.assertIn("Skeleton 'test_Skel.xsf' unchanged, not written", log)
+        self.assertIn("Mesh 'test_Body.xmf' unchanged, not written", log)
+        self.assertIn("Animation 'test_Walk.xaf' unchanged, not written", log)
+
+    def test_edited_keyframe_is_written(self):
+        self.export()
+        self.action.fcurves[2].keyframe_points[1].co[1] = 2.0
+        log = self.export()
+        self.assertIn("Animation 'test_Walk.xaf'\n", log)
+        self.assertNotIn("Animation 'test_Walk.xaf' unchanged", log)
+        self.assertIn("Mesh 'test_Body.xmf' unchanged, not written", log)
+
+    def test_changed_option_is_written(self):
+        self.export()
+        log = self.export(max_influences=1)
+        self.assertIn("Mesh 'test_Body.xmf' with material(s)", log)
+        self.assertNotIn("Mesh 'test_Body.xmf' unchanged", log)
+        self.assertIn("Animation 'test_Walk.xaf' unchanged, not written", log)
+
+    # fcurve.evaluate applies the modifier settings and the keyframe easing, so they are part of the hash
+    def test_action_hash_settings(self):
+        def property_list(*identifiers):
+            return SimpleNamespace(properties=[SimpleNamespace(identifier=identifier, type='FLOAT', is_array=False)
+                                               for identifier in identifiers])
+
+        fcurve = self.action.fcurves[0]
+        noise = SimpleNamespace(type='NOISE', strength=1.0, scale=1.0,
+                                bl_rna=property_list("rna_type", "strength", "scale"))
+        fcurve.modifiers.append(noise)
+        digest = hash_action(self.action, None, ())
+        noise.strength = 2.0
+        self.assertNotEqual(hash_action(self.action, None, ()), digest)
+
+        digest = hash_action(self.action, None, ())
+        fcurve.keyframe_points[0].easing = 'EASE_IN'
+        self.assertNotEqual(hash_action(self.action, None, ()), digest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This file is part of the Blender 2.63+ to Cal3d exporter targeted
+# primarily for IMVU compatibility.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Checks that writing the vertices of a submesh in worker processes gives exactly the same XML
+# as writing them serially. Runs without Blender, with the bpy stand-in.
+
+import io
+import os
+import random
+import sys
+import unittest
+from array import array
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+try:
+    import bpy
+except ImportError:
+    sys.path.insert(0, os.path.join(REPO_DIR, "bpy_standin"))
+
+from io_export_cal3d_IMVU.mesh_classes import SubMeshArrays, write_vertices_xml
+from io_export_cal3d_IMVU.mesh_parallel import (MIN_PARALLEL_VERTICES, create_vertex_formatter,
+                                                parallel_writing_available)
+
+
+# Random vertices with 2 uv layers, 1 to 4 influences and a physique weight on some of them
+def make_arrays(vertex_count, seed):
+    rnd = random.Random(seed)
+    arrays = SubMeshArrays(2, 4)
+    for i in range(vertex_count):
+        influences = [(bone, rnd.uniform(0.1, 1.0)) for bone in rnd.sample(range(30), rnd.randint(1, 4))]
+        physique = rnd.random() if rnd.random() < 0.1 else None
+        arrays.add_vertex(i, [rnd.uniform(-1.0, 1.0) for c in range(3)], [rnd.uniform(-1.0, 1.0) for c in range(3)],
+                          [rnd.random() for c in range(3)], [(rnd.random(), rnd.random()) for m in range(2)],
+                          influences, physique)
+    return arrays
+
+
+@unittest.skipUnless(parallel_writing_available(), "worker processes need Python 3.8+ and fork")
+class ParallelVertexFormatterTest(unittest.TestCase):
+    def setUp(self):
+        self.formatter = create_vertex_formatter(3)
+
+    def tearDown(self):
+        self.formatter.close()
+
+    def check_same(self, arrays):
+        serial = io.StringIO()
+        write_vertices_xml(arrays, serial)
+        parallel = io.StringIO()
+        self.formatter(arrays, parallel)
+        self.assertEqual(parallel.getvalue(), serial.getvalue())
+
+    def test_same_as_serial(self):
+        self.check_same(make_arrays(MIN_PARALLEL_VERTICES * 2 + 17, 1))
+
+    def test_level_of_detail(self):
+        arrays = make_arrays(MIN_PARALLEL_VERTICES + 500, 2)
+        vertex_count = len(arrays)
+        arrays.collapse_ids = array('i', [-1]) * vertex_count
+        arrays.face_collapse_counts = array('i', [0]) * vertex_count
+        for vertex in range(vertex_count - 300, vertex_count):
+            arrays.collapse_ids[vertex] = vertex - 301
+            arrays.face_collapse_counts[vertex] = 2
+        self.check_same(arrays)
+
+    def test_small_submesh(self):
+        self.check_same(make_arrays(10, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()